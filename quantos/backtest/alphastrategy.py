@@ -277,6 +277,22 @@ class Strategy(with_metaclass(abc.ABCMeta)):
         """
         self.pm.on_trade_ind(ind)
 
+    def on_trade_batch(self, batch):
+        """
+        Called with all trades of a match when orders are matched by a vectorized simulator.
+        Override to process the columns directly, by default each trade is passed to on_trade_ind.
+
+        Parameters
+        ----------
+        batch : TradeBatch
+
+        Returns
+        -------
+
+        """
+        for ind in batch:
+            self.on_trade_ind(ind)
+
     def on_order_status(self, ind):
         """
 
@@ -307,6 +323,10 @@ class AlphaStrategy(Strategy):
     risk_model : model.RiskModel
     revenue_model : model.ReturnModel
     cost_model : model.CostModel
+    market_value_list : list of tuple
+        (trade_date, market value of positions) on each re-balance date.
+    total_value_list : list of tuple
+        (trade_date, market value + cash) on each re-balance date.
 
     Methods
     -------
@@ -335,6 +355,7 @@ class AlphaStrategy(Strategy):
         self.active_pc_method = ""
         
         self.market_value_list = []
+        self.total_value_list = []
 
     def init_from_config(self, props):
         Strategy.init_from_config(self, props)
@@ -569,6 +590,7 @@ class AlphaStrategy(Strategy):
         market_value = self.pm.market_value(self.trade_date, prices, suspensions)
         self.market_value_list.append((self.trade_date, market_value))
         cash_available = self.cash + market_value
+        self.total_value_list.append((self.trade_date, cash_available))
     
         cash_use = cash_available * self.position_ratio
         cash_unuse = cash_available - cash_use
@@ -10,7 +10,9 @@ import pandas as pd
 from matplotlib.ticker import Formatter
 
 from quantos.backtest.analyze.report import Report
+from quantos.backtest.ledger import DailyLedger
 from quantos.data.dataservice import RemoteDataService
+from quantos.data.dataview import DataView
 
 
 # sys.path.append(os.path.abspath(".."))
@@ -38,6 +40,10 @@ class BaseAnalyzer(object):
     _trades : pd.DataFrame
     _configs : dict
     data_api : BaseDataServer
+    dataview : DataView
+        Source of close prices and benchmark if not None, instead of data_api.
+    ledger : DailyLedger or None
+        Daily positions and PnL saved by the backtest in sub-folder 'ledger' of file_folder, if any.
     _universe : set
         All securities that have been traded.
         
@@ -46,6 +52,8 @@ class BaseAnalyzer(object):
         self._trades = None
         self._configs = None
         self.data_api = None
+        self.dataview = None
+        self.ledger = None
         
         self._universe = []
         self._closes = None
@@ -69,21 +77,32 @@ class BaseAnalyzer(object):
     
     @property
     def closes(self):
-        """Read-only attribute, close prices of securities in the universe"""
+        """Read-only attribute, close prices of securities in the universe. Index is trade date, column is symbol."""
         return self._closes
     
-    def initialize(self, data_server_, file_folder='.'):
+    def initialize(self, data_server_=None, file_folder='.', dataview=None):
         """
         Read trades from csv file to DataFrame of given data type.
+        Prices are read from dataview if it is given, else queried from data_server_.
 
         Parameters
         ----------
-        data_server_ : RemoteDataService
+        data_server_ : RemoteDataService, optional
         file_folder : str
             Directory path where trades and configs are stored.
+        dataview : DataView or str, optional
+            DataView used by the backtest, or folder of the saved DataView.
 
         """
+        if data_server_ is None and dataview is None:
+            raise ValueError("Either data_server_ or dataview must be provided.")
+        if dataview is not None and not isinstance(dataview, DataView):
+            folder = dataview
+            dataview = DataView()
+            dataview.load_dataview(folder=folder)
+        
         self.data_api = data_server_
+        self.dataview = dataview
         
         type_map = {'task_id': str,
                     'entrust_no': str,
@@ -101,25 +120,51 @@ class BaseAnalyzer(object):
         self._init_configs(file_folder)
         self._init_trades(trades)
         self._init_symbol_price()
+        self.ledger = DailyLedger.load(os.path.join(abs_path, 'ledger'))
     
     def _init_trades(self, df):
         """Add datetime column. """
         df.loc[:, 'fill_dt'] = df.loc[:, 'fill_date'] + df.loc[:, 'fill_time']
         
-        res = dict()
-        for sec in self.universe:
-            res[sec] = df.loc[df.loc[:, 'symbol'] == sec, :]
-        
-        self._trades = res
+        self._trades = {sec: df_sec for sec, df_sec in df.groupby(by='symbol')}
     
     def _init_symbol_price(self):
-        """Get close price of securities in the universe from data server."""
-        df, err_msg = self.data_api.daily(','.join(self.universe), self.configs['start_date'], self.configs['end_date'],
-                                          fields="close", adjust_mode=self.adjust_mode)
-        dic_sec = self.data_api._group_df_to_dict(df, by='symbol')
-        dic_sec = {sec: df.set_index('trade_date').loc[:, ['close']] for sec, df in dic_sec.viewitems()}
+        """Get close price of securities in the universe from DataView, or from data server if there is no DataView."""
+        symbols = ','.join(sorted(self.universe))
+        start_date, end_date = self.configs['start_date'], self.configs['end_date']
+        if self.dataview is not None:
+            # all symbols at once, from the arrays of DataView
+            df = self.dataview.get_ts('close', symbol=symbols, start_date=start_date, end_date=end_date)
+        else:
+            df, err_msg = self.data_api.daily(symbols, start_date, end_date,
+                                              fields="close", adjust_mode=self.adjust_mode)
+            df = df.pivot(index='trade_date', columns='symbol', values='close')
         
-        self._closes = dic_sec
+        self._closes = df.rename_axis('trade_date').rename_axis('symbol', axis=1)
+    
+    def _get_benchmark_price(self):
+        """
+        Get close price of benchmark from DataView if it is the universe of DataView, else from data server.
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is trade date, the only column is close.
+
+        """
+        benchmark = self.configs['benchmark']
+        start_date, end_date = self.configs['start_date'], self.configs['end_date']
+        dv = self.dataview
+        if dv is not None and dv.data_benchmark is not None and dv.universe == benchmark:
+            df = dv.data_benchmark.loc[start_date: end_date, ['close']]
+        elif self.data_api is not None:
+            df, err_msg = self.data_api.daily(benchmark, start_date, end_date,
+                                              fields='close', adjust_mode=self.adjust_mode)
+            df = df.set_index('trade_date')
+            df.drop(['symbol'], axis=1, inplace=True)
+        else:
+            raise ValueError("Benchmark {:s} is not in DataView and no data server is given.".format(benchmark))
+        return df
     
     def _init_universe(self, securities):
         """Return a set of securities."""
@@ -141,34 +186,77 @@ class AlphaAnalyzer(BaseAnalyzer):
         self.account = None  # OrderedDict
         
     @staticmethod
-    def _get_avg_pos_price(pos_arr, price_arr):
+    def _get_avg_pos_price(pos_arr, price_arr, is_first=None):
         """
         Calculate average cost price using position and fill price.
-        When position = 0, cost price = symbol price.
+        When position = 0, cost price = 0.
+        
+        Average price follows avg[i] = a[i] * avg[i-1] + b[i]: it is updated when position increases,
+        kept when position decreases and reset when position is 0 or a new symbol starts.
+        Between resets, avg[i] = A[i] * sum(b[j] / A[j]) where A is the cumulative product of a.
+        
+        Parameters
+        ----------
+        pos_arr : np.ndarray
+        price_arr : np.ndarray
+        is_first : np.ndarray of bool, optional
+            Whether each row is the first trade of a symbol, when trades of symbols are concatenated.
+            Default is only the first row.
+
+        Returns
+        -------
+        np.ndarray
+
         """
         assert len(pos_arr) == len(price_arr)
         
-        avg_price = np.zeros_like(pos_arr, dtype=float)
-        avg_price[0] = price_arr[0]
-        for i in range(pos_arr.shape[0] - 1):
-            if pos_arr[i+1] == 0:
-                avg_price[i+1] = 0.0
-            else:
-                pos_diff = pos_arr[i+1] - pos_arr[i]
-                if pos_arr[i] == 0 or (pos_diff) * pos_arr[i] > 0:
-                    count = True
-                else:
-                    count = False
-                
-                if count:
-                    avg_price[i+1] = (avg_price[i] * pos_arr[i] + pos_diff * price_arr[i+1]) * 1. / pos_arr[i+1]
-                else:
-                    avg_price[i+1] = avg_price[i]
+        n = len(pos_arr)
+        if n == 0:
+            return np.zeros(0, dtype=float)
+        if is_first is None:
+            is_first = np.zeros(n, dtype=bool)
+            is_first[0] = True
+        
+        pos = pos_arr.astype(float)
+        price = price_arr.astype(float)
+        pos_last = np.empty_like(pos)
+        pos_last[0] = 0.0
+        pos_last[1:] = pos[:-1]
+        pos_last[is_first] = 0.0
+        pos_diff = pos - pos_last
+        
+        count = (pos_last == 0) | (pos_diff * pos_last > 0)
+        reset = is_first | (pos == 0) | (pos_last == 0)
+        
+        # pos is not 0 where count is True and reset is False
+        pos_safe = np.where(pos == 0, 1.0, pos)
+        a = np.where(count & ~reset, pos_last / pos_safe, 1.0)
+        b = np.where(count & ~reset, pos_diff * price / pos_safe, 0.0)
+        b[reset] = np.where(is_first | (pos != 0), price, 0.0)[reset]
+        
+        segment = np.cumsum(reset)
+        cum_a = pd.Series(a).groupby(segment).cumprod().values
+        avg_price = cum_a * pd.Series(b / cum_a).groupby(segment).cumsum().values
         return avg_price
     
     @staticmethod
     def _process_trades(df):
-        """Add various statistics to trades DataFrame."""
+        """
+        Add various statistics to trades DataFrame.
+        Statistics of all symbols are computed at once with cumulative operations grouped by symbol.
+        
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Trades of one or more symbols, in the order of time for each symbol.
+
+        Returns
+        -------
+        pd.DataFrame
+            Trades sorted by symbol.
+
+        """
+        df = df.sort_values(by='symbol', kind='mergesort')
         # df.index = pd.to_datetime(df.loc[:, 'fill_date'], format="%Y%m%d")
         df.index = df.loc[:, 'fill_date']
         df.index.name = 'index'
@@ -176,39 +264,82 @@ class AlphaAnalyzer(BaseAnalyzer):
         cols_to_drop = ['task_id', 'entrust_no', 'fill_no']
         df = df.drop(cols_to_drop, axis=1)
         
+        symbols = df.loc[:, 'symbol'].values
+        
+        def group_cumsum(ser):
+            return ser.groupby(symbols).cumsum().values
+        
         fs, fp = df.loc[:, 'fill_size'], df.loc[:, 'fill_price']
         turnover = fs * fp
         
-        df.loc[:, 'CumTurnOver'] = turnover.cumsum()
+        df.loc[:, 'CumTurnOver'] = group_cumsum(turnover)
         
-        direction = df.loc[:, 'entrust_action'].apply(lambda s: 1 if s == 'buy' else -1)
+        direction = np.where(df.loc[:, 'entrust_action'].values == 'buy', 1, -1)
         
-        df.loc[:, 'BuyVolume'] = (direction + 1) / 2 * fs
-        df.loc[:, 'SellVolume'] = (direction - 1) / -2 * fs
-        df.loc[:, 'CumVolume'] = fs.cumsum()
-        df.loc[:, 'CumNetTurnOver'] = (turnover * -direction).cumsum()
-        df.loc[:, 'position'] = (fs * direction).cumsum()
+        df.loc[:, 'BuyVolume'] = (direction + 1) / 2. * fs
+        df.loc[:, 'SellVolume'] = (direction - 1) / -2. * fs
+        df.loc[:, 'CumVolume'] = group_cumsum(fs)
+        df.loc[:, 'CumNetTurnOver'] = group_cumsum(turnover * -direction)
+        df.loc[:, 'position'] = group_cumsum(fs * direction)
         
-        df.loc[:, 'AvgPosPrice'] = AlphaAnalyzer._get_avg_pos_price(df.loc[:, 'position'].values, fp.values)
+        is_first = np.ones(len(symbols), dtype=bool)
+        is_first[1:] = symbols[1:] != symbols[:-1]
+        df.loc[:, 'AvgPosPrice'] = AlphaAnalyzer._get_avg_pos_price(df.loc[:, 'position'].values, fp.values,
+                                                                    is_first)
         
         df.loc[:, 'VirtualProfit'] = (df.loc[:, 'CumNetTurnOver'] + df.loc[:, 'position'] * fp)
         
         return df
     
+    def _get_trade_table(self):
+        """Concatenate trades of all symbols."""
+        return pd.concat([self.trades[sec] for sec in sorted(self.trades.keys())], axis=0)
+    
     def process_trades(self):
-        self._trades = {k: self._process_trades(v) for k, v in self.trades.items()}
+        df = self._process_trades(self._get_trade_table())
+        self._trades = {sec: df_sec for sec, df_sec in df.groupby(by='symbol')}
+    
+    @staticmethod
+    def _ffill_by_group(values, is_first):
+        """Forward fill NaN of a 2-D array, without filling across the first row of each group."""
+        n = values.shape[0]
+        rows = np.arange(n).reshape(-1, 1)
+        idx = np.where(~np.isnan(values) | is_first.reshape(-1, 1), rows, 0)
+        idx = np.maximum.accumulate(idx, axis=0)
+        return values[idx, np.arange(values.shape[1])]
     
     @staticmethod
     def _get_daily(close, trade):
-        merge = pd.concat([close, trade], axis=1, join='outer')
+        """
+        Merge close prices and processed trades of all symbols on (symbol, date).
+        
+        Parameters
+        ----------
+        close : pd.DataFrame
+            Columns are symbol, trade_date and close.
+        trade : pd.DataFrame
+            Processed trades.
+
+        Returns
+        -------
+        dict
+            {symbol: pd.DataFrame}, index is trade date.
+
+        """
         cols = ['close', 'BuyVolume', 'SellVolume',
                 'position', 'AvgPosPrice', 'CumNetTurnOver']
-        merge = merge.loc[:, cols]
-    
+        trade = trade.loc[:, ['symbol', 'fill_date'] + cols[1:]].rename(columns={'fill_date': 'trade_date'})
+        merge = pd.merge(close, trade, how='outer', on=['symbol', 'trade_date'])
+        merge = merge.sort_values(by=['symbol', 'trade_date'], kind='mergesort')
+        
+        symbols = merge.loc[:, 'symbol'].values
+        is_first = np.ones(len(symbols), dtype=bool)
+        is_first[1:] = symbols[1:] != symbols[:-1]
+        
         cols_nan_to_zero = ['BuyVolume', 'SellVolume']
         cols_nan_fill = ['close', 'position', 'AvgPosPrice', 'CumNetTurnOver']
-        merge.loc[:, cols_nan_fill] = merge.loc[:, cols_nan_fill].fillna(method='ffill')
-        merge.loc[:, cols_nan_fill] = merge.loc[:, cols_nan_fill].fillna(0)
+        values = AlphaAnalyzer._ffill_by_group(merge.loc[:, cols_nan_fill].values.astype(float), is_first)
+        merge.loc[:, cols_nan_fill] = np.where(np.isnan(values), 0.0, values)
         
         merge.loc[:, cols_nan_to_zero] = merge.loc[:, cols_nan_to_zero].fillna(0)
         
@@ -216,18 +347,62 @@ class AlphaAnalyzer(BaseAnalyzer):
     
         merge.loc[:, 'VirtualProfit'] = merge.loc[:, 'CumNetTurnOver'] + merge.loc[:, 'position'] * merge.loc[:, 'close']
         
-        return merge
+        merge = merge.set_index('trade_date')
+        merge.index.name = None
+        return {sec: df.loc[:, cols + ['VirtualProfit']] for sec, df in merge.groupby(by='symbol')}
+    
+    def _get_daily_from_ledger(self):
+        """
+        Daily statistics of traded symbols read from self.ledger, instead of replaying trades.
+
+        Returns
+        -------
+        dict
+            {symbol: pd.DataFrame}, index is trade date.
+
+        """
+        ledger = self.ledger
+        close = self.closes.reindex(index=ledger.dates, columns=ledger.symbols).ffill()
+        # PnL of each symbol in the unit of VirtualProfit (price x lots)
+        profit = (ledger.realized_pnl + ledger.get_unrealized_pnl(close.values)) / 100.
+        close = close.fillna(0.0)
+        
+        trade = self._get_trade_table()
+        is_buy = trade.loc[:, 'entrust_action'].values == 'buy'
+        fs = trade.loc[:, 'fill_size'].values
+        volume = pd.DataFrame({'symbol': trade.loc[:, 'symbol'].values,
+                               'trade_date': trade.loc[:, 'fill_date'].values,
+                               'BuyVolume': np.where(is_buy, fs, 0),
+                               'SellVolume': np.where(is_buy, 0, fs)})
+        volume = volume.groupby(by=['symbol', 'trade_date']).sum()
+        
+        res = dict()
+        for sec in sorted(self.trades.keys()):
+            col = ledger.symbols.index(sec)
+            df = pd.DataFrame(index=ledger.dates)
+            df.loc[:, 'close'] = close.loc[:, sec].values
+            df = df.join(volume.loc[sec]).fillna(0)
+            df.loc[:, 'position'] = ledger.position[:, col]
+            cost_price = ledger.cost_price[:, col]
+            df.loc[:, 'AvgPosPrice'] = np.where(cost_price < 1e-5, df.loc[:, 'close'].values, cost_price)
+            df.loc[:, 'CumNetTurnOver'] = profit[:, col] - ledger.position[:, col] * df.loc[:, 'close'].values
+            df.loc[:, 'VirtualProfit'] = profit[:, col]
+            res[sec] = df.loc[:, ['close', 'BuyVolume', 'SellVolume', 'position', 'AvgPosPrice',
+                                  'CumNetTurnOver', 'VirtualProfit']]
+        return res
     
     def get_daily(self):
-        """Add various statistics to daily DataFrame."""
-        daily_dic = dict()
-        for sec, df_trade in self.trades.viewitems():
-            df_close = self.closes[sec]
-            
-            res = self._get_daily(df_close, df_trade)
-            daily_dic[sec] = res
-            
-        self.daily = daily_dic
+        """Add various statistics to daily DataFrame. Positions and PnL are read from ledger if there is one."""
+        if self.ledger is not None:
+            self.daily = self._get_daily_from_ledger()
+            return
+        
+        # keep dates without close price (e.g. suspended), as daily bars of the data server do
+        df_close = self.closes.reindex(columns=sorted(self.trades.keys())).stack(dropna=False)
+        df_close.name = 'close'
+        df_close = df_close.reset_index()
+        
+        self.daily = self._get_daily(df_close, self._get_trade_table())
     
     @staticmethod
     def _to_pct_return(arr, cumulative=False):
@@ -262,24 +437,25 @@ class AlphaAnalyzer(BaseAnalyzer):
         self.position_change = res
         self.account = account
             
-    def get_returns(self):
+    def _get_strategy_value(self):
+        """Total value of the strategy on each date, from ledger if there is one, else from self.daily."""
+        if self.ledger is not None:
+            ledger = self.ledger
+            close = self.closes.reindex(index=ledger.dates, columns=ledger.symbols).ffill()
+            return pd.Series(ledger.get_total_value(close.values), index=ledger.dates)
+        
         # vp_list = [df_profit.loc[:, 'VirtualProfit'].copy().rename({'VirtualProfit': sec}) for sec, df_profit in self.daily.items()]
         vp_list = {sec: df_profit.loc[:, 'VirtualProfit'] for sec, df_profit in self.daily.items()}
         # after concat, there will be NaN due to list / delist of different stocks
         df_profit = pd.concat(vp_list, axis=1)  # this is cumulative profit
         # TODO temperary solution
         df_profit = df_profit.fillna(method='ffill').fillna(0.0)
-        strategy_value = df_profit.sum(axis=1) * 100 + self.configs['init_balance']
-        
-        benchmark_name = self.configs['benchmark']
-        df_bench_value, err_msg = self.data_api.daily(benchmark_name,
-                                                      self.configs['start_date'], self.configs['end_date'],
-                                                      fields='close', adjust_mode=self.adjust_mode)
-        # df_bench_value.index = pd.to_datetime(df_bench_value.loc[:, 'trade_date'], format="%Y%m%d")
-        # df_bench_value.index = df_bench_value.loc[:, 'trade_date']
-        # df_bench_value.index.name = 'index'
-        df_bench_value = df_bench_value.set_index('trade_date')
-        df_bench_value.drop(['symbol'], axis=1, inplace=True)
+        return df_profit.sum(axis=1) * 100 + self.configs['init_balance']
+    
+    def get_returns(self):
+        strategy_value = self._get_strategy_value()
+        
+        df_bench_value = self._get_benchmark_price()
         
         # pnl_return_cum = pd.DataFrame(index=strategy_value.index, data=self._to_pct_return(strategy_value.values))
         # bench_return_cum = pd.DataFrame(index=df_bench_value.index, data=self._to_pct_return(df_bench_value.values))
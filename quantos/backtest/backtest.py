@@ -1,5 +1,7 @@
 # encoding: utf-8
 
+import numpy as np
+
 from quantos.data.calendar import Calendar
 from quantos.backtest import common
 from quantos.backtest.analyze.pnlreport import PnlManager
@@ -174,6 +176,9 @@ class AlphaBacktestInstance_dv(BacktestInstance):
         self.last_rebalance_date = 0
         self.current_rebalance_date = 0
         self.trade_days = None
+        
+        self._schedule_dates = None
+        self._schedule_next = None
 
     def position_adjust(self):
         """
@@ -220,6 +225,9 @@ class AlphaBacktestInstance_dv(BacktestInstance):
         gateway = self.ctx.gateway
         
         self.current_date = self.start_date
+        self._prepare_schedule()
+        self.strategy.pm.init_ledger(self.ctx.calendar.get_trade_date_range(self.start_date, self.end_date),
+                                     self.ctx.dataview.symbol, self.props['init_balance'])
         while True:
             # switch trade date
             self.go_next_date()
@@ -248,13 +256,19 @@ class AlphaBacktestInstance_dv(BacktestInstance):
                 self.strategy.send_bullets()
             else:
                 self.on_new_day(self.current_date)
-                univ_price_dic = self.get_univ_prices(field_name="close,vwap,open,high,low")  # access data
+                if not gateway.vectorized_match:
+                    univ_price_dic = self.get_univ_prices(field_name="close,vwap,open,high,low")  # access data
             
             # return trade indications
-            trade_indications = gateway.match(univ_price_dic, self.current_date)
-            for trade_ind in trade_indications:
-                self.strategy.on_trade_ind(trade_ind)
+            if gateway.vectorized_match:
+                trade_batch = gateway.match_arrays(self.get_univ_price_array(), self.current_date)
+                self.strategy.on_trade_batch(trade_batch)
+            else:
+                trade_indications = gateway.match(univ_price_dic, self.current_date)
+                for trade_ind in trade_indications:
+                    self.strategy.on_trade_ind(trade_ind)
         
+        self.strategy.pm.ledger.finish()
         print "Backtest done. {:d} days, {:.2e} trades in total.".format(len(self.ctx.dataview.dates),
                                                                          len(self.strategy.pm.trades))
         
@@ -264,20 +278,44 @@ class AlphaBacktestInstance_dv(BacktestInstance):
         gp = df.groupby(by='symbol')
         return {sec: df for sec, df in gp}
     
+    def get_univ_price_array(self):
+        """Price matrix of current date for vectorized matching, rows and columns follow the simulator."""
+        dv = self.ctx.dataview
+        simulator = self.ctx.gateway.simulator
+        symbol = "" if simulator.symbols == dv.symbol else ','.join(simulator.symbols)
+        return dv.get_snapshot_array(self.current_date, symbol=symbol, fields=','.join(simulator.price_fields))
+    
     def _is_trade_date(self, date):
         return date in self.ctx.dataview.dates
     
+    def _prepare_schedule(self):
+        """Compute next re-balance date of start_date and of each trade date in the backtest period at once."""
+        calendar = self.ctx.calendar
+        dates = calendar.get_trade_date_range(self.start_date, self.end_date)
+        self._schedule_dates = np.union1d([self.start_date], dates)
+        
+        # a calendar of known trade dates only (e.g. dates of DataView) does not have re-balance dates
+        # after its last date, those dates are after end_date and end the backtest
+        next_period_days = dtutil.get_next_period_day(self._schedule_dates, self.strategy.period,
+                                                      self.strategy.days_delay)
+        is_known = np.asarray(next_period_days) < calendar.trade_dates[-1]
+        self._schedule_next = np.empty(len(self._schedule_dates), dtype=int)
+        self._schedule_next.fill(self.end_date + 1)
+        self._schedule_next[is_known] = calendar.get_next_rebalance_dates(self._schedule_dates[is_known],
+                                                                          self.strategy.period,
+                                                                          self.strategy.days_delay)
+    
     def go_next_date(self):
         """update self.current_date and last_date."""
         if self.ctx.gateway.match_finished:
-            next_period_day = dtutil.get_next_period_day(self.current_date,
-                                                         self.strategy.period, self.strategy.days_delay)
-            # update current_date: next_period_day is a workday, but not necessarily a trade date
-            if self.ctx.calendar.is_trade_date(next_period_day):
-                self.current_date = next_period_day
+            # next re-balance date: the first trade date after next_period_day
+            i = np.searchsorted(self._schedule_dates, self.current_date)
+            if i < len(self._schedule_dates) and self._schedule_dates[i] == self.current_date:
+                self.current_date = int(self._schedule_next[i])
             else:
-                self.current_date = self.ctx.calendar.get_next_trade_date(next_period_day)
-            self.current_date = self.ctx.calendar.get_next_trade_date(next_period_day)
+                self.current_date = self.ctx.calendar.get_next_rebalance_dates(self.current_date,
+                                                                               self.strategy.period,
+                                                                               self.strategy.days_delay)
         
             # update re-balance date
             if self.current_rebalance_date > 0:
@@ -292,10 +330,12 @@ class AlphaBacktestInstance_dv(BacktestInstance):
         self.last_date = self.ctx.calendar.get_last_trade_date(self.current_date)
     
     def get_suspensions(self):
-        trade_status = self.ctx.dataview.get_snapshot(self.current_date, fields='trade_status')
-        trade_status = trade_status.loc[:, 'trade_status']
-        mask_sus = trade_status != u'交易'.encode('utf-8')
-        return list(trade_status.loc[mask_sus].index.values)
+        dv = self.ctx.dataview
+        field = dv.TRADE_STATUS_FIELD_NAME
+        # compare integer codes instead of strings
+        codes = dv.get_snapshot_codes(self.current_date, field)
+        mask_sus = codes != dv.get_category_code(field, dv.TRADE_STATUS_TRADING)
+        return [dv.symbol[i] for i in np.flatnonzero(mask_sus)]
 
     def on_new_day(self, date):
         self.ctx.trade_date = date
@@ -303,27 +343,7 @@ class AlphaBacktestInstance_dv(BacktestInstance):
         self.ctx.gateway.on_new_day(date)
 
     def save_results(self, folder='../output/'):
-        import pandas as pd
-    
-        trades = self.strategy.pm.trades
-    
-        type_map = {'task_id': str,
-                    'entrust_no': str,
-                    'entrust_action': str,
-                    'symbol': str,
-                    'fill_price': float,
-                    'fill_size': int,
-                    'fill_date': int,
-                    'fill_time': int,
-                    'fill_no': str}
-        # keys = trades[0].__dict__.keys()
-        ser_list = dict()
-        for key in type_map.keys():
-            v = [t.__getattribute__(key) for t in trades]
-            ser = pd.Series(data=v, index=None, dtype=type_map[key], name=key)
-            ser_list[key] = ser
-        df_trades = pd.DataFrame(ser_list)
-        df_trades.index.name = 'index'
+        df_trades = self.strategy.pm.trades.to_dataframe()
     
         from os.path import join
         trades_fn = join(folder, 'trades.csv')
@@ -332,6 +352,10 @@ class AlphaBacktestInstance_dv(BacktestInstance):
     
         df_trades.to_csv(trades_fn)
         fileio.save_json(self.props, configs_fn)
+        
+        ledger = self.strategy.pm.ledger
+        if ledger is not None:
+            ledger.save(join(folder, 'ledger'))
     
         print ("Backtest results has been successfully saved to:\n" + folder)
 
@@ -342,6 +366,7 @@ class EventBacktestInstance(BacktestInstance):
         
         self.pnlmgr = None
         self.bar_type = 1
+        self.batch_bars = False
 
     def init_from_config(self, props, strategy, context=None):
         self.props = props
@@ -355,6 +380,7 @@ class EventBacktestInstance(BacktestInstance):
         self.start_date = self.props.get("start_date")
         self.end_date = self.props.get("end_date")
         self.bar_type = props.get("bar_type")
+        self.batch_bars = props.get("batch_bars", False)
 
         self.ctx = context
         self.strategy = strategy
@@ -446,26 +472,38 @@ class EventBacktestInstance(BacktestInstance):
                 continue
                 
             df_quotes = df_quotes.sort_values(by='time')
-            quotes_list = Bar.create_from_df(df_quotes)
+            bars = Bar.create_array_from_df(df_quotes)
             
-            # for idx in df_quotes.index:
-            #     df_row = df_quotes.loc[[idx], :]
-            for quote in quotes_list:
-                self.process_quote(quote)
+            if self.batch_bars:
+                for time, bars_time in Bar.split_by_time(bars):
+                    self.process_bars(time, bars_time)
+            else:
+                for quote in Bar.iter_array(bars):
+                    self.process_quote(quote)
         
         print "Backtest done."
         
-    def process_quote(self, quote):
-        # match
+    def _match(self, quote):
         trade_results = self.ctx.gateway.process_quote(quote)
         
         # trade indication
         for tradeInd, statusInd in trade_results:
             self.strategy.on_trade_ind(tradeInd)
             self.strategy.on_order_status(statusInd)
+    
+    def process_quote(self, quote):
+        # match
+        self._match(quote)
         
         # on_quote
         self.strategy.on_quote(quote)
+    
+    def process_bars(self, time, bars):
+        """Match bars of all symbols at the same time one by one, then pass them to strategy at once."""
+        for quote in Bar.iter_array(bars):
+            self._match(quote)
+        
+        self.strategy.on_bars(time, bars)
 
     def generate_report(self, output_format=""):
         return self.pnlmgr.generateReport(output_format)
@@ -2,17 +2,23 @@
 
 from abc import abstractmethod
 import abc
+import heapq
 from six import with_metaclass
 
 import numpy as np
 
 from quantos.data.basic.order import *
 from quantos.data.basic.position import Position
-from quantos.data.basic.trade import Trade
+from quantos.data.basic.trade import Trade, TradeBatch, TradeLog
+from quantos.backtest.ledger import DailyLedger
 from quantos.util.sequence import SequenceGenerator
 
 
 class OrderStatusInd(object):
+    __slots__ = ('entrust_no', 'symbol',
+                 'entrust_action', 'entrust_price', 'entrust_size', 'entrust_date', 'entrust_time',
+                 'order_status', 'fill_size', 'fill_price')
+    
     def __init__(self):
         self.entrust_no = ''
         
@@ -293,10 +299,13 @@ class PortfolioManager(TradeCallback):
     Attributes
     ----------
     orders : list of quantos.data.basic.Order objects
-    trades : list of quantos.data.basic.Trade objects
+    trades : quantos.data.basic.trade.TradeLog
+        Columnar log of all trades.
     positions : dict of {symbol + trade_date : quantos.data.basic.Position}
     strategy : Strategy
     holding_securities : set of securities
+    ledger : quantos.backtest.ledger.DailyLedger or None
+        Daily position, cost price, realized PnL and cash, created by init_ledger.
 
     Methods
     -------
@@ -306,11 +315,27 @@ class PortfolioManager(TradeCallback):
     # TODO want / frozen update
     def __init__(self, strategy=None):
         self.orders = {}
-        self.trades = []
+        self.trades = TradeLog()
         self.positions = {}
         self.holding_securities = set()
         self.tradestat = {}
         self.strategy = strategy
+        self.ledger = None
+    
+    def init_ledger(self, dates, symbols, init_balance=0.0):
+        """
+        Record a daily ledger of all trades from now on.
+
+        Parameters
+        ----------
+        dates : array-like of int
+            All trade dates of the backtest.
+        symbols : list of str
+            All symbols that may be traded.
+        init_balance : float
+
+        """
+        self.ledger = DailyLedger(dates, symbols, init_balance)
     
     @staticmethod
     def _make_position_key(symbol, trade_date=0):
@@ -444,6 +469,7 @@ class PortfolioManager(TradeCallback):
             tradestat.buy_want_size -= ind.fill_size
             
             position.curr_size += ind.fill_size
+            size_change = ind.fill_size
         
         elif (ind.entrust_action == common.ORDER_ACTION.SELL
               or ind.entrust_action == common.ORDER_ACTION.SELLTODAY
@@ -454,6 +480,13 @@ class PortfolioManager(TradeCallback):
             tradestat.sell_want_size -= ind.fill_size
             
             position.curr_size -= ind.fill_size
+            size_change = -ind.fill_size
+        
+        else:
+            size_change = 0
+        
+        if self.ledger is not None and size_change != 0:
+            self.ledger.on_trade(ind.symbol, size_change, ind.fill_price, ind.fill_date)
         
         if position.curr_size != 0:
             self.holding_securities.add(ind.symbol)
@@ -604,13 +637,25 @@ class BaseGateway(object):
     
 
 class DailyStockSimGateway(BaseGateway):
+    """
+    Attributes
+    ----------
+    vectorized_match : bool
+        If True, orders are matched by VectorizedStockSimulatorDaily with match_arrays.
+        Set by props['vectorized_match'] (default False), universe is props['universe'].
+
+    """
     def __init__(self):
         BaseGateway.__init__(self)
         
         self.simulator = StockSimulatorDaily()
+        self.vectorized_match = False
     
     def init_from_config(self, props):
-        pass
+        self.vectorized_match = props.get('vectorized_match', False)
+        if self.vectorized_match:
+            symbols = sorted(props['universe'].split(','))
+            self.simulator = VectorizedStockSimulatorDaily(symbols)
     
     def on_new_day(self, trade_date):
         self.simulator.on_new_day(trade_date)
@@ -643,6 +688,23 @@ class DailyStockSimGateway(BaseGateway):
 
         """
         return self.simulator.match(price_dict, date, time)
+    
+    def match_arrays(self, prices, date=19700101, time=0):
+        """
+        Match un-fill orders in vectorized simulator. Return a batch of trade indications.
+
+        Parameters
+        ----------
+        prices : np.ndarray
+            shape = (n_symbols, n_fields), rows follow self.simulator.symbols,
+            columns follow self.simulator.price_fields.
+
+        Returns
+        -------
+        TradeBatch
+
+        """
+        return self.simulator.match_arrays(prices, date, time)
 
 
 class StockSimulatorDaily(object):
@@ -786,14 +848,220 @@ class StockSimulatorDaily(object):
         return results
 
 
+class VectorizedStockSimulatorDaily(StockSimulatorDaily):
+    """
+    Daily simulator for alpha backtests. Un-filled orders are stored as columnar arrays
+    (symbol index, remaining size, price target code, action), and all of them are
+    filled with one gather on the price matrix of the day.
+
+    Attributes
+    ----------
+    symbols : list of str
+        Rows of the price matrix.
+    price_fields : list of str
+        Columns of the price matrix.
+
+    """
+    def __init__(self, symbols, price_fields=('close', 'vwap', 'open', 'high', 'low')):
+        StockSimulatorDaily.__init__(self)
+        
+        self.symbols = list(symbols)
+        self.price_fields = list(price_fields)
+        self._symbol_pos = {sec: i for i, sec in enumerate(self.symbols)}
+        self._field_pos = {field: i for i, field in enumerate(self.price_fields)}
+        
+        # {entrust_no: order}, used for cancellation
+        self._orders = dict()
+        # orders added since last match, converted to arrays all at once
+        self._new_rows = []
+        self._columns = self._make_columns([])
+    
+    @staticmethod
+    def _make_columns(rows):
+        names = ('symbol_idx', 'size', 'price_code', 'task_id', 'entrust_no', 'entrust_action')
+        # size keeps the type of entrust_size (int, or float after position adjustment)
+        dtypes = (np.int64, None, np.int64, object, object, object)
+        if rows:
+            cols = zip(*rows)
+        else:
+            cols = [[]] * len(names)
+            dtypes = (np.int64, np.int64, np.int64, object, object, object)
+        return {name: np.array(col, dtype=dtype) for name, col, dtype in zip(names, cols, dtypes)}
+    
+    @property
+    def match_finished(self):
+        return len(self._orders) == 0
+    
+    def _refresh_orders(self):
+        self._orders.clear()
+        self._new_rows = []
+        self._columns = self._make_columns([])
+    
+    @staticmethod
+    def _get_price_target(order):
+        if isinstance(order, FixedPriceTypeOrder):
+            return order.price_target
+        elif isinstance(order, VwapOrder):
+            if order.start != -1:
+                raise NotImplementedError("Vwap of a certain time range")
+            return 'vwap'
+        elif isinstance(order, Order):
+            return 'close'
+        else:
+            raise NotImplementedError("order class {} not support!".format(order.__class__))
+    
+    def add_order(self, order):
+        """
+        Add one order to the simulator.
+
+        Parameters
+        ----------
+        order : Order
+
+        Returns
+        -------
+        err_msg : str
+            default ""
+
+        """
+        self._validate_order(order)
+        
+        if order.entrust_no in self._orders:
+            return "order with entrust_no {} already exists in simulator".format(order.entrust_no)
+        if order.symbol not in self._symbol_pos:
+            return "symbol {} is not in the universe of simulator".format(order.symbol)
+        price_target = self._get_price_target(order)
+        if price_target not in self._field_pos:
+            return "price target {} is not in price fields of simulator".format(price_target)
+        
+        self._orders[order.entrust_no] = order
+        self._new_rows.append((self._symbol_pos[order.symbol], order.entrust_size - order.fill_size,
+                               self._field_pos[price_target],
+                               order.task_id, order.entrust_no, order.entrust_action))
+        return ""
+    
+    def cancel_order(self, entrust_no):
+        """
+        Cancel an order.
+
+        Parameters
+        ----------
+        entrust_no : str
+
+        Returns
+        -------
+        err_msg : str
+            default ""
+
+        """
+        popped = self._orders.pop(entrust_no, None)
+        if popped is None:
+            return None, "No order with entrust_no {} in simulator.".format(entrust_no)
+        
+        self._flush()
+        mask = self._columns['entrust_no'] != entrust_no
+        self._columns = {k: v[mask] for k, v in self._columns.viewitems()}
+        
+        order_status_ind = OrderStatusInd()
+        order_status_ind.init_from_order(popped)
+        order_status_ind.order_status = common.ORDER_STATUS.CANCELLED
+        return order_status_ind, ""
+    
+    def _flush(self):
+        if self._new_rows:
+            new = self._make_columns(self._new_rows)
+            self._columns = {k: np.concatenate([v, new[k]]) for k, v in self._columns.viewitems()}
+            self._new_rows = []
+    
+    def match_arrays(self, prices, date=19700101, time=150000):
+        """
+        Fill all un-filled orders at prices of the day.
+
+        Parameters
+        ----------
+        prices : np.ndarray
+            shape = (n_symbols, n_price_fields). Rows and columns follow self.symbols and self.price_fields.
+        date : int
+        time : int
+
+        Returns
+        -------
+        TradeBatch
+
+        """
+        self._validate_price(prices)
+        self._flush()
+        
+        cols = self._columns
+        n = len(cols['size'])
+        fill_no = np.int64(date) * 10000 + np.array(self.seq_gen.get_next_n('fill_no', n), dtype=np.int64)
+        
+        batch = TradeBatch(task_id=cols['task_id'],
+                           entrust_no=cols['entrust_no'],
+                           entrust_action=cols['entrust_action'],
+                           symbol=np.array(self.symbols, dtype=object)[cols['symbol_idx']],
+                           fill_price=prices[cols['symbol_idx'], cols['price_code']],
+                           fill_size=cols['size'],
+                           fill_date=np.full(n, date, dtype=np.int64),
+                           fill_time=np.full(n, time, dtype=np.int64),
+                           fill_no=fill_no.astype(str).astype(object))
+        # all orders are filled completely
+        self._refresh_orders()
+        return batch
+    
+    def match(self, price_dic, date=19700101, time=150000):
+        """Same as StockSimulatorDaily.match: price_dic is {symbol: pd.DataFrame of one row}."""
+        self._validate_price(price_dic)
+        prices = np.full((len(self.symbols), len(self.price_fields)), np.nan)
+        for sec, df in price_dic.viewitems():
+            i = self._symbol_pos.get(sec)
+            if i is None:
+                continue
+            for field, j in self._field_pos.viewitems():
+                if field in df.columns:
+                    prices[i, j] = df.loc[:, field].values[0]
+        return self.match_arrays(prices, date, time).to_trades()
+
+
 class OrderBook(object):
+    """
+    Resting orders of bar-level backtest, indexed by symbol.
+    
+    For each symbol, LIMIT and STOP orders of each side are kept in a heap ordered by the price
+    at which they are triggered first, so a bar only touches orders that its high and low can trigger.
+    Finished orders are moved to archive. Cancelled orders are removed from heaps lazily.
+
+    Attributes
+    ----------
+    active : dict of {entrust_no: Order}
+        Orders not finished.
+    archive : list of Order
+        Finished orders, in order of being finished.
+
+    """
+    # {(order_type, entrust_action): sign}
+    # heap key is sign * entrust_price, the top of heap is triggered first.
+    BOOK_SIDES = {(common.ORDER_TYPE.LIMIT, common.ORDER_ACTION.BUY): -1,  # entrust_price >= low
+                  (common.ORDER_TYPE.LIMIT, common.ORDER_ACTION.SELL): 1,  # entrust_price <= high
+                  (common.ORDER_TYPE.STOP, common.ORDER_ACTION.BUY): 1,  # entrust_price <= high
+                  (common.ORDER_TYPE.STOP, common.ORDER_ACTION.SELL): -1}  # entrust_price >= low
+    
     def __init__(self):
-        self.orders = []
+        self.active = dict()
+        self.archive = []
+        # {symbol: {(order_type, entrust_action): heap of (key, seq, order)}}
+        self._books = dict()
         self.trade_id = 0
         self.order_id = 0
         
         self.seq_gen = SequenceGenerator()
     
+    @property
+    def orders(self):
+        """All orders, in order of being added."""
+        res = self.archive + self.active.values()
+        return sorted(res, key=lambda o: o.entrust_no)
+    
     def next_trade_id(self):
         return self.seq_gen.get_next('trade_id')
     
@@ -805,7 +1073,13 @@ class OrderBook(object):
         # to do
         order.entrust_no = self.next_order_id()
         neworder.copy(order)
-        self.orders.append(neworder)
+        self.active[neworder.entrust_no] = neworder
+        
+        side = (neworder.order_type, neworder.entrust_action)
+        sign = self.BOOK_SIDES.get(side, None)
+        if sign is not None:
+            heap = self._books.setdefault(neworder.symbol, dict()).setdefault(side, [])
+            heapq.heappush(heap, (sign * neworder.entrust_price, neworder.entrust_no, neworder))
     
     def make_trade(self, quote, freq='1m'):
         
@@ -824,133 +1098,87 @@ class OrderBook(object):
             # TODO
             return self.makeDaiylTrade(quote)
     
+    def _pop_triggered(self, heap, sign, bound):
+        """Pop orders whose heap key is not larger than sign * bound, skip finished orders."""
+        res = []
+        key_bound = sign * bound
+        while heap and heap[0][0] <= key_bound:
+            _, _, order = heapq.heappop(heap)
+            if not order.is_finished:
+                res.append(order)
+        return res
+    
     def make_trade_bar(self, quote):
-        # low = quote.loc[:, 'low'].values[0]
-        # high = quote.loc[:, 'high'].values[0]
-        # quote_time = quote.loc[:, 'time'].values[0]
-        # quote_symbol = quote.loc[:, 'symbol'].values[0]
         low = quote.low
         high = quote.high
         quote_time = quote.time
-        quote_symbol = quote.symbol
+        
+        book = self._books.get(quote.symbol, None)
+        if not book:
+            return []
+        
+        triggered = []
+        for side, heap in book.viewitems():
+            sign = self.BOOK_SIDES[side]
+            # sign -1 triggers if entrust_price >= low, sign 1 triggers if entrust_price <= high
+            triggered.extend(self._pop_triggered(heap, sign, low if sign < 0 else high))
         
         result = []
-        # to be optimized
-        for i in xrange(len(self.orders)):
-            order = self.orders[i]
-            if quote_symbol != order.symbol:
-                continue
-            if order.is_finished:
-                continue
+        # keep the order of being added
+        for order in sorted(triggered, key=lambda o: o.entrust_no):
+            trade = Trade()
+            trade.fill_no = self.next_trade_id()
+            trade.entrust_no = order.entrust_no
+            trade.symbol = order.symbol
+            trade.entrust_action = order.entrust_action
+            trade.fill_size = order.entrust_size
+            trade.fill_price = order.entrust_price
+            trade.fill_date = order.entrust_date
+            trade.fill_time = quote_time
             
-            if order.order_type == common.ORDER_TYPE.LIMIT:
-                if order.entrust_action == common.ORDER_ACTION.BUY and order.entrust_price >= low:
-                    trade = Trade()
-                    trade.fill_no = self.next_trade_id()
-                    trade.entrust_no = order.entrust_no
-                    trade.symbol = order.symbol
-                    trade.entrust_action = order.entrust_action
-                    trade.fill_size = order.entrust_size
-                    trade.fill_price = order.entrust_price
-                    trade.fill_date = order.entrust_date
-                    trade.fill_time = quote_time
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    
-                    orderstatusInd = OrderStatusInd()
-                    orderstatusInd.init_from_order(order)
-                    result.append((trade, orderstatusInd))
-                
-                if order.entrust_action == common.ORDER_ACTION.SELL and order.entrust_price <= high:
-                    trade = Trade()
-                    trade.fill_no = self.next_trade_id()
-                    trade.entrust_no = order.entrust_no
-                    trade.symbol = order.symbol
-                    trade.entrust_action = order.entrust_action
-                    trade.fill_size = order.entrust_size
-                    trade.fill_price = order.entrust_price
-                    trade.fill_date = order.entrust_date
-                    trade.fill_time = quote_time
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    
-                    orderstatusInd = OrderStatusInd()
-                    orderstatusInd.init_from_order(order)
-                    result.append((trade, orderstatusInd))
+            order.order_status = common.ORDER_STATUS.FILLED
+            order.fill_size = trade.fill_size
+            order.fill_price = trade.fill_price
+            self._archive(order)
             
-            if order.order_type == common.ORDER_TYPE.STOP:
-                if order.entrust_action == common.ORDER_ACTION.BUY and order.entrust_price <= high:
-                    trade = Trade()
-                    trade.fill_no = self.next_trade_id()
-                    trade.entrust_no = order.entrust_no
-                    trade.symbol = order.symbol
-                    trade.entrust_action = order.entrust_action
-                    trade.fill_size = order.entrust_size
-                    trade.fill_price = order.entrust_price
-                    trade.fill_date = order.entrust_date
-                    trade.fill_time = quote_time
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    orderstatusInd = OrderStatusInd()
-                    orderstatusInd.init_from_order(order)
-                    result.append((trade, orderstatusInd))
-                
-                if order.entrust_action == common.ORDER_ACTION.SELL and order.entrust_price >= low:
-                    trade = Trade()
-                    trade.fill_no = self.next_trade_id()
-                    trade.entrust_no = order.entrust_no
-                    trade.symbol = order.symbol
-                    trade.entrust_action = order.entrust_action
-                    trade.fill_size = order.entrust_size
-                    trade.fill_price = order.entrust_price
-                    trade.fill_date = order.entrust_date
-                    trade.fill_time = quote_time
-                    
-                    order.order_status = common.ORDER_STATUS.FILLED
-                    order.fill_size = trade.fill_size
-                    order.fill_price = trade.fill_price
-                    orderstatusInd = OrderStatusInd()
-                    orderstatusInd.init_from_order(order)
-                    result.append((trade, orderstatusInd))
+            orderstatusInd = OrderStatusInd()
+            orderstatusInd.init_from_order(order)
+            result.append((trade, orderstatusInd))
         
         return result
     
+    def _archive(self, order):
+        del self.active[order.entrust_no]
+        self.archive.append(order)
+    
     def cancel_order(self, entrust_no):
-        for i in xrange(len(self.orders)):
-            order = self.orders[i]
-            
-            if (order.is_finished):
-                continue
-            
-            if (order.entrust_no == entrust_no):
-                order.cancel_size = order.entrust_size - order.fill_size
-                order.order_status = common.ORDER_STATUS.CANCELLED
-            
-            # todo
-            orderstatus = OrderStatusInd()
-            orderstatus.init_from_order(order)
-            
-            return orderstatus
+        order = self.active.get(entrust_no, None)
+        if order is None:
+            return None
+        
+        order.cancel_size = order.entrust_size - order.fill_size
+        order.order_status = common.ORDER_STATUS.CANCELLED
+        # entry in heap is removed when it reaches the top
+        self._archive(order)
+        
+        orderstatus = OrderStatusInd()
+        orderstatus.init_from_order(order)
+        return orderstatus
     
     def cancel_all(self):
         result = []
-        for order in self.orders:
-            if order.is_finished:
-                continue
+        for order in sorted(self.active.values(), key=lambda o: o.entrust_no):
             order.cancel_size = order.entrust_size - order.fill_size
             order.order_status = common.ORDER_STATUS.CANCELLED
+            self.archive.append(order)
             
             # todo
             orderstatus = OrderStatusInd()
             orderstatus.init_from_order(order)
             result.append(orderstatus)
         
+        self.active.clear()
+        self._books.clear()
         return result
 
 
@@ -0,0 +1,224 @@
+# encoding: utf-8
+"""
+Daily ledger of a backtest: position, cost price and realized PnL of each (date, symbol), and cash of each date.
+
+Arrays are allocated once for all trade dates and symbols of the backtest and updated in place
+on each trade, so that analysis can read positions and PnL directly instead of replaying trades.
+Rows are filled forward lazily: the row of a date holds the state after the last trade on or before it.
+Trades dated before the last filled row (e.g. position adjustments of the last period) are written into
+their own rows, and the rows after them are updated.
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import quantos.util.fileio
+from quantos.data.panel import Panel
+
+
+class DailyLedger(object):
+    """
+    Attributes
+    ----------
+    dates : np.ndarray
+        Sorted int trade dates.
+    symbols : list of str
+    init_balance : float
+    position : np.ndarray
+        (date x symbol) signed position in lots.
+    cost_price : np.ndarray
+        (date x symbol) average price of the current position, 0.0 if there is no position.
+    realized_pnl : np.ndarray
+        (date x symbol) cumulative PnL of closed positions.
+    cash : np.ndarray
+        Cash of each date: init_balance minus net turnover of all trades.
+
+    """
+    FIELDS = ['position', 'cost_price', 'realized_pnl']
+
+    def __init__(self, dates, symbols, init_balance=0.0):
+        self.dates = np.asarray(dates)
+        self.symbols = list(symbols)
+        self.init_balance = init_balance
+
+        shape = (len(self.dates), len(self.symbols))
+        self.position = np.zeros(shape)
+        self.cost_price = np.zeros(shape)
+        self.realized_pnl = np.zeros(shape)
+        self.cash = np.empty(len(self.dates))
+        self.cash.fill(init_balance)
+
+        self._symbol_pos = {sec: i for i, sec in enumerate(self.symbols)}
+        self._row = 0
+        # (row, size, price) of all trades of each symbol in order, to update rows after a backdated trade
+        self._trades = dict()
+
+    def _get_row(self, date):
+        """
+        Move to the row of date and fill rows in between with the current state.
+        Returns the row of date, which is before the current row for backdated trades.
+
+        """
+        row = max(np.searchsorted(self.dates, date, side='right') - 1, 0)
+        if row > self._row:
+            for arr in (self.position, self.cost_price, self.realized_pnl, self.cash):
+                arr[self._row + 1: row + 1] = arr[self._row]
+            self._row = row
+        return row
+
+    @staticmethod
+    def _apply_trade(pos, cost_price, realized_pnl, size, price):
+        """Return position, cost price and realized PnL after a trade."""
+        pos_new = pos + size
+        if pos == 0 or pos * size > 0:
+            cost_price = (cost_price * pos + price * size) / pos_new
+        else:
+            size_closed = np.sign(pos) * min(abs(size), abs(pos))
+            realized_pnl += size_closed * (price - cost_price) * 100
+            if pos_new == 0:
+                cost_price = 0.0
+            elif pos_new * pos < 0:
+                cost_price = price
+        return pos_new, cost_price, realized_pnl
+
+    def _replay(self, col, row_start):
+        """Re-calculate rows of a symbol from row_start to the current row with its trades."""
+        if row_start > 0:
+            state = (self.position[row_start - 1, col], self.cost_price[row_start - 1, col],
+                     self.realized_pnl[row_start - 1, col])
+        else:
+            state = (0.0, 0.0, 0.0)
+        trades = [trade for trade in self._trades[col] if trade[0] >= row_start]
+        i = 0
+        for row in range(row_start, self._row + 1):
+            while i < len(trades) and trades[i][0] == row:
+                _, size, price = trades[i]
+                state = self._apply_trade(state[0], state[1], state[2], size, price)
+                i += 1
+            self.position[row, col], self.cost_price[row, col], self.realized_pnl[row, col] = state
+
+    def on_trade(self, symbol, size, price, date):
+        """
+        Update position, cost price, realized PnL and cash with one trade.
+        If date is before the current row, rows from date to the current row are updated.
+
+        Parameters
+        ----------
+        symbol : str
+        size : float
+            Signed size in lots, positive for buy and negative for sell.
+        price : float
+        date : int
+
+        """
+        row = self._get_row(date)
+        col = self._symbol_pos[symbol]
+
+        trades = self._trades.setdefault(col, [])
+        if row == self._row:
+            trades.append((row, size, price))
+            (self.position[row, col], self.cost_price[row, col],
+             self.realized_pnl[row, col]) = self._apply_trade(self.position[row, col], self.cost_price[row, col],
+                                                              self.realized_pnl[row, col], size, price)
+        else:
+            # after trades of the same date already recorded
+            i = len(trades)
+            while i > 0 and trades[i - 1][0] > row:
+                i -= 1
+            trades.insert(i, (row, size, price))
+            self._replay(col, row)
+        self.cash[row: self._row + 1] -= price * size * 100
+
+    def finish(self):
+        """Fill rows after the last trade. Call at the end of the backtest."""
+        if len(self.dates):
+            self._get_row(self.dates[-1])
+
+    def get_unrealized_pnl(self, close):
+        """
+        Parameters
+        ----------
+        close : np.ndarray
+            (date x symbol) close prices, NaN is treated as no PnL.
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        pnl = self.position * (close - self.cost_price) * 100
+        return np.where(np.isnan(pnl), 0.0, pnl)
+
+    def get_total_value(self, close):
+        """
+        Cash plus market value of all positions on each date.
+
+        Parameters
+        ----------
+        close : np.ndarray
+            (date x symbol) close prices, NaN is treated as no market value.
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        market_value = self.position * close * 100
+        return self.cash + np.where(np.isnan(market_value), 0.0, market_value).sum(axis=1)
+
+    def to_panel(self):
+        panel = Panel(self.dates, self.symbols)
+        for field in self.FIELDS:
+            panel.set_field(field, getattr(self, field))
+        return panel
+
+    def get_frame(self, field):
+        """
+        Returns
+        -------
+        pd.DataFrame or pd.Series
+            Index is trade date, columns are symbols. A Series for field 'cash'.
+
+        """
+        index = pd.Index(self.dates, name='trade_date')
+        if field == 'cash':
+            return pd.Series(self.cash, index=index, name='cash')
+        return pd.DataFrame(getattr(self, field), index=index, columns=self.symbols)
+
+    def save(self, folder):
+        """
+        Save fields of (date x symbol) as a Panel, cash and init_balance to separate files in folder.
+
+        Parameters
+        ----------
+        folder : str
+
+        """
+        self.to_panel().save(folder)
+        np.save(os.path.join(folder, 'cash.npy'), self.cash)
+        quantos.util.fileio.save_json({'init_balance': self.init_balance}, os.path.join(folder, 'ledger.json'))
+
+    @classmethod
+    def load(cls, folder):
+        """
+        Load ledger saved by save. Trades are not saved, so no more trades can be recorded.
+
+        Returns
+        -------
+        DailyLedger or None
+            None if folder does not contain a ledger.
+
+        """
+        panel = Panel.load(folder, mmap_mode=None)
+        meta = quantos.util.fileio.read_json(os.path.join(folder, 'ledger.json'))
+        if panel is None or meta is None:
+            return None
+
+        res = cls(panel.dates, panel.symbols, init_balance=meta['init_balance'])
+        for field in cls.FIELDS:
+            setattr(res, field, np.array(panel.get_values(field)))
+        res.cash = np.load(os.path.join(folder, 'cash.npy'))
+        res._row = len(res.dates) - 1
+        return res
@@ -9,6 +9,7 @@ from quantos.backtest.event import EventEngine
 from quantos.backtest.pubsub import Subscriber
 from quantos.backtest.event import eventType
 from quantos.backtest.alphastrategy import Strategy
+from quantos.data.basic.marketdata import Bar
 
 
 class EventDrivenStrategy(Strategy, Subscriber):
@@ -34,6 +35,21 @@ class EventDrivenStrategy(Strategy, Subscriber):
     def on_quote(self, quote):
         pass
     
+    def on_bars(self, time, bars):
+        """
+        Called with bars of all symbols at the same time, if props['batch_bars'] is True.
+        Override to process the cross-section at once, by default each bar is passed to on_quote.
+
+        Parameters
+        ----------
+        time : int
+        bars : np.ndarray
+            Structured array, one record per symbol.
+
+        """
+        for quote in Bar.iter_array(bars):
+            self.on_quote(quote)
+    
     @abstractmethod
     def on_cycle(self):
         pass
@@ -0,0 +1,232 @@
+# encoding: utf-8
+"""
+Run alpha backtests of many parameter sets in a pool of worker processes over one DataView.
+
+The DataView is loaded once in the parent process (arrays are memory-mapped if it is loaded
+from a saved folder). Workers are forked from the parent and read the DataView without copying it.
+Each task runs in a new worker, also when n_processes is 1, so changes made to the DataView
+by one backtest (e.g. formulas) are not seen by others.
+
+Usage:
+    def make_strategy(context, props):
+        # create models, register them to context and return the strategy
+        ...
+
+    sweep = AlphaSweep('../output/prepared/test_dataview', make_strategy, props)
+    results = sweep.run([{'period': 'week'}, {'period': 'month', 'days_delay': 2}])
+
+"""
+import multiprocessing
+import os
+import random
+import sys
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from quantos.backtest import model
+from quantos.backtest.backtest import AlphaBacktestInstance_dv
+from quantos.backtest.gateway import DailyStockSimGateway
+from quantos.data.calendar import Calendar
+from quantos.data.dataview import DataView
+
+# objects shared with forked workers, set by AlphaSweep.run before the pool is created
+_shared = dict()
+
+
+class SweepResult(object):
+    """
+    Result of one parameter set.
+
+    Attributes
+    ----------
+    index : int
+        Position of the parameter set in the grid.
+    params : dict
+    seed : int
+        Seed of np.random and random used by this backtest.
+    returns : pd.Series
+        Daily return of total value (positions at close price and cash), index is trade date.
+    metrics : dict
+        total_return, max_drawdown, n_trades and elapsed (seconds).
+    error : str
+        Traceback if the backtest failed, else "".
+
+    """
+    def __init__(self, index, params, seed):
+        self.index = index
+        self.params = params
+        self.seed = seed
+        self.returns = None
+        self.metrics = dict()
+        self.error = ""
+
+    @property
+    def ok(self):
+        return not self.error
+
+    def __repr__(self):
+        if self.ok:
+            status = "total_return = {:.4f}".format(self.metrics['total_return'])
+        else:
+            status = "failed"
+        return "SweepResult({:d}, {}, {})".format(self.index, self.params, status)
+
+
+def _get_performance(strategy, dataview, init_balance):
+    """Daily returns and metrics from the daily ledger of the backtest."""
+    ledger = strategy.pm.ledger
+    # suspended symbols are valued at their last close price
+    df_close = dataview.get_ts('close', start_date=dataview.extended_start_date_d, end_date=dataview.end_date)
+    df_close = df_close.reindex(columns=ledger.symbols).ffill().reindex(index=ledger.dates)
+    ser_value = pd.Series(ledger.get_total_value(df_close.values), index=ledger.dates)
+    returns = ser_value / ser_value.shift(1).fillna(init_balance) - 1
+    metrics = {'total_return': ser_value.iloc[-1] / init_balance - 1 if len(ser_value) else 0.0,
+               'max_drawdown': (ser_value / ser_value.cummax() - 1).min() if len(ser_value) else 0.0,
+               'n_trades': len(strategy.pm.trades)}
+    return returns, metrics
+
+
+def _run_backtest(props):
+    dv = _shared['dataview']
+
+    gateway = DailyStockSimGateway()
+    gateway.init_from_config(props)
+
+    context = model.Context()
+    context.register_calendar(_shared['calendar'])
+    context.register_gateway(gateway)
+    context.register_trade_api(gateway)
+    context.register_dataview(dv)
+
+    strategy = _shared['make_strategy'](context, props)
+
+    bt = AlphaBacktestInstance_dv()
+    bt.init_from_config(props, strategy, context=context)
+    bt.run_alpha()
+
+    return _get_performance(strategy, dv, props['init_balance'])
+
+
+def _run_task(task):
+    """Run one parameter set. Exceptions are caught and stored in the result."""
+    index, params, seed = task
+    result = SweepResult(index, params, seed)
+
+    stdout = sys.stdout
+    start = time.time()
+    try:
+        if _shared['quiet']:
+            sys.stdout = open(os.devnull, 'w')
+        np.random.seed(seed)
+        random.seed(seed)
+
+        props = dict(_shared['base_props'])
+        props.update(params)
+        result.returns, result.metrics = _run_backtest(props)
+    except Exception:
+        result.error = traceback.format_exc()
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+    result.metrics['elapsed'] = time.time() - start
+    return result
+
+
+class AlphaSweep(object):
+    """
+    Run AlphaBacktestInstance_dv for each parameter set of a grid.
+
+    Attributes
+    ----------
+    dataview : DataView
+    make_strategy : callable
+        make_strategy(context, props) -> AlphaStrategy. Create models, register them to context
+        and return the strategy. Called in worker processes.
+    base_props : dict
+        Props shared by all parameter sets, e.g. universe, start_date, end_date, init_balance.
+    calendar : Calendar
+        Default is a calendar of trade dates of dataview, which does not need the data server.
+    n_processes : int
+    seed : int
+        Seed of the first parameter set, the i'th parameter set uses seed + i.
+    quiet : bool
+        Whether to discard output of backtests.
+
+    """
+    def __init__(self, dataview, make_strategy, base_props, calendar=None, n_processes=None, seed=0,
+                 quiet=True):
+        """
+
+        Parameters
+        ----------
+        dataview : DataView or str
+            DataView, or folder of a saved DataView.
+
+        """
+        if not isinstance(dataview, DataView):
+            folder = dataview
+            dataview = DataView()
+            dataview.load_dataview(folder=folder)
+        if calendar is None:
+            calendar = Calendar(trade_dates=dataview.dates)
+        if n_processes is None:
+            n_processes = multiprocessing.cpu_count()
+
+        self.dataview = dataview
+        self.make_strategy = make_strategy
+        self.base_props = base_props
+        self.calendar = calendar
+        self.n_processes = n_processes
+        self.seed = seed
+        self.quiet = quiet
+
+    def run(self, grid, callback=None):
+        """
+        Run backtest of each parameter set.
+
+        Parameters
+        ----------
+        grid : list of dict
+            Each dict updates base_props, e.g. {'period': 'week', 'position_ratio': 0.5}.
+        callback : callable, optional
+            Called with each SweepResult in the parent process once it is finished.
+
+        Returns
+        -------
+        list of SweepResult
+            In the same order as grid.
+
+        """
+        # load trade dates before fork, so that workers do not query them again
+        self.calendar.get_trade_date_range(self.base_props['start_date'], self.base_props['end_date'])
+
+        _shared.update({'dataview': self.dataview,
+                        'make_strategy': self.make_strategy,
+                        'base_props': self.base_props,
+                        'calendar': self.calendar,
+                        'quiet': self.quiet})
+        tasks = [(i, params, self.seed + i) for i, params in enumerate(grid)]
+
+        results = [None] * len(tasks)
+        start = time.time()
+        # a new worker for each task, forked from this process with the DataView loaded
+        pool = multiprocessing.Pool(self.n_processes, maxtasksperchild=1)
+        iter_results = pool.imap_unordered(_run_task, tasks)
+
+        try:
+            for n_done, result in enumerate(iter_results, 1):
+                results[result.index] = result
+                print "Sweep [{:d}/{:d}] {:.1f}s | {} {}".format(n_done, len(tasks), time.time() - start,
+                                                                result.params, 'done' if result.ok else 'failed')
+                if callback is not None:
+                    callback(result)
+        finally:
+            pool.close()
+            pool.join()
+            _shared.clear()
+
+        return results
@@ -0,0 +1,250 @@
+# encoding: utf-8
+"""
+Vectorized backtest of a target weight matrix, used to screen alpha strategies quickly.
+
+It follows the same rules as AlphaBacktestInstance_dv with an AlphaStrategy whose weights are
+given by a (date x symbol) DataFrame (e.g. the 'factor_value_weight' method):
+    - weights of the last trade date before each re-balance date are used;
+    - positions are in lots of 100 shares, cash is computed with close prices and orders are filled at vwap;
+    - positions of suspended symbols are kept;
+    - positions are adjusted for dividends (adjust_factor) on the next re-balance date.
+Instead of Order, Trade and Position objects, all symbols of a re-balance date are processed with
+array operations, and daily PnL is computed for all dates at once.
+
+Usage:
+    bt = WeightBacktest()
+    bt.init_from_config(props, dv, dv.get_ts('close'), calendar)
+    bt.run()
+    bt.trades, bt.daily
+
+"""
+import numpy as np
+import pandas as pd
+
+from quantos.backtest import common
+from quantos.data.calendar import Calendar
+
+
+def _round_half_away(x):
+    """The same as Python 2 built-in round(x, 0)."""
+    return np.sign(x) * np.floor(np.abs(x) + 0.5)
+
+
+def normalize_weights(weights):
+    """
+    Normalize raw weights of each date in the same way as AlphaStrategy.portfolio_construction:
+    NaN is 0, weights are shifted by 2 * abs(minimum) and divided by sum of absolute values.
+
+    Parameters
+    ----------
+    weights : np.ndarray
+        2-D, one row per date.
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    w = np.where(np.isnan(weights), 0.0, weights)
+    delta = 2 * np.abs(w.min(axis=1, keepdims=True))
+    w = w + delta
+    w_sum = np.abs(w).sum(axis=1, keepdims=True)
+    return np.where(w_sum > 1e-8, w / np.where(w_sum > 1e-8, w_sum, 1.0), w)
+
+
+class WeightBacktest(object):
+    """
+    Vectorized backtest of target weights with close price cash accounting and vwap fills.
+
+    Attributes
+    ----------
+    dataview : DataView
+        Must have daily fields close, vwap, adjust_factor and trade_status.
+    weights : pd.DataFrame
+        Raw target weights, index is trade date, column is symbol.
+    calendar : Calendar
+    symbols : list of str
+    rebalance_dates : np.ndarray
+    positions : pd.DataFrame
+        Positions (lots) after trading on each re-balance date.
+    total_value : pd.Series
+        Market value of positions (not suspended) plus cash before trading on each re-balance date.
+    trades : pd.DataFrame
+        Columns are symbol, entrust_action, fill_price, fill_size, fill_date, fill_time.
+        Position adjustments for dividends are trades of price 0.0 on ex-dates.
+    daily : pd.DataFrame
+        Index is trade date, columns are position_value, turnover, cost and pnl.
+
+    """
+    def __init__(self):
+        self.dataview = None
+        self.weights = None
+        self.calendar = None
+
+        self.start_date = 0
+        self.end_date = 0
+        self.period = ""
+        self.days_delay = 0
+        self.init_balance = 0.0
+        self.position_ratio = 0.0
+        self.commission_rate = 0.0
+
+        self.symbols = None
+        self.rebalance_dates = None
+        self.positions = None
+        self.total_value = None
+        self.trades = None
+        self.daily = None
+
+    def init_from_config(self, props, dataview, weights, calendar=None):
+        """
+
+        Parameters
+        ----------
+        props : dict
+            start_date, end_date, period, days_delay, init_balance and position_ratio, the same as AlphaStrategy.
+            commission_rate (optional, default 0.0) is the cost of each trade relative to turnover.
+        dataview : DataView
+        weights : pd.DataFrame
+        calendar : Calendar, optional
+
+        """
+        self.start_date = props['start_date']
+        self.end_date = props['end_date']
+        self.period = props['period']
+        self.days_delay = props['days_delay']
+        self.init_balance = props['init_balance']
+        self.position_ratio = props['position_ratio']
+        self.commission_rate = props.get('commission_rate', 0.0)
+
+        self.dataview = dataview
+        self.weights = weights
+        self.calendar = calendar if calendar is not None else Calendar()
+        self.symbols = list(dataview.symbol)
+
+    def _get_suspensions(self, date):
+        dv = self.dataview
+        field = dv.TRADE_STATUS_FIELD_NAME
+        codes = dv.get_snapshot_codes(date, field)
+        return codes != dv.get_category_code(field, dv.TRADE_STATUS_TRADING)
+
+    @staticmethod
+    def _get_adjust_ratios(pos, adj_factor):
+        """
+        Cumulative ratio of position on each date, when positions are only adjusted if they increase.
+
+        Parameters
+        ----------
+        pos : np.ndarray
+            Positions of each symbol.
+        adj_factor : np.ndarray
+            Adjust factors from the last re-balance date to this re-balance date.
+
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = adj_factor[1:] / adj_factor[:-1]
+        ratio = np.where(np.isnan(ratio), 1.0, ratio)
+        ratio = np.where(pos > 0, np.maximum(ratio, 1.0), np.where(pos < 0, np.minimum(ratio, 1.0), 1.0))
+        return np.cumprod(ratio, axis=0)
+
+    def run(self):
+        dv = self.dataview
+        symbols = self.symbols
+        n_symbols = len(symbols)
+
+        reb_dates = self.calendar.get_rebalance_dates(self.start_date, self.end_date, self.period, self.days_delay)
+        signal_dates = self.calendar.get_last_trade_dates(reb_dates)
+        weights = normalize_weights(self.weights.reindex(index=signal_dates, columns=symbols).values)
+
+        df_adj = dv.get_ts('adjust_factor', start_date=self.start_date, end_date=self.end_date)
+        dates = df_adj.index.values
+        adj_factor = df_adj.loc[:, symbols].values
+        prices = {field: dv.get_ts(field, start_date=self.start_date, end_date=self.end_date).loc[:, symbols].values
+                  for field in ['close', 'vwap']}
+        reb_idx = np.searchsorted(dates, reb_dates)
+
+        # signed size of position adjustments, signed size and fill price of trades on each date
+        adjust_size = np.zeros((len(dates), n_symbols))
+        trade_size = np.zeros((len(dates), n_symbols))
+        trade_price = np.zeros((len(dates), n_symbols))
+
+        pos = np.zeros(n_symbols)
+        cash = self.init_balance
+        last_idx = 0
+        positions = np.empty((len(reb_dates), n_symbols))
+        total_value = np.empty(len(reb_dates))
+        for k, idx in enumerate(reb_idx):
+            # position adjustment for dividends after the last re-balance date
+            cum_ratio = self._get_adjust_ratios(pos, adj_factor[last_idx: idx + 1])
+            if len(cum_ratio):
+                adjust_size[last_idx + 1: idx + 1] = pos * np.diff(np.vstack([np.ones(n_symbols), cum_ratio]), axis=0)
+                pos = pos * cum_ratio[-1]
+            last_idx = idx
+
+            close = prices['close'][idx]
+            is_sus = self._get_suspensions(reb_dates[k])
+
+            # market value does not include those suspended
+            is_valued = (pos != 0) & ~is_sus
+            market_value = np.sum(close[is_valued] * pos[is_valued]) * 100
+            cash_available = cash + market_value
+            total_value[k] = cash_available
+            cash_use = cash_available * self.position_ratio
+            cash_unuse = cash_available - cash_use
+
+            # position of those suspended will remain the same
+            w = weights[k]
+            is_traded = ~is_sus & (np.abs(w) >= 1e-8)
+            goal = np.where(is_sus, pos, 0.0)
+            goal[is_traded] = _round_half_away(w[is_traded] * cash_use / close[is_traded] / 100.)
+            cash_used = np.sum(goal[is_traded] * close[is_traded] * 100)
+            cash = cash_use - cash_used + cash_unuse
+
+            trade_size[idx] = goal - pos
+            trade_price[idx] = prices['vwap'][idx]
+            pos = goal
+            positions[k] = pos
+
+        self.rebalance_dates = reb_dates
+        self.positions = pd.DataFrame(positions, index=reb_dates, columns=symbols)
+        self.total_value = pd.Series(total_value, index=reb_dates)
+        self.trades = self._get_trades(dates, adjust_size, trade_size, trade_price)
+        self.daily = self._get_daily(dates, adjust_size, trade_size, trade_price, prices['close'])
+
+    def _get_trades(self, dates, adjust_size, trade_size, trade_price):
+        dfs = []
+        actions = np.array([common.ORDER_ACTION.SELL, common.ORDER_ACTION.BUY], dtype=object)
+        for size_mat, price_mat in [(adjust_size, np.zeros_like(trade_price)), (trade_size, trade_price)]:
+            rows, cols = np.nonzero(size_mat)
+            size = size_mat[rows, cols]
+            dfs.append(pd.DataFrame({'symbol': np.array(self.symbols)[cols],
+                                     'entrust_action': actions[(size > 0).astype(int)],
+                                     'fill_price': price_mat[rows, cols],
+                                     'fill_size': np.abs(size),
+                                     'fill_date': dates[rows],
+                                     'fill_time': 0},
+                                    columns=['symbol', 'entrust_action', 'fill_price', 'fill_size',
+                                             'fill_date', 'fill_time']))
+        df = pd.concat(dfs, axis=0).sort_values(by=['fill_date', 'symbol'], kind='mergesort')
+        return df.reset_index(drop=True)
+
+    def _get_daily(self, dates, adjust_size, trade_size, trade_price, close):
+        """Mark positions to market with close prices and subtract costs, for all dates at once."""
+        close = np.where(np.isnan(close), 0.0, close)
+        # shares of position adjustments have no cost
+        trade_size = trade_size + adjust_size
+        pos = np.cumsum(trade_size, axis=0)
+        pos_last = np.vstack([np.zeros((1, pos.shape[1])), pos[:-1]])
+        close_last = np.vstack([close[:1], close[:-1]])
+
+        turnover = np.sum(np.abs(trade_size) * trade_price, axis=1) * 100
+        cost = turnover * self.commission_rate
+        holding_pnl = np.sum(pos_last * (close - close_last), axis=1) * 100
+        trading_pnl = np.sum(trade_size * (close - trade_price), axis=1) * 100
+
+        df = pd.DataFrame({'position_value': np.sum(pos * close, axis=1) * 100,
+                           'turnover': turnover,
+                           'cost': cost,
+                           'pnl': holding_pnl + trading_pnl - cost},
+                          index=dates, columns=['position_value', 'turnover', 'cost', 'pnl'])
+        return df
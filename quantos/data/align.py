@@ -41,6 +41,89 @@ def get_neareast(df_ann, df_value, date):
     return res
     
 
+def get_asof_index(df_ann, date_arr):
+    """
+    For each target date and security, get row position of the record whose ann_date is earlier and nearest to date.
+    All securities and dates are processed in one pass using np.searchsorted.
+    
+    Parameters
+    ----------
+    df_ann : pd.DataFrame or np.ndarray
+        Announcement dates. shape = (n_quarters, n_securities)
+    date_arr : list or np.array
+        Target date array. dtype = int
+
+    Returns
+    -------
+    idx : np.ndarray
+        Row positions in df_ann. shape = (n_days, n_securities), dtype = int
+        -1 where no record has been announced yet.
+
+    """
+    if isinstance(df_ann, pd.DataFrame):
+        df_ann = df_ann.values
+    ann = np.asarray(df_ann, dtype=float)
+    ann = np.where(np.isnan(ann), 99999999, ann).astype(np.int64)  # never announced
+    date_arr = np.asarray(date_arr, dtype=np.int64)
+    
+    n_quarters, n_securities = ann.shape
+    n_days = len(date_arr)
+    if n_quarters == 0 or n_securities == 0:
+        return -np.ones((n_days, n_securities), dtype=int)
+    
+    cols = np.arange(n_securities)
+    
+    # sort announcement dates of each security, ties keep report order
+    order = np.argsort(ann, axis=0, kind='mergesort')
+    ann_sorted = ann[order, cols]
+    # the last row (in report order) among records announced no later than the k'th sorted ann_date
+    row_latest = np.maximum.accumulate(order, axis=0)
+    
+    # shift each security into a disjoint range, so that one searchsorted covers all securities
+    stride = 10 ** 9  # larger than any date in %Y%m%d format
+    offset = cols.astype(np.int64) * stride
+    keys = (ann_sorted + offset).T.ravel()
+    queries = date_arr.reshape(-1, 1) + offset
+    n_announced = np.searchsorted(keys, queries.ravel(), side='right').reshape(n_days, n_securities)
+    n_announced -= cols * n_quarters
+    
+    mask = n_announced > 0
+    idx = row_latest[np.where(mask, n_announced - 1, 0), cols]
+    idx[~mask] = -1
+    return idx
+
+
+def take_asof(values, idx):
+    """
+    Gather values using row positions given by get_asof_index.
+    
+    Parameters
+    ----------
+    values : np.ndarray
+        shape = (n_quarters, n_securities)
+    idx : np.ndarray
+        shape = (n_days, n_securities), -1 means no value.
+
+    Returns
+    -------
+    res : np.ndarray
+        shape = (n_days, n_securities)
+
+    """
+    values = np.asarray(values)
+    mask = idx < 0
+    if values.shape[0] == 0:
+        return np.full(idx.shape, np.nan)
+    
+    cols = np.arange(idx.shape[1])
+    res = values[np.where(mask, 0, idx), cols]
+    if mask.any():
+        if res.dtype.kind in 'biu':
+            res = res.astype(float)
+        res[mask] = np.nan
+    return res
+
+
 def align(df_value, df_ann, date_arr):
     """
     Expand low frequency DataFrame df_value to frequency of data_arr using announcement date from df_ann.
@@ -60,16 +143,43 @@ def align(df_value, df_ann, date_arr):
         Expanded DataFrame. shape = (n_days, n_securities)
 
     """
-    df_ann = df_ann.fillna(99999999).astype(int)
-    
     date_arr = np.asarray(date_arr, dtype=int)
     
-    res = np.apply_along_axis(lambda date: get_neareast(df_ann.values, df_value.values, date), 1, date_arr.reshape(-1, 1))
+    idx = get_asof_index(df_ann, date_arr)
+    res = take_asof(df_value.values, idx)
 
     df_res = pd.DataFrame(index=date_arr, columns=df_value.columns, data=res)
     return df_res
 
 
+def align_batch(dic_value, df_ann, date_arr):
+    """
+    Expand several low frequency DataFrames which share the same announcement dates.
+    Row positions are searched only once for all of them.
+    
+    Parameters
+    ----------
+    dic_value : dict of {str: pd.DataFrame}
+        DataFrames of announcement values. shape = (n_quarters, n_securities)
+    df_ann : pd.DataFrame
+        DataFrame of announcement dates. shape = (n_quarters, n_securities)
+    date_arr : list or np.array
+        Target date array. dtype = int
+
+    Returns
+    -------
+    res : dict of {str: pd.DataFrame}
+        Expanded DataFrames. shape = (n_days, n_securities)
+
+    """
+    date_arr = np.asarray(date_arr, dtype=int)
+    
+    idx = get_asof_index(df_ann, date_arr)
+    res = {key: pd.DataFrame(index=date_arr, columns=df.columns, data=take_asof(df.values, idx))
+           for key, df in dic_value.viewitems()}
+    return res
+
+
 def demo_usage():
     # -------------------------------------------------------------------------------------
     # input and pre-process demo data
@@ -1,7 +1,12 @@
 # encoding: utf-8
 
+import numpy as np
+
 
 class Bar(object):
+    # (row class, constructor) of rows, keyed by (class, field names of structured array)
+    _row_types = dict()
+    
     def __init__(self):
         self.open = 0.
         self.close = 0.
@@ -22,3 +27,99 @@ class Bar(object):
             
             bar_list.append(bar)
         return bar_list
+    
+    @staticmethod
+    def create_array_from_df(df):
+        """
+        Convert DataFrame of bars to a structured array, one record per bar.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Columns are fields of bar (symbol, time, open, high, ...).
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        return df.to_records(index=False)
+    
+    @classmethod
+    def _get_row_type(cls, names):
+        """
+        Get a subclass of Bar whose fields are stored in __slots__, and a function making one from a tuple.
+        Field names must be valid identifiers, otherwise TypeError is raised.
+
+        """
+        key = (cls, names)
+        res = cls._row_types.get(key, None)
+        if res is None:
+            # default fields of Bar are included if they are not in the array
+            defaults = tuple(sorted(name for name in cls().__dict__.keys() if name not in names))
+            fields = names + defaults
+            row_type = type('BarRow', (cls,), {'__slots__': fields})
+            
+            # assign slots through their descriptors, without calling __init__ or creating __dict__
+            new = object.__new__
+            setters = tuple(row_type.__dict__[name].__set__ for name in fields)
+            
+            def make(row):
+                bar = new(row_type)
+                for setter, value in zip(setters, row):
+                    setter(bar, value)
+                return bar
+            
+            res = (row_type, make)
+            cls._row_types[key] = res
+        return res
+    
+    @classmethod
+    def iter_array(cls, bars):
+        """
+        Iterate over a structured array of bars.
+        Each bar is an instance of a Bar subclass with fields in __slots__, so no dict is created per bar.
+        Attributes can be set as on Bar.
+
+        Parameters
+        ----------
+        bars : np.ndarray
+            Structured array returned by create_array_from_df.
+
+        Yields
+        ------
+        Bar
+
+        """
+        names = bars.dtype.names
+        row_type, make = cls._get_row_type(names)
+        default_bar = cls()
+        defaults = tuple(getattr(default_bar, name) for name in row_type.__slots__[len(names):])
+        # tolist() converts a whole column to Python objects in one call
+        columns = [bars[name].tolist() for name in names]
+        for row in zip(*columns):
+            yield make(row + defaults)
+    
+    @staticmethod
+    def split_by_time(bars):
+        """
+        Split a structured array of bars sorted by time into cross-sections.
+
+        Parameters
+        ----------
+        bars : np.ndarray
+            Structured array with field 'time', sorted by time.
+
+        Yields
+        ------
+        tuple of (int, np.ndarray)
+            Time and bars of all symbols at this time (a view of bars).
+
+        """
+        times = bars['time']
+        if len(times) == 0:
+            return
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(times)) + 1])
+        ends = np.append(starts[1:], len(times))
+        for start, end in zip(starts, ends):
+            yield times[start], bars[start:end]
@@ -43,6 +43,12 @@ class Order(object):
     -------
 
     """
+    __slots__ = ('task_id', 'entrust_no', 'symbol',
+                 'entrust_action', 'entrust_price', 'entrust_size', 'entrust_date', 'entrust_time',
+                 'sub_seq', 'sub_total', 'batch_no',
+                 'order_status', 'fill_price', 'fill_size',
+                 'algo', 'order_type', 'time_in_force',
+                 'errmsg', 'cancel_size')
     
     def __init__(self):
         self.task_id = ""
@@ -89,33 +95,8 @@ class Order(object):
         return self.__repr__()
 
     def copy(self, order):
-        self.task_id = order.task_id
-        self.entrust_no = order.entrust_no
-        
-        self.symbol = order.symbol
-        
-        self.entrust_action = order.entrust_action
-        self.entrust_price = order.entrust_price
-        self.entrust_size = order.entrust_size
-        self.entrust_date = order.entrust_date
-        self.entrust_time = order.entrust_time
-        
-        self.sub_seq = order.sub_seq
-        self.sub_total = order.sub_total
-        self.batch_no = order.batch_no
-        
-        self.order_status = order.order_status
-        self.fill_size = order.fill_size
-        self.fill_price = order.fill_price
-        
-        self.algo = order.algo
-        
-        self.order_type = order.order_type
-        self.time_in_force = order.time_in_force
-        
-        self.cancel_size = order.cancel_size
-        self.entrust_no = order.entrust_no
-        self.errmsg = order.errmsg
+        for name in Order.__slots__:
+            setattr(self, name, getattr(order, name))
     
     @property
     def is_finished(self):
@@ -150,6 +131,7 @@ class FixedPriceTypeOrder(Order):
     -------
 
     """
+    __slots__ = ('price_target',)
     
     def __init__(self, target=""):
         Order.__init__(self)
@@ -171,6 +153,7 @@ class VwapOrder(Order):
         The end of matching time range.
 
     """
+    __slots__ = ('start', 'end')
     
     def __init__(self, start=-1, end=-1):
         Order.__init__(self)
@@ -185,4 +168,4 @@ class VwapOrder(Order):
 
 if __name__ == "__main__":
     order = FixedPriceTypeOrder.new_order('cu', 'buy', 1.0, 100, 20170505, 130524)
-    print order.__dict__
+    print order
@@ -36,6 +36,10 @@ class Position(object):
     -------
 
     """
+    __slots__ = ('symbol', 'side', 'cost_price',
+                 'close_pnl', 'float_pnl', 'trading_pnl', 'holding_pnl',
+                 'enable_size', 'frozen_size', 'want_size',
+                 'today_size', 'pre_size', 'curr_size', 'init_size')
     
     def __init__(self):
         self.symbol = ""
@@ -79,6 +83,7 @@ class GoalPosition(object):
         The urgency to adjust position, used to determine trading algorithm.
 
     """
+    __slots__ = ('symbol', 'ref_price', 'size', 'urgency')
     
     def __init__(self):
         self.symbol = ""
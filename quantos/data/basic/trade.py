@@ -1,5 +1,7 @@
 # encoding:utf-8
 
+import numpy as np
+
 
 class Trade(object):
     """
@@ -25,6 +27,9 @@ class Trade(object):
 
 
     """
+    __slots__ = ('task_id', 'entrust_no', 'entrust_action', 'symbol',
+                 'fill_price', 'fill_size', 'fill_date', 'fill_time', 'fill_no',
+                 'order_price', 'order_size', 'refquote', 'refcode')
     
     def __init__(self):
         self.task_id = ""
@@ -69,3 +74,141 @@ class Trade(object):
     
     def __str__(self):
         return self.__repr__()
+
+
+class TradeBatch(object):
+    """
+    Columnar batch of trades, e.g. all fills of one day.
+    
+    Each column is a np.ndarray with one element per trade and has the same name as
+    the attribute of Trade. Trade objects are only created when the batch is iterated.
+
+    Attributes
+    ----------
+    task_id : np.ndarray
+    entrust_no : np.ndarray
+    entrust_action : np.ndarray
+    symbol : np.ndarray
+    fill_price : np.ndarray
+    fill_size : np.ndarray
+    fill_date : np.ndarray
+    fill_time : np.ndarray
+    fill_no : np.ndarray
+
+    """
+    COLUMNS = ('task_id', 'entrust_no', 'entrust_action', 'symbol',
+               'fill_price', 'fill_size', 'fill_date', 'fill_time', 'fill_no')
+    
+    def __init__(self, **columns):
+        n = len(next(iter(columns.values()))) if columns else 0
+        for col in self.COLUMNS:
+            value = columns.get(col, None)
+            if value is None:
+                value = np.empty(n, dtype=object)
+            if len(value) != n:
+                raise ValueError("length of column {} is {}, expected {}".format(col, len(value), n))
+            setattr(self, col, value)
+    
+    def __len__(self):
+        return len(self.fill_price)
+    
+    def __iter__(self):
+        # tolist() converts numpy scalars to Python objects in one call
+        columns = [getattr(self, col).tolist() for col in self.COLUMNS]
+        for row in zip(*columns):
+            trade = Trade()
+            for col, value in zip(self.COLUMNS, row):
+                setattr(trade, col, value)
+            yield trade
+    
+    def to_trades(self):
+        """
+        Returns
+        -------
+        list of Trade
+
+        """
+        return list(iter(self))
+
+
+class TradeLog(object):
+    """
+    Columnar log of trades, used as PortfolioManager.trades.
+    
+    Values of each column of TradeBatch are appended to a list. The log can be iterated
+    and indexed like a list of Trade, Trade objects are only created on access.
+
+    """
+    COLUMNS = TradeBatch.COLUMNS
+    DTYPES = {'task_id': str,
+              'entrust_no': str,
+              'entrust_action': str,
+              'symbol': str,
+              'fill_price': float,
+              'fill_size': int,
+              'fill_date': int,
+              'fill_time': int,
+              'fill_no': str}
+    
+    def __init__(self):
+        self._columns = {col: [] for col in self.COLUMNS}
+    
+    def append(self, trade):
+        for col in self.COLUMNS:
+            self._columns[col].append(getattr(trade, col))
+    
+    def extend(self, trades):
+        """
+        Parameters
+        ----------
+        trades : TradeBatch or iterable of Trade
+
+        """
+        if isinstance(trades, TradeBatch):
+            for col in self.COLUMNS:
+                self._columns[col].extend(getattr(trades, col).tolist())
+        else:
+            for trade in trades:
+                self.append(trade)
+    
+    def __len__(self):
+        return len(self._columns['fill_no'])
+    
+    def _make_trade(self, row):
+        trade = Trade()
+        for col, value in zip(self.COLUMNS, row):
+            setattr(trade, col, value)
+        return trade
+    
+    def __getitem__(self, i):
+        return self._make_trade([self._columns[col][i] for col in self.COLUMNS])
+    
+    def __iter__(self):
+        for row in zip(*[self._columns[col] for col in self.COLUMNS]):
+            yield self._make_trade(row)
+    
+    def get_column(self, col):
+        """
+        Returns
+        -------
+        list
+            Values of one attribute of all trades. Do not modify it.
+
+        """
+        return self._columns[col]
+    
+    def to_dataframe(self):
+        """
+        Returns
+        -------
+        pd.DataFrame
+            One row per trade, columns are sorted names in COLUMNS.
+
+        """
+        import pandas as pd
+        
+        data = {col: pd.Series(data=self._columns[col], dtype=dtype, name=col)
+                for col, dtype in self.DTYPES.viewitems()}
+        df = pd.DataFrame(data)
+        df.index.name = 'index'
+        return df
@@ -0,0 +1,209 @@
+# encoding: utf-8
+"""
+Persistent local cache of query results of RemoteDataService.
+"""
+import os
+import time
+import datetime
+import hashlib
+import threading
+import cPickle as pickle
+
+
+class QueryCache(object):
+    """
+    On-disk cache of query results, one pickle file per entry.
+    When total size exceeds max_size, least recently used entries are removed.
+
+    Attributes
+    ----------
+    folder : str
+    max_size : int
+        Max total size of cache files in bytes.
+    ttl : dict of {str: float or None}
+        Time to live (seconds) of entries of each view. None means never expire.
+    default_ttl : float or None
+        Time to live of views not in ttl.
+    recent_ttl : float
+        Time to live of entries whose end_date is not earlier than today, because their data may be incomplete.
+    hits, misses : int
+
+    """
+    DEFAULT_TTL = {'jz.secTradeCal': None,
+                   'jsd.query': None,
+                   'lb.secAdjFactor': 24 * 3600,
+                   'lb.secIndustry': 24 * 3600,
+                   'lb.indexCons': 24 * 3600}
+
+    def __init__(self, folder, max_size=2 * 1024 ** 3, ttl=None, default_ttl=24 * 3600, recent_ttl=3600):
+        self.folder = folder
+        self.max_size = max_size
+        self.ttl = dict(self.DEFAULT_TTL)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.default_ttl = default_ttl
+        self.recent_ttl = recent_ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self._size = sum(size for _, _, size in self._list_entries())
+
+    @staticmethod
+    def make_key(view, **kwargs):
+        """
+        Get key of a query.
+
+        Parameters
+        ----------
+        view : str
+        kwargs
+            All other arguments that determine result of the query, e.g. filter, fields, adjust_mode.
+
+        Returns
+        -------
+        str
+
+        """
+        s = repr((view, sorted((k, str(v)) for k, v in kwargs.viewitems())))
+        return hashlib.sha1(s).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.pkl')
+
+    def _list_entries(self):
+        """list of (path, last access time, size)"""
+        res = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:  # removed by another process
+                continue
+            res.append((path, st.st_mtime, st.st_size))
+        return res
+
+    def _get_ttl(self, view, end_date):
+        ttl = self.ttl.get(view, self.default_ttl)
+        if end_date is not None:
+            today = int(datetime.date.today().strftime('%Y%m%d'))
+            if int(end_date) >= today:
+                ttl = self.recent_ttl if ttl is None else min(ttl, self.recent_ttl)
+        return ttl
+
+    def get(self, key):
+        """
+        Get cached value. Return None if not found or expired.
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        value : object or None
+
+        """
+        path = self._path(key)
+        entry = None
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            pass
+
+        if entry is not None and entry['ttl'] is not None and time.time() - entry['time'] > entry['ttl']:
+            self._remove(path)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        try:
+            os.utime(path, None)  # mark as recently used
+        except OSError:
+            pass
+        return entry['value']
+
+    def put(self, view, key, value, end_date=None):
+        """
+        Store value.
+
+        Parameters
+        ----------
+        view : str
+            Used to decide time to live.
+        key : str
+        value : object
+            Must be picklable.
+        end_date : int, optional
+            Last date of data in value, if any.
+
+        """
+        entry = {'time': time.time(), 'ttl': self._get_ttl(view, end_date), 'view': view, 'value': value}
+        path = self._path(key)
+
+        # write to a temporary file first, so that other processes never read a partial file
+        tmp_path = '{:s}.{:d}.{:d}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+        try:
+            old_size = os.path.getsize(path)  # the entry is overwritten
+        except OSError:
+            old_size = 0
+        os.rename(tmp_path, path)
+
+        with self._lock:
+            self._size += size - old_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def _evict(self):
+        """Remove least recently used entries until total size is no more than max_size. Caller holds the lock."""
+        entries = sorted(self._list_entries(), key=lambda x: x[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """Remove all entries."""
+        for path, _, _ in self._list_entries():
+            self._remove(path)
+        with self._lock:
+            self._size = 0
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            hits, misses, size (bytes)
+
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': self._size}
@@ -1,9 +1,9 @@
 # encoding: utf-8
 
+import os
 import datetime
 
 import numpy as np
-import pandas as pd
 
 from quantos.data.dataservice import RemoteDataService
 from quantos.util import dtutil
@@ -12,24 +12,104 @@ from quantos.util import dtutil
 class Calendar(object):
     """
     A calendar for manage trade date.
-    
+    All trade dates are loaded once (from data_api or a local file), then kept in memory.
+    Navigation uses binary search on the sorted trade date array.
+
     Attributes
     ----------
     data_api :
+    file_path : str
+        If not empty, trade dates are loaded from / saved to this .npy file.
 
     """
-    
-    def __init__(self, data_api=None):
-        if data_api is None:
+    # range of trade dates to load
+    START_DATE = 19900101
+    N_YEARS_AHEAD = 1
+
+    def __init__(self, data_api=None, file_path="", trade_dates=None):
+        """
+
+        Parameters
+        ----------
+        data_api : RemoteDataService, optional
+        file_path : str, optional
+            .npy file to persist trade dates.
+        trade_dates : array-like, optional
+            If provided, use these trade dates and never query data_api.
+
+        """
+        self.file_path = file_path
+        self._dates = None
+        self._reloaded = False
+        self._is_fixed = trade_dates is not None
+        if self._is_fixed:
+            self._dates = np.sort(np.asarray(trade_dates, dtype=int))
+            self.data_api = data_api
+        elif data_api is None:
             self.data_api = RemoteDataService()
         else:
             self.data_api = data_api
 
+    def _query_trade_date_range(self, begin, end):
+        filter_argument = self.data_api._dic2url({'start_date': begin,
+                                                  'end_date': end})
+
+        df_raw, msg = self.data_api.query("jz.secTradeCal", fields="trade_date",
+                                          filter=filter_argument, orderby="")
+        if df_raw.empty:
+            return np.array([], dtype=int)
+
+        trade_dates_arr = df_raw['trade_date'].values.astype(int)
+        return np.unique(trade_dates_arr)
+
+    def _load(self, reload_=False):
+        """Load all trade dates. Use local file if available, unless reload_ is True."""
+        if self.file_path and not reload_ and os.path.exists(self.file_path):
+            self._dates = np.load(self.file_path)
+            return
+
+        end = datetime.date.today().year + self.N_YEARS_AHEAD
+        self._dates = self._query_trade_date_range(self.START_DATE, end * 10000 + 1231)
+
+        if self.file_path:
+            dir_name = os.path.dirname(os.path.abspath(self.file_path))
+            if not os.path.exists(dir_name):
+                os.makedirs(dir_name)
+            np.save(self.file_path, self._dates)
+
+    def _ensure_loaded(self, date=None):
+        """
+        Load trade dates for the first call.
+        Load again if date is later than the last loaded trade date (e.g. an outdated local file).
+
+        """
+        if self._dates is None:
+            self._load()
+        if (date is not None and not self._is_fixed
+                and len(self._dates) and np.max(date) > self._dates[-1]
+                and not self._reloaded):
+            self._reloaded = True
+            self._load(reload_=True)
+
+    @property
+    def trade_dates(self):
+        """
+        All trade dates.
+
+        Returns
+        -------
+        np.ndarray
+            dtype = int
+
+        """
+        self._ensure_loaded()
+        return self._dates
+
     def get_trade_date_range(self, begin, end):
         """
         Get array of trade dates within given range.
         Return zero size array if no trade dates within range.
-        
+
         Parameters
         ----------
         begin : int
@@ -42,20 +122,14 @@ class Calendar(object):
             dtype = int
 
         """
-        filter_argument = self.data_api._dic2url({'start_date': begin,
-                                                  'end_date': end})
-
-        df_raw, msg = self.data_api.query("jz.secTradeCal", fields="trade_date",
-                                          filter=filter_argument, orderby="")
-        if df_raw.empty:
-            return np.array([], dtype=int)
-
-        trade_dates_arr = df_raw['trade_date'].values.astype(int)
-        return trade_dates_arr
+        self._ensure_loaded(end)
+        i_begin = np.searchsorted(self._dates, begin, side='left')
+        i_end = np.searchsorted(self._dates, end, side='right')
+        return self._dates[i_begin: i_end].copy()
 
     def get_last_trade_date(self, date):
         """
-        
+
         Parameters
         ----------
         date : int
@@ -65,16 +139,7 @@ class Calendar(object):
         res : int
 
         """
-        dt = dtutil.convert_int_to_datetime(date)
-        delta = pd.Timedelta(weeks=2)
-        dt_old = dt - delta
-        date_old = dtutil.convert_datetime_to_int(dt_old)
-        
-        dates = self.get_trade_date_range(date_old, date)
-        mask = dates < date
-        res = dates[mask][-1]
-        
-        return res
+        return int(self.get_last_trade_dates(date))
 
     def is_trade_date(self, date):
         """
@@ -89,12 +154,13 @@ class Calendar(object):
         bool
 
         """
-        dates = self.get_trade_date_range(date, date)
-        return len(dates) > 0
+        self._ensure_loaded(date)
+        i = np.searchsorted(self._dates, date)
+        return bool(i < len(self._dates) and self._dates[i] == date)
 
     def get_next_trade_date(self, date):
         """
-        
+
         Parameters
         ----------
         date : int
@@ -104,13 +170,140 @@ class Calendar(object):
         res : int
 
         """
-        dt = dtutil.convert_int_to_datetime(date)
-        delta = pd.Timedelta(weeks=2)
-        dt_new = dt + delta
-        date_new = dtutil.convert_datetime_to_int(dt_new)
-    
-        dates = self.get_trade_date_range(date, date_new)
-        mask = dates > date
-        res = dates[mask][0]
-    
+        return int(self.get_next_trade_dates(date))
+
+    def _take(self, idx):
+        if np.any(idx < 0) or np.any(idx >= len(self._dates)):
+            raise IndexError("Trade date out of range [{:d}, {:d}]".format(self._dates[0], self._dates[-1]))
+        return self._dates[idx]
+
+    def get_next_trade_dates(self, dates):
+        """
+        Get the first trade date after each date.
+
+        Parameters
+        ----------
+        dates : int or array-like
+
+        Returns
+        -------
+        res : int or np.ndarray
+
+        """
+        return self.shift_trade_date(dates, 1)
+
+    def get_last_trade_dates(self, dates):
+        """
+        Get the last trade date before each date.
+
+        Parameters
+        ----------
+        dates : int or array-like
+
+        Returns
+        -------
+        res : int or np.ndarray
+
+        """
+        return self.shift_trade_date(dates, -1)
+
+    def shift_trade_date(self, dates, n):
+        """
+        Get the n'th trade date after (n > 0) or before (n < 0) each date.
+        n = 0 gives the date itself if it is a trade date, else the next trade date.
+
+        Parameters
+        ----------
+        dates : int or array-like
+        n : int
+
+        Returns
+        -------
+        res : int or np.ndarray
+
+        """
+        dates = np.asarray(dates, dtype=int)
+        self._ensure_loaded(dates)
+
+        if n > 0:
+            idx = np.searchsorted(self._dates, dates, side='right') + n - 1
+        elif n < 0:
+            idx = np.searchsorted(self._dates, dates, side='left') + n
+        else:
+            idx = np.searchsorted(self._dates, dates, side='left')
+        return self._take(idx)
+
+    def count_trade_dates(self, begin, end):
+        """
+        Number of trade dates within [begin, end]. Vectorized on both arguments.
+
+        Parameters
+        ----------
+        begin : int or array-like
+        end : int or array-like
+
+        Returns
+        -------
+        int or np.ndarray
+
+        """
+        self._ensure_loaded(end)
+        return (np.searchsorted(self._dates, end, side='right')
+                - np.searchsorted(self._dates, begin, side='left'))
+
+    def get_next_rebalance_dates(self, dates, period, days_delay):
+        """
+        Get the next re-balance date of each date: the first trade date after
+        the days_delay'th business day in next period.
+
+        Parameters
+        ----------
+        dates : int or array-like
+        period : str
+            {'day', 'week', 'month'}
+        days_delay : int
+
+        Returns
+        -------
+        res : int or np.ndarray
+
+        """
+        next_period_days = dtutil.get_next_period_day(dates, period, days_delay)
+        res = self.shift_trade_date(next_period_days, 1)
+        if np.ndim(res) == 0:
+            return int(res)
         return res
+
+    def get_rebalance_dates(self, start_date, end_date, period, days_delay):
+        """
+        Get all re-balance dates within (start_date, end_date], beginning from start_date.
+
+        Parameters
+        ----------
+        start_date : int
+        end_date : int
+        period : str
+            {'day', 'week', 'month'}
+        days_delay : int
+
+        Returns
+        -------
+        res : np.ndarray
+            dtype = int
+
+        """
+        self._ensure_loaded(end_date)
+        dates = np.union1d([start_date], self.get_trade_date_range(start_date, end_date))
+        
+        # next re-balance date of each date, computed at once
+        idx_next = np.searchsorted(self._dates, dtutil.get_next_period_day(dates, period, days_delay),
+                                   side='right')
+        is_valid = idx_next < len(self._dates)
+        next_dates = np.where(is_valid, self._dates[np.minimum(idx_next, len(self._dates) - 1)], end_date + 1)
+        
+        res = []
+        i = 0
+        while next_dates[i] <= end_date:
+            res.append(next_dates[i])
+            i = np.searchsorted(dates, next_dates[i])
+        return np.array(res, dtype=int)
@@ -1,6 +1,7 @@
 # encoding: UTF-8
 
 from abc import abstractmethod
+import re
 
 import numpy as np
 import pandas as pd
@@ -9,6 +10,7 @@ from quantos.util import fileio
 from quantos.backtest.pubsub import Publisher
 from quantos.data.dataapi import DataApi
 from quantos.data import align
+from quantos.data.cache import QueryCache
 from quantos.util import dtutil
 
 
@@ -260,15 +262,82 @@ class RemoteDataService(DataService):
             print "DataAPI login success.".format(address)
         
         self.REPORT_DATE_FIELD_NAME = 'report_date'
+        
+        self.cache = None
+        if dic.get("cache.enabled", False):
+            self.enable_cache(folder=dic.get("cache.folder", ""),
+                              max_size=dic.get("cache.max_size", 2 * 1024 ** 3))
+
+    def enable_cache(self, folder="", max_size=2 * 1024 ** 3, ttl=None):
+        """
+        Cache results of daily and query on disk. Only successful results are cached.
+        
+        Parameters
+        ----------
+        folder : str, optional
+            Default "" (output/data_cache).
+        max_size : int, optional
+            Max total size in bytes. Default 2GB.
+        ttl : dict of {str: float or None}, optional
+            Time to live of each view in seconds, see QueryCache.
+
+        """
+        if not folder:
+            folder = fileio.join_relative_path('../output/data_cache')
+        self.cache = QueryCache(folder, max_size=max_size, ttl=ttl)
+    
+    def disable_cache(self):
+        self.cache = None
+    
+    def _cached_call(self, view, data_end_date, func, **kwargs):
+        """
+        Return cached result of a query if available, else call func and cache the result.
+        
+        Parameters
+        ----------
+        view : str
+        data_end_date : int or None
+            Last date of the queried data, used to decide whether the result may still change.
+        func : callable
+            Returns (df, msg)
+        kwargs
+            Arguments that determine result of the query.
+
+        Returns
+        -------
+        df : pd.DataFrame
+        msg : str
+
+        """
+        if self.cache is None:
+            return func()
+        
+        key = self.cache.make_key(view, **kwargs)
+        res = self.cache.get(key)
+        if res is not None:
+            return res
+        
+        df, msg = func()
+        if msg == '0,':
+            self.cache.put(view, key, (df, msg), end_date=data_end_date)
+        return df, msg
 
     def daily(self, symbol, start_date, end_date,
               fields="", adjust_mode=None):
-        df, err_msg = self.api.daily(symbol=symbol, start_date=start_date, end_date=end_date,
-                                     fields=fields, adjust_mode=adjust_mode, data_format="")
-        # trade_status performance warning
-        # TODO there will be duplicate entries when on stocks' IPO day
-        df = df.drop_duplicates()
-        return df, err_msg
+        def func():
+            df, err_msg = self.api.daily(symbol=symbol, start_date=start_date, end_date=end_date,
+                                         fields=fields, adjust_mode=adjust_mode, data_format="")
+            # trade_status performance warning
+            # TODO there will be duplicate entries when on stocks' IPO day
+            df = df.drop_duplicates()
+            return df, err_msg
+        
+        if adjust_mode == 'pre':
+            # pre-adjusted history changes with every later dividend or split, do not cache it
+            return func()
+        return self._cached_call('jsd.query', end_date, func,
+                                 symbol=symbol, start_date=start_date, end_date=end_date,
+                                 fields=fields, adjust_mode=adjust_mode)
 
     def bar(self, symbol,
             start_time=200000, end_time=160000, trade_date=None,
@@ -307,8 +376,11 @@ class RemoteDataService(DataService):
             view does not change. fileds can be any field predefined in reference data api.
 
         """
-        df, msg = self.api.query(view, fields=fields, filter=filter, data_format="", **kwargs)
-        return df, msg
+        func = lambda: self.api.query(view, fields=fields, filter=filter, data_format="", **kwargs)
+        
+        match = re.search(r'end_date=(\d{8})', filter)
+        end_date = int(match.group(1)) if match else None
+        return self._cached_call(view, end_date, func, filter=filter, fields=fields, **kwargs)
     
     def get_suspensions(self):
         return None
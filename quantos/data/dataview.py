@@ -8,13 +8,18 @@ If you will use this data frequently, you can add define a new method of DataSer
 If you want to declare your field in props, instead of append it manually, you will have to modify prepare_data function.
 """
 import os
+import functools
+import itertools
 
 import numpy as np
 import pandas as pd
 
 import quantos.util.fileio
 from quantos.util import dtutil
-from quantos.data.align import align
+from quantos.data.align import get_asof_index, take_asof
+from quantos.data.fetcher import ChunkedFetcher
+from quantos.data import panel as panel_util
+from quantos.data.panel import Panel
 from quantos.data.py_expression_eval import Parser
 
 
@@ -32,17 +37,25 @@ class DataView(object):
     fields : list
     freq : int
     market_daily_fields, reference_daily_fields : list
+    fetcher : ChunkedFetcher
+        Controls chunk size, concurrency and retry of queries.
+    panel_d : Panel
+        All daily frequency data will be merged and stored here, one array for each field.
+    panel_q : Panel
+        All quarterly frequency data will be merged and stored here, one array for each field.
     data_d : pd.DataFrame
-        All daily frequency data will be merged and stored here.
+        All daily frequency data, built from panel_d when accessed.
         index is date, columns is symbol-field MultiIndex
     data_q : pd.DataFrame
-        All quarterly frequency data will be merged and stored here.
+        All quarterly frequency data, built from panel_q when accessed.
         index is date, columns is symbol-field MultiIndex
     
     """
     # TODO only support stocks!
     def __init__(self):
         self.data_api = None
+        # split queries into chunks of symbols / dates and send them concurrently. See _query_data
+        self.fetcher = ChunkedFetcher()
         
         self.universe = ""
         self.symbol = []
@@ -56,11 +69,23 @@ class DataView(object):
         self.meta_data_list = ['start_date', 'end_date',
                                'extended_start_date_d', 'extended_start_date_q',
                                'freq', 'fields', 'symbol', 'universe',
-                               'custom_daily_fields', 'custom_quarterly_fields']
+                               'custom_daily_fields', 'custom_quarterly_fields', 'custom_formulas']
         self.adjust_mode = 'post'
         
-        self.data_d = None
-        self.data_q = None
+        # MultiIndex DataFrames built from panels on access. see data_d, data_q
+        self._data_d = None
+        self._data_q = None
+        # industry group of each symbol, stored as category codes. see data_group
+        self._panel_group = None
+        # cache of row positions in data_q available at each trade date. see _get_asof_index
+        self._asof_index = None
+        self._asof_symbols = None
+        self._quarterly_values = dict()
+        # values of variables and sub-expressions of formulas, shared by add_formula calls
+        self._formula_cache = dict()
+        
+        self.panel_d = None
+        self.panel_q = None
         self._data_benchmark = None
         self._data_group = None
         
@@ -210,12 +235,16 @@ class DataView(object):
              "qfa_yoyprofit","qfa_cgrprofit","qfa_yoynetprofit","qfa_cgrnetprofit","yoy_equity","rd_expense","waa_roe"}
         self .custom_daily_fields = []
         self .custom_quarterly_fields = []
+        # formulas of fields added by add_formula, in the order of adding. Used to re-calculate when updating.
+        self.custom_formulas = []
         
         # co nst
         self .ANN_DATE_FIELD_NAME = 'ann_date'
         self .REPORT_DATE_FIELD_NAME = 'report_date'
         self.TRADE_STATUS_FIELD_NAME = 'trade_status'
         self.TRADE_DATE_FIELD_NAME = 'trade_date'
+        self.GROUP_FIELD_NAME = 'group'
+        self.TRADE_STATUS_TRADING = u'交易'.encode('utf-8')
     
     @property
     def data_benchmark(self):
@@ -223,8 +252,45 @@ class DataView(object):
 
     @property
     def data_group(self):
+        """
+        Industry group of each symbol on each date. index is date, columns are symbols.
+        Groups are stored as category codes, the DataFrame of labels is built when first accessed.
+        
+        """
+        if self._data_group is None and self._panel_group is not None:
+            self._data_group = self._panel_group.get_frame(self.GROUP_FIELD_NAME)
         return self._data_group
     
+    @data_group.setter
+    def data_group(self, df):
+        if df is None:
+            self._panel_group = None
+        else:
+            self._panel_group = Panel.from_frames({self.GROUP_FIELD_NAME: df}, index_name=self.TRADE_DATE_FIELD_NAME)
+        self._data_group = None
+        self._invalidate_formula_cache()
+    
+    def _get_group_codes(self):
+        """
+        Category codes of data_group, used as groups in formulas instead of labels.
+        Codes are in the same order as sorted labels, so results of group operations are the same.
+        
+        Returns
+        -------
+        pd.DataFrame or None
+            index is date, columns are symbols.
+
+        """
+        panel = self._panel_group
+        if panel is None:
+            return None
+        if not panel.is_categorical(self.GROUP_FIELD_NAME):
+            return self.data_group
+        codes, _ = panel.get_codes(self.GROUP_FIELD_NAME)
+        if (codes < 0).any():
+            codes = np.where(codes < 0, np.nan, codes)
+        return pd.DataFrame(codes, index=panel.dates, columns=panel.symbols)
+    
     @data_benchmark.setter
     def data_benchmark(self, df_new):
         if self._data_benchmark.shape[0] != df_new.shape[0]:
@@ -299,7 +365,7 @@ class DataView(object):
         l = list(s)
         return l
     
-    def _query_data(self, symbol, fields):
+    def _query_data(self, symbol, fields, start_date_d=0, start_date_q=0, end_date=0):
         """
         Query data using different APIs, then store them in dict.
         period, start_date and end_date are fixed.
@@ -309,6 +375,12 @@ class DataView(object):
         ----------
         symbol : list of str
         fields : list of str
+        start_date_d : int, optional
+            Start date of daily data. Default 0 (self.extended_start_date_d).
+        start_date_q : int, optional
+            Start date (announcement date) of quarterly data. Default 0 (self.extended_start_date_q).
+        end_date : int, optional
+            Default 0 (self.end_date).
 
         Returns
         -------
@@ -329,6 +401,13 @@ class DataView(object):
         sep = ','
         symbol_str = sep.join(symbol)
         
+        if not start_date_d:
+            start_date_d = self.extended_start_date_d
+        if not start_date_q:
+            start_date_q = self.extended_start_date_q
+        if not end_date:
+            end_date = self.end_date
+        
         dic_ref_daily = None
         dic_market_daily = None
         dic_balance = None
@@ -338,63 +417,56 @@ class DataView(object):
         
         if self.freq == 1:
             # TODO : use fields = {field: kwargs} to enable params
+            # all queries are independent, so they are split into chunks and sent concurrently
+            tasks = dict()
+            adj_cols = ['open', 'high', 'low', 'close']
             fields_market_daily = self._get_fields('market_daily', fields, append=True)
             if fields_market_daily:
                 print "NOTE: price adjust method is [{:s} adjust]".format(self.adjust_mode)
+                # pre-adjusted prices depend on end_date of the query, so date range can not be split
+                split_dates = self.adjust_mode != 'pre'
                 # no adjust prices and other market daily fields
-                df_daily, msg1 = self.data_api.daily(symbol_str, start_date=self.extended_start_date_d, end_date=self.end_date,
-                                                     adjust_mode=None, fields=sep.join(fields_market_daily))
-                adj_cols = ['open', 'high', 'low', 'close']
+                tasks['daily'] = (self.data_api.daily, symbol_str, start_date_d, end_date,
+                                  {'adjust_mode': None, 'fields': sep.join(fields_market_daily)}, split_dates)
                 # adjusted prices
-                df_daily_adjust, msg11 = self.data_api.daily(symbol_str, start_date=self.extended_start_date_d, end_date=self.end_date,
-                                                             adjust_mode=self.adjust_mode, fields=','.join(adj_cols))
-                df_daily_adjust = df_daily_adjust.loc[:, adj_cols]
-                # concat axis = 1
-                df_daily = df_daily.join(df_daily_adjust, rsuffix='_adj')
-                if msg1 != '0,':
-                    print msg1
-                dic_market_daily = self._group_df_to_dict(df_daily, 'symbol')
+                tasks['daily_adjust'] = (self.data_api.daily, symbol_str, start_date_d, end_date,
+                                         {'adjust_mode': self.adjust_mode, 'fields': sep.join(adj_cols)}, split_dates)
 
             fields_ref_daily = self._get_fields('ref_daily', fields)
             if fields_ref_daily:
-                df_ref_daily, msg2 = self.data_api.query_lb_dailyindicator(symbol_str, self.extended_start_date_d, self.end_date,
-                                                                           sep.join(fields_ref_daily))
-                if msg2 != '0,':
-                    print msg2
-                dic_ref_daily = self._group_df_to_dict(df_ref_daily, 'symbol')
-
-            fields_income = self._get_fields('income', fields, append=True)
-            if fields_income:
-                df_income, msg3 = self.data_api.query_lb_fin_stat('income', symbol_str, self.extended_start_date_q, self.end_date,
-                                                                  sep.join(fields_income))
-                if msg3 != '0,':
-                    print msg3
-                dic_income = self._group_df_to_dict(df_income, 'symbol')
-
-            fields_balance = self._get_fields('balance_sheet', fields, append=True)
-            if fields_balance:
-                df_balance, msg3 = self.data_api.query_lb_fin_stat('balance_sheet', symbol_str, self.extended_start_date_q, self.end_date,
-                                                                   sep.join(fields_balance))
-                if msg3 != '0,':
-                    print msg3
-                dic_balance = self._group_df_to_dict(df_balance, 'symbol')
-
-            fields_cf = self._get_fields('cash_flow', fields, append=True)
-            if fields_cf:
-                df_cf, msg3 = self.data_api.query_lb_fin_stat('cash_flow', symbol_str, self.extended_start_date_q, self.end_date,
-                                                              sep.join(fields_cf))
-                if msg3 != '0,':
-                    print msg3
-                dic_cf = self._group_df_to_dict(df_cf, 'symbol')
-
-            fields_fin_ind = self._get_fields('fin_indicator', fields, append=True)
-            if fields_fin_ind:
-                df_fin_ind, msg4 = self.data_api.query_lb_fin_stat('fin_indicator', symbol_str,
-                                                                   self.extended_start_date_q, self.end_date,
-                                                                   sep.join(fields_cf))
-                if msg4 != '0,':
-                    print msg4
-                dic_fin_ind = self._group_df_to_dict(df_fin_ind, 'symbol')
+                tasks['ref_daily'] = (self.data_api.query_lb_dailyindicator, symbol_str, start_date_d, end_date,
+                                      {'fields': sep.join(fields_ref_daily)})
+            
+            for type_ in ['income', 'balance_sheet', 'cash_flow', 'fin_indicator']:
+                fields_type = self._get_fields(type_, fields, append=True)
+                if fields_type:
+                    tasks[type_] = (functools.partial(self.data_api.query_lb_fin_stat, type_),
+                                    symbol_str, start_date_q, end_date, {'fields': sep.join(fields_type)})
+            
+            res = self.fetcher.fetch_many(tasks)
+            for name, (_, msg) in res.viewitems():
+                # data of failed chunks are missing, never use partial results
+                if msg != '0,':
+                    raise ValueError("query of [{:s}] failed: {:s}".format(name, msg))
+            
+            def to_dict(name):
+                df = res[name][0] if name in res else None
+                return None if df is None else self._group_df_to_dict(df, 'symbol')
+            
+            if fields_market_daily and res['daily'][0] is not None and res['daily_adjust'][0] is not None:
+                df_daily, _ = res['daily']
+                df_daily_adjust, _ = res['daily_adjust']
+                keys = ['symbol', self.TRADE_DATE_FIELD_NAME]
+                df_daily_adjust = df_daily_adjust.loc[:, keys + adj_cols]
+                df_daily_adjust = df_daily_adjust.rename(columns={col: col + '_adj' for col in adj_cols})
+                # rows of the two queries are not in the same order when they are fetched in chunks
+                df_daily = pd.merge(df_daily, df_daily_adjust, how='left', on=keys)
+                dic_market_daily = self._group_df_to_dict(df_daily, 'symbol')
+            dic_ref_daily = to_dict('ref_daily')
+            dic_income = to_dict('income')
+            dic_balance = to_dict('balance_sheet')
+            dic_cf = to_dict('cash_flow')
+            dic_fin_ind = to_dict('fin_indicator')
         else:
             raise NotImplementedError("freq = {}".format(self.freq))
         
@@ -442,106 +514,31 @@ class DataView(object):
         
         return df
 
-    '''
-    @staticmethod
-    def _dic_of_df_to_multi_index_df_OLD(dic, levels=None):
+    def _dic_of_df_to_panel(self, dic, index_name):
         """
-        Convert dict of DataFrame to MultiIndex DataFrame.
-        Columns of result will be MultiIndex constructed using keys of dict and columns of DataFrame.
-        Index of result will be the same with DataFrame.
+        Convert dict of DataFrame to Panel.
         Different DataFrame will be aligned (outer join) using index.
-        
+
         Parameters
         ----------
         dic : dict
-            {symbol: DataFrame with index be datetime and columns be fields}.
+            {symbol: DataFrame with index be date and columns be fields}.
+        index_name : str
 
         Returns
         -------
-        merge : pd.DataFrame
-            with MultiIndex columns.
+        res : Panel
 
         """
-        if levels is None:
-            levels = ['symbol', 'field']
-        keys = dic.keys()
-        values = dic.values()
-        
-        cols = values[0].columns.values
-        multi_idx = pd.MultiIndex.from_product([keys, cols], names=levels)
-        
-        merge = pd.concat(values, axis=1, join='outer')
-        merge.columns = multi_idx
-        merge.sort_index(axis=1, level=levels, inplace=True)
-        
-        if merge.isnull().sum().sum() > 0:
-            print "WARNING: Nan encountered, NO fill."
-            # merge.fillna(method='ffill')
-            
-        return merge
-
-    '''
-    def _dic_of_df_to_multi_index_df(self, dic, level_names=None):
-        """
-        Convert dict of DataFrame to MultiIndex DataFrame.
-        Columns of result will be MultiIndex constructed using keys of dict and columns of DataFrame.
-        Index of result will be the same with DataFrame.
-        Different DataFrame will be aligned (outer join) using index.
-
-        Parameters
-        ----------
-        dic : dict
-            {symbol: DataFrame with index be datetime and columns be fields}.
-        fields : list or np.ndarray
-            Column labels for MultiIndex level 0.
-        level_names : list of str
-            Name of columns.
-
-        Returns
-        -------
-        merge : pd.DataFrame
-            with MultiIndex columns.
-
-        """
-        if level_names is None:
-            level_names = ['symbol', 'field']
-        '''
-        if fields is None:
-            fields = dic.values()[0].columns
-        '''
-        keys = dic.keys()
-        values = dic.values()
-        idx = np.unique(np.concatenate([df.index.values for df in values]))
-        fields = np.unique(np.concatenate([df.columns.values for df in values]))
-
-        cols_multi = pd.MultiIndex.from_product([self.symbol, fields], names=level_names)
-        cols_multi = cols_multi.sort_values()
-        merge_final = pd.DataFrame(index=idx, columns=cols_multi, data=np.nan)
-
-        merge = pd.concat(dic, axis=1)
-        '''
-        merge = pd.concat(values, axis=1, join='outer')
-        merge = merge.sort_index(axis=1)
-        multi_idx = pd.MultiIndex.from_product([keys, fields], names=level_names)
-        merge.columns = multi_idx
-        '''
-        merge_final.loc[merge.index, merge.columns] = merge  # index and column of merge, df must be the same
-
-        if merge_final.isnull().sum().sum() > 0:
-            print "WARNING: there are NaN values in your data, NO fill."
-            # merge.fillna(method='ffill')
-
-        if merge_final.shape != merge.shape:
-            idx_diff = sorted(set(merge_final.index) - set(merge.index))
-            col_diff = sorted(set(merge_final.columns.levels[0].values) - set(merge.columns.levels[0].values))
-            print ("WARNING: some data is unavailable: "
-                   + "\n    At index " + ', '.join(idx_diff)
-                   + "\n    At fields " + ', '.join(col_diff))
-        return merge_final
+        res = Panel.from_symbol_frames(dic, symbols=self.symbol, index_name=index_name)
+        missing = sorted(set(self.symbol) - set(dic.keys()))
+        if missing:
+            print "WARNING: some data is unavailable: " + ', '.join(missing)
+        return res
 
     def _preprocess_market_daily(self, dic):
         """
-        Process data and construct MultiIndex.
+        Process data and construct Panel.
         
         Parameters
         ----------
@@ -549,7 +546,7 @@ class DataView(object):
 
         Returns
         -------
-        res : pd.DataFrame
+        res : Panel
 
         """
         if not dic:
@@ -558,12 +555,12 @@ class DataView(object):
             # df = df.astype({'trade_status': str})
             dic[sec] = self._process_index(df, self.TRADE_DATE_FIELD_NAME)
             
-        res = self._dic_of_df_to_multi_index_df(dic, level_names=['symbol', 'field'])
+        res = self._dic_of_df_to_panel(dic, self.TRADE_DATE_FIELD_NAME)
         return res
         
     def _preprocess_ref_daily(self, dic, fields):
         """
-        Process data and construct MultiIndex.
+        Process data and construct Panel.
         
         Parameters
         ----------
@@ -571,7 +568,7 @@ class DataView(object):
 
         Returns
         -------
-        res : pd.DataFrame
+        res : Panel
 
         """
         if not dic:
@@ -581,12 +578,12 @@ class DataView(object):
             df_mod = df_mod.loc[:, self._get_fields('ref_daily', fields)]
             dic[sec] = df_mod
         
-        res = self._dic_of_df_to_multi_index_df(dic, level_names=['symbol', 'field'])
+        res = self._dic_of_df_to_panel(dic, self.TRADE_DATE_FIELD_NAME)
         return res
 
     def _preprocess_ref_quarterly(self, type_, dic, fields):
         """
-        Process data and construct MultiIndex.
+        Process data and construct Panel.
         
         Parameters
         ----------
@@ -594,7 +591,7 @@ class DataView(object):
 
         Returns
         -------
-        res : pd.DataFrame
+        res : Panel
 
         """
         if not dic:
@@ -606,7 +603,7 @@ class DataView(object):
             
             new_dic[sec] = df_mod
     
-        res = self._dic_of_df_to_multi_index_df(new_dic, level_names=['symbol', 'field'])
+        res = self._dic_of_df_to_panel(new_dic, self.REPORT_DATE_FIELD_NAME)
         return res
     
     @staticmethod
@@ -646,6 +643,26 @@ class DataView(object):
         
         return merge
 
+    @staticmethod
+    def _merge_panels(panels):
+        """
+        Merge data from different APIs into one Panel. The same as _merge_data, missing values are forward filled.
+        
+        Parameters
+        ----------
+        panels : list of Panel
+
+        Returns
+        -------
+        merge : Panel or None
+            If panels is empty, return None
+        
+        """
+        merge = panel_util.merge(panels)
+        if merge is not None:
+            merge.ffill()
+        return merge
+
     def _merge_data2(self, dfs):
         """
         Merge data from different APIs into one DataFrame.
@@ -698,18 +715,20 @@ class DataView(object):
         """
         return self._is_quarter_field(field_name) or self._is_daily_field(field_name)
     
-    def _prepare_data(self, fields):
+    def _prepare_data(self, fields, start_date_d=0, start_date_q=0, end_date=0):
         """
         Query and process data from data_api.
         
         Parameters
         ----------
         fields : list
+        start_date_d, start_date_q, end_date : int, optional
+            Date range to query, see _query_data. Default 0 (date range of this DataView).
 
         Returns
         -------
-        merge_d : pd.DataFrame or None
-        merge_q : pd.DataFrame or None
+        merge_d : Panel or None
+        merge_q : Panel or None
 
         """
         if not fields:
@@ -718,7 +737,8 @@ class DataView(object):
         # query data
         print "Query data - query..."
         dic_market_daily, dic_ref_daily, dic_income, dic_balance_sheet, dic_cash_flow, dic_fin_ind = \
-            self._query_data(self.symbol, fields)
+            self._query_data(self.symbol, fields, start_date_d=start_date_d, start_date_q=start_date_q,
+                             end_date=end_date)
         
         # pre-process data
         print "Query data - preprocess..."
@@ -730,15 +750,17 @@ class DataView(object):
         multi_fin_ind = self._preprocess_ref_quarterly('fin_indicator', dic_fin_ind, fields)
     
         print "Query data - merge..."
-        merge_d = self._merge_data([multi_market_daily, multi_ref_daily],
-                                   index_name=self.TRADE_DATE_FIELD_NAME)
-        merge_q = self._merge_data([multi_income, multi_balance_sheet, multi_cash_flow, multi_fin_ind],
-                                   index_name=self.REPORT_DATE_FIELD_NAME)
+        merge_d = self._merge_panels([multi_market_daily, multi_ref_daily])
+        merge_q = self._merge_panels([multi_income, multi_balance_sheet, multi_cash_flow, multi_fin_ind])
     
         # drop dates that are not trade date
         if merge_d is not None:
-            trade_dates = self.dates
-            merge_d = merge_d.loc[trade_dates, pd.IndexSlice[:, :]].copy()
+            if start_date_d or end_date:
+                trade_dates = self.data_api.get_trade_date(start_date_d or self.extended_start_date_d,
+                                                           end_date or self.end_date, is_datetime=False)
+            else:
+                trade_dates = self.dates
+            merge_d = merge_d.reindex(dates=trade_dates)
         
         return merge_d, merge_q
     
@@ -756,14 +778,14 @@ class DataView(object):
         """Prepare data for the FIRST time."""
         # prepare benchmark and group
         print "Query data..."
-        self.data_d, self.data_q = self._prepare_data(self.fields)
+        self.panel_d, self.panel_q = self._prepare_data(self.fields)
 
         print "Query adj_factor..."
         self._prepare_adj_factor()
 
         if self.universe:
             print "Query industry..."
-            self._data_group = self._prepare_group()
+            self.data_group = self._prepare_group()
             print "Query benchmark..."
             self._data_benchmark = self._prepare_benchmark()
             print "Query benchmar member info..."
@@ -814,9 +836,10 @@ class DataView(object):
     
         print "Initialize config success."
         
-    def _prepare_benchmark(self):
+    def _prepare_benchmark(self, start_date=0, end_date=0):
         df_bench, msg = self.data_api.daily(self.universe,
-                                            start_date=self.extended_start_date_d, end_date=self.end_date,
+                                            start_date=start_date or self.extended_start_date_d,
+                                            end_date=end_date or self.end_date,
                                             adjust_mode=self.adjust_mode, fields='close')
         if msg != '0,':
             raise ValueError("msg = {:s}".format(msg))
@@ -824,9 +847,10 @@ class DataView(object):
         df_bench = self._process_index(df_bench, self.TRADE_DATE_FIELD_NAME)
         return df_bench
     
-    def _prepare_group(self):
+    def _prepare_group(self, start_date=0, end_date=0):
         df = self.data_api.get_industry_daily(symbol=','.join(self.symbol),
-                                              start_date=self.extended_start_date_q, end_date=self.end_date)
+                                              start_date=start_date or self.extended_start_date_q,
+                                              end_date=end_date or self.end_date)
         return df
     
     def _add_field(self, field_name, is_quarterly=None):
@@ -869,8 +893,58 @@ class DataView(object):
         else:
             merge = merge_d
             
-        merge = merge.loc[:, pd.IndexSlice[:, field_name]]
-        self.append_df(merge, field_name, is_quarterly=is_quarterly)  # whether contain only trade days is decided by existing data.
+        self.append_df(merge.get_frame(field_name), field_name, is_quarterly=is_quarterly)  # whether contain only trade days is decided by existing data.
+    
+    def _prepare_formula_vars(self, var_list):
+        """
+        Get DataFrame of each variable of formulas. Variables not in self.fields will be fetched from server.
+        Results are kept in self._formula_cache, so each variable is fetched and aligned only once.
+        
+        Parameters
+        ----------
+        var_list : list of str
+
+        Returns
+        -------
+        var_df_dic : dict
+            {var: pd.DataFrame}
+
+        """
+        # TODO
+        # users do not need to prepare data before add_formula
+        if not self.fields:
+            self.fields.extend(var_list)
+            self.prepare_data()
+        else:
+            for var in var_list:
+                if var not in self.fields:
+                    print "variable [{:s}] is not recognized (it may be wrong)," \
+                          "try to fetch from the server...".format(var)
+                    self.add_field(var)
+        
+        # variables and common sub-expressions are shared with other formulas through self._formula_cache
+        cache = self._formula_cache
+        if 'ann_dts' not in cache:
+            cache['ann_dts'] = self.get_ann_df()
+        var_df_dic = dict()
+        for var in var_list:
+            if ('var', var) not in cache:
+                if self._is_quarter_field(var):
+                    df_var = self.get_ts_quarter(var, start_date=self.extended_start_date_q)
+                else:
+                    # must use extended date. Default is start_date
+                    df_var = self.get_ts(var, start_date=self.extended_start_date_d, end_date=self.end_date)
+                cache[('var', var)] = df_var
+            
+            var_df_dic[var] = cache[('var', var)]
+        return var_df_dic
+    
+    def _evaluate_formula(self, parser, var_df_dic):
+        """Evaluate the last expression parsed by parser."""
+        cache = self._formula_cache
+        # TODO: send ann_date into expr.evaluate. We assume that ann_date of all fields of a symbol is the same
+        return parser.evaluate(var_df_dic, ann_dts=cache['ann_dts'], trade_dts=self.dates, df_group=self._get_group_codes(),
+                               cache=cache)
     
     def add_formula(self, field_name, formula, is_quarterly, formula_func_name_style='upper', data_api=None):
         """
@@ -900,35 +974,191 @@ class DataView(object):
         
         expr = parser.parse(formula)
         
-        var_df_dic = dict()
-        var_list = expr.variables()
+        var_df_dic = self._prepare_formula_vars(expr.variables())
+        df_eval = self._evaluate_formula(parser, var_df_dic)
         
-        # TODO
-        # users do not need to prepare data before add_formula
-        if not self.fields:
-            self.fields.extend(var_list)
-            self.prepare_data()
+        # a new field does not change cached variables
+        self._append_dfs([(field_name, df_eval)], is_quarterly=is_quarterly)
+        self.custom_formulas.append({'field_name': field_name, 'formula': formula, 'is_quarterly': is_quarterly,
+                                     'formula_func_name_style': formula_func_name_style})
+    
+    def add_formulas(self, formula_dic, is_quarterly=False, formula_func_name_style='upper', data_api=None):
+        """
+        Add several new fields at once. Variables are fetched only once, common sub-expressions are
+        evaluated only once and all results are appended in one concatenation.
+        A formula can use fields added by other formulas in formula_dic.
+        
+        Parameters
+        ----------
+        formula_dic : dict
+            {field_name: formula}
+        is_quarterly : bool, optional
+            Whether all new fields are quarterly data or daily data. Default False.
+        formula_func_name_style : {'upper', 'lower'}, optional
+        data_api : RemoteDataService, optional
+
+        """
+        if data_api is not None:
+            self.data_api = data_api
+        
+        for field_name in formula_dic:
+            if field_name in self.fields:
+                print "Add formulas failed: field name [{:s}] exist. Try another name.".format(field_name)
+                return
+        
+        parsers = dict()
+        variables = dict()
+        for field_name, formula in formula_dic.viewitems():
+            parser = Parser()
+            parser.set_capital(formula_func_name_style)
+            variables[field_name] = parser.parse(formula).variables()
+            parsers[field_name] = parser
+        
+        var_list = set()
+        for var_list_formula in variables.viewvalues():
+            var_list.update(var_list_formula)
+        var_df_dic = self._prepare_formula_vars([var for var in var_list if var not in formula_dic])
+        
+        # evaluate in order of dependency
+        field_names = []
+        visiting = set()
+        
+        def evaluate(name):
+            if name in var_df_dic:
+                return
+            if name in visiting:
+                raise ValueError("Formula of field [{:s}] depends on itself.".format(name))
+            visiting.add(name)
+            for var in variables[name]:
+                if var in formula_dic:
+                    evaluate(var)
+            df_eval = self._evaluate_formula(parsers[name], var_df_dic)
+            var_df_dic[name] = df_eval
+            self._formula_cache[('var', name)] = df_eval
+            field_names.append(name)
+        
+        for field_name in sorted(formula_dic):
+            evaluate(field_name)
+        
+        self._append_dfs([(name, var_df_dic[name]) for name in field_names], is_quarterly=is_quarterly)
+        for name in field_names:
+            self.custom_formulas.append({'field_name': name, 'formula': formula_dic[name],
+                                         'is_quarterly': is_quarterly,
+                                         'formula_func_name_style': formula_func_name_style})
+    
+    def _remove_field(self, field_name):
+        """Remove a field from data and from all field lists."""
+        if field_name in self.custom_quarterly_fields:
+            self._panel_q.drop_field(field_name)
+            self.panel_q = self._panel_q
+            self.custom_quarterly_fields.remove(field_name)
         else:
-            for var in var_list:
-                if var not in self.fields:
-                    print "variable [{:s}] is not recognized (it may be wrong)," \
-                          "try to fetch from the server...".format(var)
-                    self.add_field(var)
+            self._panel_d.drop_field(field_name)
+            self.panel_d = self._panel_d
+            if field_name in self.custom_daily_fields:
+                self.custom_daily_fields.remove(field_name)
+        self.fields.remove(field_name)
+        self._invalidate_formula_cache()
+    
+    def update_to(self, end_date, data_api=None, n_weeks_restate=4):
+        """
+        Update data to a later end_date incrementally, instead of querying all data again.
+        Daily fields are only queried for trade dates after the last date of existing data.
+        Financial statements announced since (current end_date - n_weeks_restate) are queried again,
+        so that new reports and restated reports replace existing ones of the same report date.
+        Fields added by add_formula are re-calculated. Other custom fields will be NaN on new dates.
         
-        df_ann = self.get_ann_df()
-        for var in var_list:
-            if self._is_quarter_field(var):
-                df_var = self.get_ts_quarter(var, start_date=self.extended_start_date_q)
-            else:
-                # must use extended date. Default is start_date
-                df_var = self.get_ts(var, start_date=self.extended_start_date_d, end_date=self.end_date)
-            
-            var_df_dic[var] = df_var
+        Parameters
+        ----------
+        end_date : int
+        data_api : RemoteDataService, optional
+        n_weeks_restate : int, optional
+            Default 4.
         
-        # TODO: send ann_date into expr.evaluate. We assume that ann_date of all fields of a symbol is the same
-        df_eval = parser.evaluate(var_df_dic, ann_dts=df_ann, trade_dts=self.dates, df_group=self.data_group)
+        Notes
+        -----
+        Symbols are not updated, even if universe is set.
+        Only post adjust mode is supported, because pre-adjusted prices of history will change.
+
+        """
+        if data_api is not None:
+            self.data_api = data_api
+        if self.data_api is None:
+            raise ValueError("Update failed. No data_api available. Please specify one in parameter.")
+        if self.adjust_mode != 'post':
+            raise NotImplementedError("adjust_mode = {:s}".format(self.adjust_mode))
+        if end_date <= self.end_date:
+            print "Data are already up to date ({:d}).".format(self.end_date)
+            return
+        
+        last_date = self.dates[-1]
+        start_date_q = dtutil.shift(self.end_date, n_weeks=-n_weeks_restate)
+        
+        formula_fields = [dic['field_name'] for dic in self.custom_formulas]
+        special_fields = ['adjust_factor', 'index_member']
+        fields = [field for field in self.fields
+                  if self._is_predefined_field(field)
+                  and field not in formula_fields
+                  and field not in special_fields
+                  and field not in self.custom_daily_fields
+                  and field not in self.custom_quarterly_fields]
+        
+        print "Query data..."
+        merge_d, merge_q = self._prepare_data(fields, start_date_d=last_date, start_date_q=start_date_q,
+                                              end_date=end_date)
         
-        self.append_df(df_eval, field_name, is_quarterly=is_quarterly)
+        symbol_str = ','.join(self.symbol)
+        dfs_d = [merge_d]
+        if 'adjust_factor' in self.fields:
+            print "Query adj_factor..."
+            df_adj = self.data_api.get_adj_factor_daily(symbol_str, start_date=last_date, end_date=end_date,
+                                                        div=False)
+            dfs_d.append(Panel.from_frames({'adjust_factor': df_adj}, index_name=self.TRADE_DATE_FIELD_NAME))
+        if 'index_member' in self.fields and self.universe:
+            print "Query benchmar member info..."
+            df_member = self.data_api.get_index_comp_df(self.universe, last_date, end_date)
+            dfs_d.append(Panel.from_frames({'index_member': df_member}, index_name=self.TRADE_DATE_FIELD_NAME))
+        
+        # daily: append new trade dates
+        new_d = self._merge_panels(dfs_d)
+        if new_d is not None:
+            new_d = new_d.date_slice(start_date=last_date + 1)
+            self.panel_d = panel_util.concat_dates(self.panel_d, new_d)
+        
+        # quarterly: add new reports, replace restated reports
+        if merge_q is not None and self.panel_q is not None:
+            self.panel_q = panel_util.combine_first(merge_q, self.panel_q)
+        
+        if self._data_benchmark is not None:
+            print "Query benchmark..."
+            df_bench = self._prepare_benchmark(start_date=last_date, end_date=end_date)
+            self._data_benchmark = pd.concat([self._data_benchmark,
+                                              df_bench.loc[df_bench.index > last_date]], axis=0)
+        if self._panel_group is not None:
+            print "Query industry..."
+            df_group = self._prepare_group(start_date=last_date, end_date=end_date)
+            new_group = Panel.from_frames({self.GROUP_FIELD_NAME: df_group.loc[df_group.index > last_date]},
+                                          index_name=self.TRADE_DATE_FIELD_NAME)
+            self._panel_group = panel_util.concat_dates(self._panel_group, new_group)
+            self._data_group = None
+            self._invalidate_formula_cache()
+        
+        self.end_date = end_date
+        
+        if self.custom_formulas:
+            print "Re-calculate formulas..."
+            custom_formulas = self.custom_formulas
+            self.custom_formulas = []
+            for dic in custom_formulas:
+                self._remove_field(dic['field_name'])
+            # formulas with the same frequency and style are added in one batch
+            for key, group in itertools.groupby(custom_formulas,
+                                                key=lambda dic: (dic['is_quarterly'], dic['formula_func_name_style'])):
+                is_quarterly, style = key
+                formula_dic = {dic['field_name']: dic['formula'] for dic in group}
+                self.add_formulas(formula_dic, is_quarterly=is_quarterly, formula_func_name_style=style)
+        
+        print "Data has been successfully updated to {:d}.".format(end_date)
 
     @staticmethod
     def _load_h5(fp):
@@ -950,7 +1180,7 @@ class DataView(object):
         
         return res
         
-    def load_dataview(self, folder='.'):
+    def load_dataview(self, folder='.', file_format=None, mmap_mode='r'):
         """
         Load data from local file.
         
@@ -958,17 +1188,100 @@ class DataView(object):
         ----------
         folder : str, optional
             Folder path to store hd5 file and meta data.
+        file_format : {None, 'columnar', 'hdf5'}, optional
+            Default None (decided by files in folder).
+        mmap_mode : {None, 'r', 'r+', 'c'}, optional
+            Only used by 'columnar' format. Default 'r' (memory-map arrays, fields are read from disk on access).
             
         """
+        if file_format is None:
+            if os.path.exists(os.path.join(folder, 'data_d', 'layout.json')):
+                file_format = 'columnar'
+            else:
+                file_format = 'hdf5'
+        
         meta_data = quantos.util.fileio.read_json(os.path.join(folder, 'meta_data.json'))
-        dic = self._load_h5(os.path.join(folder, 'data.hd5'))
-        self.data_d = dic.get('/data_d', None)
-        self.data_q = dic.get('/data_q', None)
-        self._data_benchmark = dic.get('/data_benchmark', None)
-        self._data_group = dic.get('/data_group', None)
+        if file_format == 'hdf5':
+            dic = self._load_h5(os.path.join(folder, 'data.hd5'))
+            self.data_d = dic.get('/data_d', None)
+            self.data_q = dic.get('/data_q', None)
+            self._data_benchmark = dic.get('/data_benchmark', None)
+            self.data_group = dic.get('/data_group', None)
+        elif file_format == 'columnar':
+            self.panel_d = Panel.load(os.path.join(folder, 'data_d'), mmap_mode=mmap_mode)
+            self.panel_q = Panel.load(os.path.join(folder, 'data_q'), mmap_mode=mmap_mode)
+            self._data_benchmark = self._read_pickle(os.path.join(folder, 'data_benchmark.pkl'))
+            self._panel_group = Panel.load(os.path.join(folder, 'data_group'), mmap_mode=mmap_mode)
+            self._data_group = None
+            self._invalidate_formula_cache()
+            if self._panel_group is None:
+                # saved by earlier versions
+                self.data_group = self._read_pickle(os.path.join(folder, 'data_group.pkl'))
+        else:
+            raise NotImplementedError("file_format = {:s}".format(file_format))
         self.__dict__.update(meta_data)
         
         print "Dataview loaded successfully."
+    
+    @staticmethod
+    def _read_pickle(fp):
+        if os.path.exists(fp):
+            return pd.read_pickle(fp)
+        return None
+
+    @property
+    def panel_d(self):
+        """All daily frequency data. Panel or None."""
+        return self._panel_d
+    
+    @panel_d.setter
+    def panel_d(self, panel):
+        self._panel_d = panel
+        self._data_d = None
+        self._invalidate_asof_index()  # trade dates may change
+        self._invalidate_formula_cache()
+    
+    @property
+    def panel_q(self):
+        """All quarterly frequency data. Panel or None."""
+        return self._panel_q
+    
+    @panel_q.setter
+    def panel_q(self, panel):
+        self._panel_q = panel
+        self._data_q = None
+        self._invalidate_asof_index()
+        self._invalidate_formula_cache()
+
+    @property
+    def data_d(self):
+        """
+        All daily frequency data. index is date, columns is symbol-field MultiIndex.
+        It is built from panel_d when first accessed. Setting it replaces panel_d.
+        
+        """
+        if self._data_d is None and self._panel_d is not None:
+            self._data_d = self._panel_d.to_multi_index_df()
+        return self._data_d
+    
+    @data_d.setter
+    def data_d(self, df):
+        self.panel_d = None if df is None else Panel.from_multi_index_df(df)
+    
+    @property
+    def data_q(self):
+        """
+        All quarterly frequency data. index is report date, columns is symbol-field MultiIndex.
+        It is built from panel_q when first accessed. Setting it replaces panel_q.
+        
+        """
+        if self._data_q is None and self._panel_q is not None:
+            self._data_q = self._panel_q.to_multi_index_df()
+        return self._data_q
+    
+    @data_q.setter
+    def data_q(self, df):
+        self.panel_q = None if df is None else Panel.from_multi_index_df(df)
 
     @property
     def dates(self):
@@ -981,8 +1294,8 @@ class DataView(object):
             dtype: int
 
         """
-        if self.data_d is not None:
-            res = self.data_d.index.values
+        if self._panel_d is not None:
+            res = self._panel_d.dates
         elif self.data_api is not None:
             res = self.data_api.get_trade_date(self.extended_start_date_d, self.end_date, is_datetime=False)
         else:
@@ -1033,23 +1346,11 @@ class DataView(object):
         
         df_ref_expanded = None
         if fields_quarterly:
-            df_ref_quarterly = self.data_q.loc[:,
-                                               pd.IndexSlice[symbol, fields_quarterly]]
-            df_ref_ann = self.data_q.loc[:,
-                                         pd.IndexSlice[symbol, self.ANN_DATE_FIELD_NAME]]
-            df_ref_ann.columns = df_ref_ann.columns.droplevel(level='field')
-            
-            dic_expanded = dict()
-            for field_name, df in df_ref_quarterly.groupby(level=1, axis=1):  # by column multiindex fields
-                df_expanded = align(df, df_ref_ann, self.dates)
-                dic_expanded[field_name] = df_expanded
-            df_ref_expanded = pd.concat(dic_expanded.values(), axis=1)
-            df_ref_expanded.index.name = self.TRADE_DATE_FIELD_NAME
-            df_ref_expanded = df_ref_expanded.loc[start_date: end_date, :]
+            df_ref_expanded = self._get_quarterly_expanded(symbol, fields_quarterly, start_date, end_date)
         
         if fields_daily:
-            df_others = self.data_d.loc[pd.IndexSlice[start_date: end_date],
-                                        pd.IndexSlice[symbol, fields_daily]]
+            df_others = self._panel_d.to_multi_index_df(symbols=symbol, fields=fields_daily,
+                                                        start_date=start_date, end_date=end_date)
         else:
             df_others = None
         
@@ -1058,6 +1359,186 @@ class DataView(object):
             print "WARNING: no data."
         return df_merge
     
+    def _invalidate_asof_index(self):
+        """Must be called whenever data_q (including its ann_date field) or trade dates are changed."""
+        self._asof_index = None
+        self._asof_symbols = None
+        self._quarterly_values = dict()
+    
+    def _invalidate_formula_cache(self):
+        """Must be called whenever fields of data_d, data_q or data_group are added, changed or removed."""
+        self._formula_cache = dict()
+    
+    def _get_asof_index(self):
+        """
+        Get (and build for the first call) row positions in data_q available at each trade date.
+        
+        Returns
+        -------
+        idx : np.ndarray
+            shape = (n_dates, n_symbols), dtype = int. -1 where no report has been announced.
+        symbols : pd.Index
+            Symbols corresponding to columns of idx.
+
+        """
+        if self._asof_index is None:
+            df_ann = self.get_ann_df()
+            self._asof_index = get_asof_index(df_ann, self.dates)
+            self._asof_symbols = df_ann.columns
+        return self._asof_index, self._asof_symbols
+    
+    def _get_quarterly_values(self, field_name):
+        """
+        Get (and cache) values of a quarterly field, columns in the same order as the as-of index.
+        
+        Parameters
+        ----------
+        field_name : str
+
+        Returns
+        -------
+        np.ndarray
+            shape = (n_quarters, n_symbols)
+
+        """
+        values = self._quarterly_values.get(field_name, None)
+        if values is None:
+            _, idx_symbols = self._get_asof_index()
+            panel = self._panel_q
+            values = panel.get_values(field_name, cols=pd.Index(panel.symbols).get_indexer(idx_symbols))
+            self._quarterly_values[field_name] = values
+        return values
+    
+    def _get_quarterly_expanded(self, symbol, fields, start_date, end_date):
+        """
+        Expand quarterly fields to trade dates using cached as-of index.
+        
+        Parameters
+        ----------
+        symbol : list of str
+        fields : list of str
+            Quarterly fields.
+        start_date : int
+        end_date : int
+
+        Returns
+        -------
+        res : pd.DataFrame
+            index is trade date, columns are (symbol, fields) MultiIndex
+
+        """
+        idx, idx_symbols = self._get_asof_index()
+        
+        dates = self.dates
+        mask_date = (dates >= start_date) & (dates <= end_date)
+        symbol_set = set(symbol)
+        symbol = [s for s in idx_symbols if s in symbol_set]
+        symbol_pos = idx_symbols.get_indexer(symbol)
+        idx = idx[np.ix_(mask_date, symbol_pos)]
+        
+        dic_expanded = dict()
+        for field_name in fields:
+            values = self._get_quarterly_values(field_name)[:, symbol_pos]
+            columns = pd.MultiIndex.from_product([symbol, [field_name]], names=['symbol', 'field'])
+            dic_expanded[field_name] = pd.DataFrame(index=dates[mask_date], columns=columns,
+                                                    data=take_asof(values, idx))
+        res = pd.concat(dic_expanded.values(), axis=1)
+        res.index.name = self.TRADE_DATE_FIELD_NAME
+        return res
+    
+    def get_snapshot_array(self, snapshot_date, symbol="", fields=""):
+        """
+        Get snapshot of given fields and symbol at snapshot_date as np.ndarray, without building any DataFrame.
+        
+        Parameters
+        ----------
+        snapshot_date : int
+            Date of snapshot. Must be a trade date in self.dates.
+        symbol : str, optional
+            Separated by ',' default "" (all securities).
+        fields : str, optional
+            Separated by ',' default "" (all fields).
+
+        Returns
+        -------
+        res : np.ndarray
+            shape = (n_symbols, n_fields). Rows and columns follow the order of symbol and fields.
+
+        """
+        sep = ','
+        fields = fields.split(sep) if fields else self.fields
+        symbol = symbol.split(sep) if symbol else self.symbol
+        
+        panel = self._panel_d
+        date_pos = panel.date_pos[snapshot_date]
+        symbol_pos = [panel.symbol_pos[sec] for sec in symbol]
+        
+        columns = []
+        for field in fields:
+            if field in panel:
+                # only one row of the field is read
+                columns.append(panel.get_values(field, rows=date_pos, cols=symbol_pos))
+            else:
+                columns.append(self._get_quarterly_snapshot(date_pos, symbol, field))
+        
+        if len(columns) == 1:
+            return columns[0].reshape(-1, 1)
+        return np.column_stack(columns)
+    
+    def get_snapshot_codes(self, snapshot_date, field, symbol=""):
+        """
+        Get category codes of a daily string field (e.g. trade_status) at snapshot_date.
+        Compare them with get_category_code instead of comparing strings.
+        
+        Parameters
+        ----------
+        snapshot_date : int
+            Date of snapshot. Must be a trade date in self.dates.
+        field : str
+            A daily field whose values are not numbers.
+        symbol : str, optional
+            Separated by ',' default "" (all securities).
+
+        Returns
+        -------
+        res : np.ndarray
+            Small integer codes in the order of symbol. -1 for missing values.
+
+        """
+        panel = self._panel_d
+        if not panel.is_categorical(field):
+            raise ValueError("Field [{:s}] is not a categorical field.".format(field))
+        symbol = symbol.split(',') if symbol else self.symbol
+        codes, _ = panel.get_codes(field)
+        return codes[panel.date_pos[snapshot_date], [panel.symbol_pos[sec] for sec in symbol]]
+    
+    def get_category_code(self, field, label):
+        """
+        Code of label in a daily string field. -2 if label never appears, so that it equals no code.
+        
+        Parameters
+        ----------
+        field : str
+        label : str
+
+        Returns
+        -------
+        int
+
+        """
+        return self._panel_d.get_code(field, label)
+    
+    def _get_quarterly_snapshot(self, date_pos, symbol, field):
+        """Value of a quarterly field for each symbol at the date_pos'th trade date."""
+        idx, idx_symbols = self._get_asof_index()
+        symbol_pos = idx_symbols.get_indexer(symbol)
+        rows = idx[date_pos, symbol_pos]
+        values = self._get_quarterly_values(field)[np.where(rows < 0, 0, rows), symbol_pos]
+        if (rows < 0).any():
+            values = values.astype(object if values.dtype == object else float)
+            values[rows < 0] = np.nan
+        return values
+    
     def get_snapshot(self, snapshot_date, symbol="", fields=""):
         """
         Get snapshot of given fields and symbol at snapshot_date.
@@ -1077,11 +1558,23 @@ class DataView(object):
             symbol as index, field as columns
 
         """
-        res = self.get(symbol=symbol, start_date=snapshot_date, end_date=snapshot_date, fields=fields)
+        if self._panel_d is None or snapshot_date not in self._panel_d.date_pos:
+            res = self.get(symbol=symbol, start_date=snapshot_date, end_date=snapshot_date, fields=fields)
+            
+            res = res.stack(level='symbol', dropna=False)
+            res.index = res.index.droplevel(level=self.TRADE_DATE_FIELD_NAME)
+            return res
+        
+        sep = ','
+        fields = sorted(set(fields.split(sep) if fields else self.fields))
+        symbol = sorted(set(symbol.split(sep) if symbol else self.symbol))
         
-        res = res.stack(level='symbol', dropna=False)
-        res.index = res.index.droplevel(level=self.TRADE_DATE_FIELD_NAME)
+        symbol_str = sep.join(symbol)
         
+        # one column per field to keep dtype of each field
+        data = {field: self.get_snapshot_array(snapshot_date, symbol=symbol_str, fields=field)[:, 0]
+                for field in fields}
+        res = pd.DataFrame(index=pd.Index(symbol, name='symbol'), columns=pd.Index(fields, name='field'), data=data)
         return res
 
     def get_ann_df(self):
@@ -1095,14 +1588,9 @@ class DataView(object):
             If no quarterly data available, return None.
         
         """
-        if self.data_q is None:
+        if self._panel_q is None:
             return None
-        df_ann = self.data_q.loc[:, pd.IndexSlice[:, self.ANN_DATE_FIELD_NAME]]
-        
-        df_ann = df_ann.copy()
-        df_ann.columns = df_ann.columns.droplevel(level='field')
-    
-        return df_ann
+        return self._panel_q.get_frame(self.ANN_DATE_FIELD_NAME).copy()
         
     def get_ts_quarter(self, field, symbol="", start_date=0, end_date=0):
         # TODO
@@ -1117,15 +1605,14 @@ class DataView(object):
         if not end_date:
             end_date = self.end_date
     
-        df_ref_quarterly = self.data_q.loc[:,
-                                           pd.IndexSlice[symbol, field]]
-        df_ref_quarterly.columns = df_ref_quarterly.columns.droplevel(level='field')
+        df_ref_quarterly = self._panel_q.get_frame(field, symbols=symbol)
         
         return df_ref_quarterly
     
     def get_ts(self, field, symbol="", start_date=0, end_date=0):
         """
         Get time series data of single field.
+        Values of a daily field for all symbols share memory with this DataView, do not modify them in place.
         
         Parameters
         ----------
@@ -1144,21 +1631,33 @@ class DataView(object):
             Index is int date, column is symbol.
 
         """
-        res = self.get(symbol, start_date=start_date, end_date=end_date, fields=field)
-        
-        res.columns = res.columns.droplevel(level='field')
-        
+        is_daily = self._get_fields('daily', [field]) and not self._get_fields('quarterly', [field])
+        if not (is_daily and self._panel_d is not None and field in self._panel_d):
+            res = self.get(symbol, start_date=start_date, end_date=end_date, fields=field)
+            res.columns = res.columns.droplevel(level='field')
+            return res
+        
+        # daily field is read directly from its array
+        symbol = symbol.split(',') if symbol else self.symbol
+        res = self._panel_d.get_frame(field, symbols=symbol, start_date=start_date or self.start_date,
+                                      end_date=end_date or self.end_date)
+        values = panel_util.ffill(res.values)  # the same as get
+        if values is not res.values:
+            res = pd.DataFrame(values, index=res.index, columns=res.columns)
         return res
 
-    def save_dataview(self, folder_path=".", sub_folder=""):
+    def save_dataview(self, folder_path=".", sub_folder="", file_format='columnar'):
         """
-        Save data and meta_data_to_store to a single hd5 file.
+        Save data and meta_data_to_store to sub folder.
         Store at output/sub_folder
         
         Parameters
         ----------
         folder_path : str
         sub_folder : str
+        file_format : {'columnar', 'hdf5'}, optional
+            'columnar': one .npy file for each field, which can be memory-mapped when loading. (default)
+            'hdf5': a single hd5 file.
 
         """
         if not sub_folder:
@@ -1167,17 +1666,26 @@ class DataView(object):
         folder_path = os.path.join(folder_path, sub_folder)
         abs_folder = os.path.abspath(folder_path)
         meta_path = os.path.join(folder_path, 'meta_data.json')
-        data_path = os.path.join(folder_path, 'data.hd5')
         
-        data_to_store = {'data_d': self.data_d, 'data_q': self.data_q,
-                         'data_benchmark': self._data_benchmark,
-                         'data_group': self._data_group}
+        panels = {'data_d': self._panel_d, 'data_q': self._panel_q, 'data_group': self._panel_group}
+        panels = {k: v for k, v in panels.items() if v is not None}
+        data_to_store = {'data_benchmark': self._data_benchmark}
         data_to_store = {k: v for k, v in data_to_store.items() if v is not None}
         meta_data_to_store = {key: self.__dict__[key] for key in self.meta_data_list}
 
         print "\nStore data..."
         quantos.util.fileio.save_json(meta_data_to_store, meta_path)
-        self._save_h5(data_path, data_to_store)
+        if file_format == 'hdf5':
+            data_to_store.update({'data_d': self.data_d, 'data_q': self.data_q, 'data_group': self.data_group})
+            data_to_store = {k: v for k, v in data_to_store.items() if v is not None}
+            self._save_h5(os.path.join(folder_path, 'data.hd5'), data_to_store)
+        elif file_format == 'columnar':
+            for key, panel in panels.items():
+                panel.save(os.path.join(folder_path, key))
+            for key, df in data_to_store.items():
+                df.to_pickle(os.path.join(folder_path, key + '.pkl'))
+        else:
+            raise NotImplementedError("file_format = {:s}".format(file_format))
         
         print ("Dataview has been successfully saved to:\n"
                + abs_folder + "\n\n"
@@ -1206,7 +1714,7 @@ class DataView(object):
     
     def append_df(self, df, field_name, is_quarterly=False):
         """
-        Append DataFrame to existing multi-index DataFrame and add corresponding field name.
+        Append DataFrame to existing data and add corresponding field name.
         
         Parameters
         ----------
@@ -1216,29 +1724,47 @@ class DataView(object):
             Whether df is quarterly data (like quarterly financial statement) or daily data.
 
         """
-        if isinstance(df, pd.DataFrame):
-            pass
-        elif isinstance(df, pd.Series):
-            df = pd.DataFrame(df)
-        else:
-            raise ValueError("Data to be appended must be pandas format. But we have {}".format(type(df)))
+        self._append_dfs([(field_name, df)], is_quarterly=is_quarterly)
+        # df may replace a field of the same name, or be a variable fetched for a formula
+        self._invalidate_formula_cache()
+    
+    def _append_dfs(self, df_list, is_quarterly=False):
+        """
+        Append several DataFrames and add corresponding field names.
+        Each DataFrame is aligned to dates and symbols of existing data and stored as one array.
+        Formula cache is kept, so that add_formula can append its results without losing it.
         
-        if is_quarterly:
-            the_data = self.data_q
-        else:
-            the_data = self.data_d
+        Parameters
+        ----------
+        df_list : list of tuple
+            (field_name, df). df is pd.DataFrame or pd.Series.
+        is_quarterly : bool
+            Whether df is quarterly data (like quarterly financial statement) or daily data.
+
+        """
+        panel = self._panel_q if is_quarterly else self._panel_d
+        
+        symbols = panel.symbols
+        for field_name, df in df_list:
+            if isinstance(df, pd.DataFrame):
+                pass
+            elif isinstance(df, pd.Series):
+                df = pd.DataFrame(df)
+            else:
+                raise ValueError("Data to be appended must be pandas format. But we have {}".format(type(df)))
             
-        multi_idx = pd.MultiIndex.from_product([the_data.columns.levels[0], [field_name]])
-        df.columns = multi_idx
+            if df.shape[1] == len(symbols) and not set(df.columns).issubset(symbols):
+                # columns are not labeled by symbol, they are in the same order as symbols
+                df = pd.DataFrame(df.values, index=df.index, columns=symbols)
+            panel.set_field(field_name, df.reindex(index=panel.dates, columns=symbols).values)
         
-        merge = the_data.join(df, how='left')  # left: keep index of existing data unchanged
-        merge.sort_index(axis=1, level=['symbol', 'field'], inplace=True)
-
         if is_quarterly:
-            self.data_q = merge
+            self._data_q = None
+            self._invalidate_asof_index()
         else:
-            self.data_d = merge
-        self._add_field(field_name, is_quarterly)
+            self._data_d = None
+        for field_name, _ in df_list:
+            self._add_field(field_name, is_quarterly)
     
     def _is_quarter_field(self, field_name):
         """
@@ -0,0 +1,206 @@
+# encoding: utf-8
+"""
+Split large queries into chunks of symbols and dates, send them concurrently and re-assemble results.
+
+Usage:
+    fetcher = ChunkedFetcher(symbol_chunk_size=100, n_days_chunk=365, max_workers=4)
+    tasks = {'daily': (ds.daily, '000001.SZ,600030.SH', 20150101, 20170101, {'fields': 'close'})}
+    res = fetcher.fetch_many(tasks)
+    df, msg = res['daily']
+"""
+import time
+import threading
+import Queue
+
+import pandas as pd
+
+from quantos.util import dtutil
+
+
+class ChunkedFetcher(object):
+    """
+    Fetch planner for RemoteDataService queries whose signature is
+    func(symbol=..., start_date=..., end_date=..., **kwargs) -> (df, msg).
+
+    Attributes
+    ----------
+    symbol_chunk_size : int
+        Max number of symbols in one query. 0 means no split.
+    n_days_chunk : int
+        Max number of calendar days in one query. 0 means no split.
+    max_workers : int
+        Max number of queries sent at the same time.
+    n_retry : int
+        Number of retries of a failed chunk.
+    retry_wait : float
+        Seconds to wait before retrying.
+
+    """
+    def __init__(self, symbol_chunk_size=200, n_days_chunk=0, max_workers=4, n_retry=2, retry_wait=1.0):
+        self.symbol_chunk_size = symbol_chunk_size
+        self.n_days_chunk = n_days_chunk
+        self.max_workers = max_workers
+        self.n_retry = n_retry
+        self.retry_wait = retry_wait
+
+    def plan(self, symbol, start_date, end_date, split_dates=True):
+        """
+        Split a query into chunks.
+
+        Parameters
+        ----------
+        symbol : str
+            Separated by ','.
+        start_date : int
+        end_date : int
+        split_dates : bool, optional
+            Whether date range can be split. Default True.
+
+        Returns
+        -------
+        list of tuple
+            (symbol, start_date, end_date) of each chunk.
+
+        """
+        symbol_list = [sec for sec in symbol.split(',') if sec]
+        size = self.symbol_chunk_size if self.symbol_chunk_size > 0 else max(len(symbol_list), 1)
+        symbol_chunks = [','.join(symbol_list[i: i + size]) for i in range(0, len(symbol_list), size)]
+        if not symbol_chunks:
+            symbol_chunks = [symbol]
+
+        if split_dates and self.n_days_chunk > 0:
+            date_chunks = self._split_dates(start_date, end_date, self.n_days_chunk)
+        else:
+            date_chunks = [(start_date, end_date)]
+
+        return [(sym, s, e) for sym in symbol_chunks for s, e in date_chunks]
+
+    @staticmethod
+    def _split_dates(start_date, end_date, n_days):
+        """Split [start_date, end_date] into non-overlapping ranges of at most n_days calendar days."""
+        start = dtutil.convert_int_to_datetime(int(start_date))
+        end = dtutil.convert_int_to_datetime(int(end_date))
+        one_day = pd.Timedelta(days=1)
+
+        res = []
+        while start <= end:
+            chunk_end = min(start + pd.Timedelta(days=n_days) - one_day, end)
+            res.append((dtutil.convert_datetime_to_int(start), dtutil.convert_datetime_to_int(chunk_end)))
+            start = chunk_end + one_day
+        return res
+
+    def _call_with_retry(self, func, symbol, start_date, end_date, kwargs):
+        """Call func, retry when an exception is raised or msg is not '0,'."""
+        df, msg = None, ""
+        for i in range(self.n_retry + 1):
+            if i > 0:
+                time.sleep(self.retry_wait)
+            try:
+                df, msg = func(symbol=symbol, start_date=start_date, end_date=end_date, **kwargs)
+            except Exception as e:
+                df, msg = None, "-1,{}".format(e)
+            if msg == '0,':
+                break
+        return df, msg
+
+    def _run_parallel(self, jobs):
+        """
+        Run jobs with at most max_workers threads.
+
+        Parameters
+        ----------
+        jobs : list of callable
+
+        Returns
+        -------
+        list
+            Return value of each job.
+
+        """
+        results = [None] * len(jobs)
+        n_workers = min(max(self.max_workers, 1), len(jobs))
+        if n_workers <= 1:
+            return [job() for job in jobs]
+
+        queue = Queue.Queue()
+        for i, job in enumerate(jobs):
+            queue.put((i, job))
+
+        def worker():
+            while True:
+                try:
+                    i, job = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                results[i] = job()
+
+        threads = [threading.Thread(target=worker) for _ in range(n_workers)]
+        for t in threads:
+            t.setDaemon(True)
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def fetch_many(self, tasks):
+        """
+        Split all tasks into chunks, query all chunks concurrently and concatenate results of each task.
+
+        Parameters
+        ----------
+        tasks : dict
+            {name: (func, symbol, start_date, end_date, kwargs)}.
+            An optional 6th element split_dates (bool) controls whether dates of this task can be split.
+
+        Returns
+        -------
+        res : dict
+            {name: (df, msg)}. msg is '0,' if all chunks succeed, else message of the first failed chunk.
+
+        """
+        jobs = []
+        job_names = []
+        for name, task in tasks.viewitems():
+            func, symbol, start_date, end_date, kwargs = task[:5]
+            split_dates = task[5] if len(task) > 5 else True
+            for sym, s, e in self.plan(symbol, start_date, end_date, split_dates=split_dates):
+                jobs.append(lambda func=func, sym=sym, s=s, e=e, kwargs=kwargs:
+                            self._call_with_retry(func, sym, s, e, kwargs))
+                job_names.append(name)
+
+        results = self._run_parallel(jobs)
+
+        res = dict()
+        for name in tasks:
+            dfs = []
+            msg = '0,'
+            for job_name, (df, chunk_msg) in zip(job_names, results):
+                if job_name != name:
+                    continue
+                if chunk_msg != '0,' and msg == '0,':
+                    msg = chunk_msg
+                if df is not None:
+                    dfs.append(df)
+
+            non_empty = [df for df in dfs if len(df) > 0]
+            if non_empty:
+                df_res = pd.concat(non_empty, axis=0, ignore_index=True)
+            elif dfs:
+                df_res = dfs[0]
+            else:
+                df_res = None
+            res[name] = (df_res, msg)
+        return res
+
+    def fetch(self, func, symbol, start_date, end_date, split_dates=True, **kwargs):
+        """
+        Query a single task in chunks. See fetch_many.
+
+        Returns
+        -------
+        df : pd.DataFrame
+        msg : str
+
+        """
+        res = self.fetch_many({'task': (func, symbol, start_date, end_date, kwargs, split_dates)})
+        return res['task']
@@ -0,0 +1,170 @@
+# encoding: utf-8
+"""
+Vectorized cross-sectional operations within groups (e.g. industry) which may change over time.
+
+All functions work on 2-D arrays whose rows are dates and columns are symbols.
+Group of each element is encoded as an integer segment id unique to (row, group),
+so that each operation is done with one sort or one np.bincount over the whole array.
+NaN values are ignored. Elements whose group is missing get NaN.
+"""
+import numpy as np
+import pandas as pd
+
+
+def encode_groups(groups, shape=None):
+    """
+    Encode group of each element as an integer segment id unique to (row, group).
+
+    Parameters
+    ----------
+    groups : np.ndarray
+        2-D array of group labels (any dtype), or 1-D array of static group labels of each column.
+    shape : tuple, optional
+        Shape of values. Used to broadcast 1-D groups.
+
+    Returns
+    -------
+    seg : np.ndarray
+        2-D array of dtype int64. -1 for missing group.
+    n_seg : int
+        Number of possible segment ids.
+
+    """
+    groups = np.asarray(groups)
+    if groups.ndim == 1:
+        if shape is None:
+            raise ValueError("shape must be provided for 1-D groups.")
+        groups = np.broadcast_to(groups, shape)
+
+    codes, uniques = pd.factorize(groups.ravel())
+    codes = codes.reshape(groups.shape).astype(np.int64)
+    n_groups = max(len(uniques), 1)
+
+    row = np.arange(groups.shape[0], dtype=np.int64).reshape(-1, 1)
+    seg = np.where(codes >= 0, row * n_groups + codes, -1)
+    return seg, groups.shape[0] * n_groups
+
+
+def _valid_segments(values, groups):
+    values = np.asarray(values, dtype=float)
+    seg, n_seg = encode_groups(groups, values.shape)
+    mask = (seg >= 0) & ~np.isnan(values)
+    return values, seg, n_seg, mask
+
+
+def _broadcast_back(seg, stat):
+    """Take stat of segment of each element. NaN for missing group."""
+    res = np.full(seg.shape, np.nan)
+    has_group = seg >= 0
+    res[has_group] = stat[seg[has_group]]
+    return res
+
+
+def _segment_count_sum(values, seg, n_seg, mask):
+    count = np.bincount(seg[mask], minlength=n_seg).astype(float)
+    total = np.bincount(seg[mask], weights=values[mask], minlength=n_seg)
+    return count, total
+
+
+def group_mean(values, groups):
+    """
+    Mean of each group on each row.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        2-D, rows are dates and columns are symbols.
+    groups : np.ndarray
+        Same shape as values, or 1-D static group of each column.
+
+    Returns
+    -------
+    np.ndarray
+        Same shape as values. Each element is the mean of its group, even if the element itself is NaN.
+
+    """
+    values, seg, n_seg, mask = _valid_segments(values, groups)
+    count, total = _segment_count_sum(values, seg, n_seg, mask)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return _broadcast_back(seg, mean)
+
+
+def group_std(values, groups, ddof=1):
+    """
+    Standard deviation of each group on each row. See group_mean.
+
+    Parameters
+    ----------
+    ddof : int
+        Delta degrees of freedom, same as pandas. Default 1.
+
+    """
+    values, seg, n_seg, mask = _valid_segments(values, groups)
+    count, total = _segment_count_sum(values, seg, n_seg, mask)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        dev = values[mask] - mean[seg[mask]]
+        var = np.bincount(seg[mask], weights=dev * dev, minlength=n_seg) / (count - ddof)
+    var[count - ddof <= 0] = np.nan
+    return _broadcast_back(seg, np.sqrt(var))
+
+
+def group_demean(values, groups):
+    """Subtract mean of its group from each element. See group_mean."""
+    values = np.asarray(values, dtype=float)
+    return values - group_mean(values, groups)
+
+
+def group_standardize(values, groups):
+    """Subtract mean and divide by standard deviation of its group for each element. See group_mean."""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (values - group_mean(values, groups)) / group_std(values, groups)
+
+
+def group_rank(values, groups):
+    """
+    Rank of each element within its group on each row, starting from 1.
+    Tied values get average rank, the same as pd.DataFrame.rank(axis=1).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        2-D, rows are dates and columns are symbols.
+    groups : np.ndarray
+        Same shape as values, or 1-D static group of each column.
+
+    Returns
+    -------
+    np.ndarray
+        Same shape as values.
+
+    """
+    values, seg, n_seg, mask = _valid_segments(values, groups)
+    res = np.full(values.shape, np.nan)
+    if not mask.any():
+        return res
+
+    v = values[mask]
+    s = seg[mask]
+    order = np.lexsort((v, s))
+    v_sorted = v[order]
+    s_sorted = s[order]
+    n = len(order)
+    pos = np.arange(n)
+
+    # runs of equal value within a segment share the average rank
+    new_seg = np.r_[True, s_sorted[1:] != s_sorted[:-1]]
+    new_run = new_seg | np.r_[True, v_sorted[1:] != v_sorted[:-1]]
+    run_id = np.cumsum(new_run) - 1
+    run_start = np.flatnonzero(new_run)
+    run_end = np.r_[run_start[1:], n] - 1
+    seg_start = np.maximum.accumulate(np.where(new_seg, pos, 0))
+
+    rank_sorted = (run_start[run_id] + run_end[run_id]) / 2.0 - seg_start + 1
+
+    rank = np.empty(n)
+    rank[order] = rank_sorted
+    res[mask] = rank
+    return res
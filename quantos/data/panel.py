@@ -0,0 +1,588 @@
+# encoding: utf-8
+"""
+Dense array-backed container of (date, symbol) data of several fields.
+
+Each field is one 2-D array (rows are dates, columns are symbols) sharing the same date and symbol axes:
+numeric fields are stored as float64, other fields (e.g. trade_status, industry) as small integer codes
+of sorted categories, so that comparisons and group lookups are integer operations.
+Date ranges and whole fields are accessed as views of the arrays, without MultiIndex lookup or copy.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import quantos.util.fileio
+
+
+def _save_npy(path, values):
+    """
+    Save array to a temporary file and rename it to path.
+    path may be memory-mapped by a Panel loaded from it, which must not be truncated while mapped.
+
+    """
+    tmp_path = '{:s}.{:d}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        np.save(f, values)
+    os.rename(tmp_path, path)
+
+
+def _is_numeric(values):
+    return values.dtype.kind in 'biuf'
+
+
+def _code_dtype(n_categories):
+    """The smallest signed integer type for codes of n_categories (code -1 is missing)."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _encode(values):
+    """Encode 2-D array of labels as (codes, sorted categories). Missing values get code -1."""
+    codes, categories = pd.factorize(values.ravel(), sort=True)
+    dtype = _code_dtype(len(categories))
+    return codes.reshape(values.shape).astype(dtype), np.asarray(categories, dtype=object)
+
+
+def ffill(values, mask=None):
+    """
+    Fill missing values of a 2-D array with the last valid value above, like pd.DataFrame.fillna(method='ffill').
+
+    Parameters
+    ----------
+    values : np.ndarray
+    mask : np.ndarray of bool, optional
+        Missing values. Default None (pd.isnull(values)).
+
+    Returns
+    -------
+    np.ndarray
+        values itself if nothing is missing, else a new array.
+
+    """
+    if mask is None:
+        mask = pd.isnull(values)
+    if not mask.any():
+        return values
+    rows = np.where(mask, 0, np.arange(values.shape[0]).reshape(-1, 1))
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+
+class Panel(object):
+    """
+    Values of several fields on shared date and symbol axes.
+
+    Attributes
+    ----------
+    dates : np.ndarray
+        Sorted int dates.
+    symbols : list of str
+        Sorted symbols.
+    index_name : str
+        Name of the date axis, e.g. 'trade_date' or 'report_date'.
+    fields : list of str
+
+    """
+    def __init__(self, dates, symbols, index_name='trade_date'):
+        self.dates = np.asarray(dates)
+        self.symbols = list(symbols)
+        self.index_name = index_name
+
+        # {field: np.ndarray of shape (n_dates, n_symbols)}. float64 or integer codes.
+        self._arrays = dict()
+        # {field: np.ndarray of categories, the last element is NaN (code -1)}
+        self._categories = dict()
+
+        self._date_pos = None
+        self._symbol_pos = None
+
+    def __contains__(self, field):
+        return field in self._arrays
+
+    @property
+    def fields(self):
+        return sorted(self._arrays.keys())
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+    @property
+    def nbytes(self):
+        return (sum(arr.nbytes for arr in self._arrays.viewvalues())
+                + sum(cat.nbytes for cat in self._categories.viewvalues()))
+
+    @property
+    def date_pos(self):
+        """dict of {date: row position}"""
+        if self._date_pos is None:
+            self._date_pos = {date: i for i, date in enumerate(self.dates)}
+        return self._date_pos
+
+    @property
+    def symbol_pos(self):
+        """dict of {symbol: column position}"""
+        if self._symbol_pos is None:
+            self._symbol_pos = {sec: i for i, sec in enumerate(self.symbols)}
+        return self._symbol_pos
+
+    # -----------------------------------------------------
+    # fields
+    def set_field(self, field, values):
+        """
+        Add or replace a field.
+
+        Parameters
+        ----------
+        field : str
+        values : np.ndarray
+            shape = (n_dates, n_symbols). Numeric values are stored as float64, others as categories.
+
+        """
+        values = np.asarray(values) if not isinstance(values, np.ndarray) else values
+        if values.shape != self.shape:
+            raise ValueError("Shape of field [{:s}] is {}, expected {}.".format(field, values.shape, self.shape))
+
+        if _is_numeric(values):
+            if values.dtype != np.float64:
+                values = values.astype(np.float64)
+            self._arrays[field] = values
+            self._categories.pop(field, None)
+        else:
+            codes, categories = _encode(values)
+            self.set_codes(field, codes, categories)
+
+    def set_codes(self, field, codes, categories):
+        """Add or replace a categorical field by its codes (-1 for missing) and categories."""
+        dtype = _code_dtype(len(categories))
+        if codes.dtype != dtype and not isinstance(codes, np.memmap):
+            codes = codes.astype(dtype)
+        self._arrays[field] = codes
+        self._categories[field] = np.append(np.asarray(categories, dtype=object), np.nan)
+
+    def drop_field(self, field):
+        self._arrays.pop(field)
+        self._categories.pop(field, None)
+
+    def is_categorical(self, field):
+        return field in self._categories
+
+    def get_codes(self, field):
+        """
+        Get codes and categories of a categorical field.
+
+        Returns
+        -------
+        codes : np.ndarray
+            shape = (n_dates, n_symbols), dtype = int8 (or larger integer for many categories).
+            -1 for missing values.
+        categories : np.ndarray
+            Sorted.
+
+        """
+        return self._arrays[field], self._categories[field][:-1]
+
+    def get_code(self, field, label):
+        """
+        Code of label in a categorical field.
+
+        Returns
+        -------
+        int
+            -2 if label is not a category, so that it equals no code.
+
+        """
+        categories = self._categories[field][:-1]
+        pos = np.flatnonzero(categories == label)
+        return int(pos[0]) if len(pos) else -2
+
+    def get_values(self, field, rows=None, cols=None):
+        """
+        Get values of a field. Numeric fields are returned as views when rows and cols are slices.
+
+        Parameters
+        ----------
+        field : str
+        rows, cols : slice or array of positions, optional
+            Default None (all).
+
+        Returns
+        -------
+        np.ndarray
+            float64, or object for categorical fields.
+
+        """
+        values = self._arrays[field]
+        if rows is not None:
+            values = values[rows]
+        if cols is not None:
+            values = values[..., cols]
+
+        categories = self._categories.get(field, None)
+        if categories is not None:
+            values = categories[values]  # code -1 is the trailing NaN
+        return values
+
+    # -----------------------------------------------------
+    # positions
+    def get_date_slice(self, start_date=None, end_date=None):
+        """Slice of rows whose dates are in [start_date, end_date]."""
+        start = 0 if start_date is None else np.searchsorted(self.dates, start_date, side='left')
+        end = len(self.dates) if end_date is None else np.searchsorted(self.dates, end_date, side='right')
+        return slice(start, end)
+
+    def get_symbol_indexer(self, symbols=None):
+        """
+        Column positions of symbols. Symbols not in this panel are dropped.
+
+        Returns
+        -------
+        cols : slice or np.ndarray
+            slice if all symbols are selected.
+        symbols : list of str
+
+        """
+        if symbols is None:
+            return slice(None), self.symbols
+        symbol_pos = self.symbol_pos
+        symbols = sorted(set(sec for sec in symbols if sec in symbol_pos))
+        if len(symbols) == len(self.symbols):
+            return slice(None), self.symbols
+        return np.array([symbol_pos[sec] for sec in symbols], dtype=int), symbols
+
+    # -----------------------------------------------------
+    # DataFrame
+    def get_frame(self, field, symbols=None, start_date=None, end_date=None):
+        """
+        Get values of a field as DataFrame.
+        Numeric values of all symbols share memory with this panel, do not modify them in place.
+
+        Parameters
+        ----------
+        field : str
+        symbols : list of str, optional
+            Default None (all symbols).
+        start_date, end_date : int, optional
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is date, columns are symbols.
+
+        """
+        rows = self.get_date_slice(start_date, end_date)
+        cols, symbols = self.get_symbol_indexer(symbols)
+        res = pd.DataFrame(self.get_values(field, rows, cols), index=self.dates[rows],
+                           columns=pd.Index(symbols, name='symbol'), copy=False)
+        res.index.name = self.index_name
+        return res
+
+    def to_multi_index_df(self, symbols=None, fields=None, start_date=None, end_date=None):
+        """
+        Build DataFrame whose index is date and columns are symbol-field MultiIndex, sorted by symbol and field.
+
+        Returns
+        -------
+        pd.DataFrame or None
+            None if there is no field.
+
+        """
+        fields = self.fields if fields is None else [field for field in fields if field in self]
+        if not fields:
+            return None
+
+        dic = {field: self.get_frame(field, symbols, start_date, end_date) for field in fields}
+        res = pd.concat(dic, axis=1)
+        res.columns = res.columns.swaplevel(0, 1)
+        res.columns.names = ['symbol', 'field']
+        res = res.sort_index(axis=1, level=['symbol', 'field'])
+        res.index.name = self.index_name
+        return res
+
+    @classmethod
+    def from_multi_index_df(cls, df):
+        """
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Index is date, columns are symbol-field MultiIndex.
+
+        Returns
+        -------
+        Panel
+
+        """
+        symbols = sorted(pd.unique(df.columns.get_level_values('symbol')))
+        res = cls(df.index.values, symbols, index_name=df.index.name)
+        for field in pd.unique(df.columns.get_level_values('field')):
+            res.set_field(field, df.xs(field, axis=1, level='field').reindex(columns=symbols).values)
+        return res
+
+    @classmethod
+    def from_frames(cls, dic, index_name='trade_date'):
+        """
+        Parameters
+        ----------
+        dic : dict
+            {field: pd.DataFrame}, index is date, columns are symbols. Aligned by outer join.
+
+        Returns
+        -------
+        Panel
+
+        """
+        frames = dic.values()
+        dates = np.unique(np.concatenate([df.index.values for df in frames]))
+        symbols = sorted(set().union(*[df.columns for df in frames]))
+        res = cls(dates, symbols, index_name=index_name)
+        for field, df in dic.viewitems():
+            res.set_field(field, df.reindex(index=dates, columns=symbols).values)
+        return res
+
+    @classmethod
+    def from_symbol_frames(cls, dic, symbols=None, index_name='trade_date'):
+        """
+        Parameters
+        ----------
+        dic : dict
+            {symbol: pd.DataFrame}, index is date, columns are fields. Aligned by outer join.
+        symbols : list of str, optional
+            All symbols of the panel, symbols not in dic get NaN. Default None (keys of dic).
+
+        Returns
+        -------
+        Panel
+
+        """
+        if symbols is None:
+            symbols = dic.keys()
+        symbols = sorted(symbols)
+        frames = dic.values()
+        dates = np.unique(np.concatenate([df.index.values for df in frames]))
+        fields = sorted(set().union(*[df.columns for df in frames]))
+
+        columns = {field: [] for field in fields}
+        missing = np.full(len(dates), np.nan)
+        for sec in symbols:
+            df = dic.get(sec, None)
+            if df is not None:
+                df = df.loc[:, ~df.columns.duplicated(keep='last')].reindex(dates)
+            for field in fields:
+                columns[field].append(missing if df is None or field not in df else df[field].values)
+
+        res = cls(dates, symbols, index_name=index_name)
+        for field in fields:
+            res.set_field(field, np.column_stack(columns[field]))
+        return res
+
+    # -----------------------------------------------------
+    # alignment
+    def _take(self, field, rows, cols):
+        """Values (codes for categorical fields) at positions, -1 positions are missing."""
+        values = self._arrays[field]
+        fill = -1 if self.is_categorical(field) else np.nan
+        if rows is not None:
+            values = np.where((rows >= 0).reshape(-1, 1), values[rows], fill)
+        if cols is not None:
+            values = np.where(cols >= 0, values[:, cols], fill)
+        return values.astype(self._arrays[field].dtype if self.is_categorical(field) else np.float64)
+
+    def reindex(self, dates=None, symbols=None):
+        """
+        Conform to new dates and symbols. Missing values are NaN.
+        Arrays are shared with this panel if dates and symbols are unchanged.
+
+        Returns
+        -------
+        Panel
+
+        """
+        dates = self.dates if dates is None else np.asarray(dates)
+        symbols = self.symbols if symbols is None else sorted(symbols)
+        rows = None if np.array_equal(dates, self.dates) else pd.Index(self.dates).get_indexer(dates)
+        cols = None if symbols == self.symbols else pd.Index(self.symbols).get_indexer(symbols)
+
+        res = Panel(dates, symbols, index_name=self.index_name)
+        for field in self.fields:
+            if rows is None and cols is None:
+                res._arrays[field] = self._arrays[field]
+            else:
+                res._arrays[field] = self._take(field, rows, cols)
+            if self.is_categorical(field):
+                res._categories[field] = self._categories[field]
+        return res
+
+    def date_slice(self, start_date=None, end_date=None):
+        """Panel of dates in [start_date, end_date], arrays are views of this panel."""
+        rows = self.get_date_slice(start_date, end_date)
+        res = Panel(self.dates[rows], self.symbols, index_name=self.index_name)
+        for field in self.fields:
+            res._arrays[field] = self._arrays[field][rows]
+            if self.is_categorical(field):
+                res._categories[field] = self._categories[field]
+        return res
+
+    def ffill(self):
+        """Fill missing values of each field with the last valid value of earlier dates, in place."""
+        for field in self.fields:
+            values = self._arrays[field]
+            mask = values < 0 if self.is_categorical(field) else np.isnan(values)
+            self._arrays[field] = ffill(values, mask)
+
+    # -----------------------------------------------------
+    # file I/O
+    def save(self, folder):
+        """
+        Save each field to a separate .npy file, with dates, symbols and categories in layout.json.
+        folder can be the folder this Panel is loaded (memory-mapped) from.
+
+        Parameters
+        ----------
+        folder : str
+
+        """
+        layout = {'index': [int(x) for x in self.dates],
+                  'index_name': self.index_name,
+                  'symbols': self.symbols,
+                  'fields': dict()}
+
+        layout_path = os.path.join(folder, 'layout.json')
+        quantos.util.fileio.create_dir(layout_path)
+        for field in self.fields:
+            values = self._arrays[field]
+            file_name = field + '.npy'
+            _save_npy(os.path.join(folder, file_name), np.ascontiguousarray(values))
+            info = {'file': file_name, 'dtype': str(values.dtype)}
+            if self.is_categorical(field):
+                info['categories'] = field + '.categories.npy'
+                _save_npy(os.path.join(folder, info['categories']), self._categories[field][:-1])
+            layout['fields'][field] = info
+        quantos.util.fileio.save_json(layout, layout_path)
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """
+        Load panel saved by save.
+
+        Parameters
+        ----------
+        folder : str
+        mmap_mode : {None, 'r', 'r+', 'c'}, optional
+            Passed to np.load. Fields are read from disk on access if not None.
+
+        Returns
+        -------
+        Panel or None
+            None if folder does not contain layout.json.
+
+        """
+        layout = quantos.util.fileio.read_json(os.path.join(folder, 'layout.json'))
+        if layout is None:
+            return None
+
+        res = cls(np.array(layout['index'], dtype=int), [str(sec) for sec in layout['symbols']],
+                  index_name=layout['index_name'])
+        for field, info in layout['fields'].viewitems():
+            field = str(field)
+            if info['dtype'] == 'object':
+                # saved by earlier versions, values are stored directly
+                res.set_field(field, np.load(os.path.join(folder, info['file'])))
+                continue
+            values = np.load(os.path.join(folder, info['file']), mmap_mode=mmap_mode)
+            if 'categories' in info:
+                res.set_codes(field, values, np.load(os.path.join(folder, info['categories'])))
+            else:
+                res._arrays[field] = values
+        return res
+
+
+def merge(panels):
+    """
+    Merge fields of panels. Dates and symbols are aligned by outer join.
+    If a field exists in more than one panel, the first one is kept.
+
+    Parameters
+    ----------
+    panels : list of Panel
+        None is ignored.
+
+    Returns
+    -------
+    Panel or None
+        None if there is no panel.
+
+    """
+    panels = [p for p in panels if p is not None]
+    if not panels:
+        return None
+    dates = np.unique(np.concatenate([p.dates for p in panels]))
+    symbols = sorted(set().union(*[p.symbols for p in panels]))
+
+    res = Panel(dates, symbols, index_name=panels[0].index_name)
+    for p in panels:
+        p = p.reindex(dates, symbols)
+        for field in p.fields:
+            if field not in res:
+                res._arrays[field] = p._arrays[field]
+                if p.is_categorical(field):
+                    res._categories[field] = p._categories[field]
+    return res
+
+
+def concat_dates(panel, other):
+    """
+    Append dates of other to panel. Symbols and fields are those of panel, missing values are NaN.
+
+    Parameters
+    ----------
+    panel, other : Panel
+        Dates of other must be later than dates of panel.
+
+    Returns
+    -------
+    Panel
+
+    """
+    other = other.reindex(symbols=panel.symbols)
+    res = Panel(np.concatenate([panel.dates, other.dates]), panel.symbols, index_name=panel.index_name)
+    n_other = len(other.dates)
+    for field in panel.fields:
+        if field not in other:
+            values = np.full((n_other, len(panel.symbols)), np.nan)
+        else:
+            values = other.get_values(field)
+        if panel.is_categorical(field):
+            res.set_field(field, np.concatenate([panel.get_values(field), values.astype(object)], axis=0))
+        else:
+            res.set_field(field, np.concatenate([panel._arrays[field], values], axis=0))
+    return res
+
+
+def combine_first(panel, other):
+    """
+    Values of panel, with missing values filled by values of other. The same as pd.DataFrame.combine_first.
+    Dates are aligned by outer join. Symbols and fields are those of other.
+
+    Parameters
+    ----------
+    panel, other : Panel
+
+    Returns
+    -------
+    Panel
+
+    """
+    dates = np.union1d(panel.dates, other.dates)
+    new = panel.reindex(dates, other.symbols)
+    old = other.reindex(dates)
+    res = Panel(dates, other.symbols, index_name=other.index_name)
+    for field in other.fields:
+        if field not in new:
+            res.set_field(field, old.get_values(field))
+            continue
+        values = new.get_values(field)
+        res.set_field(field, np.where(pd.isnull(values), old.get_values(field), values))
+    return res
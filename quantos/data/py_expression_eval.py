@@ -21,6 +21,9 @@ import numpy as np
 import pandas as pd
 
 from quantos.data.align import align
+from quantos.data import grouping
+from quantos.data import rolling
+from quantos.data.streaming import StreamingFormula
 
 TNUMBER = 0
 TOP1 = 1
@@ -343,6 +346,10 @@ class Parser(object):
         self.ann_dts = None
         self.trade_dts = None
         self.df_group = None
+        
+        # compiled DAG of self.tokens and cache of node values
+        self.root = None
+        self.cache = None
     
     # -----------------------------------------------------
     # functions
@@ -510,14 +517,23 @@ class Parser(object):
         (x, y) = self._align_bivariate(x, y)
         return pd.rolling_cov(x, y, n)
     
+    @staticmethod
+    def _apply_rolling(func, x, *args):
+        """Apply a rolling kernel (see quantos.data.rolling) on each column of x."""
+        if isinstance(x, pd.DataFrame):
+            return pd.DataFrame(index=x.index, columns=x.columns, data=func(x.values, *args))
+        elif isinstance(x, pd.Series):
+            return pd.Series(index=x.index, data=func(x.values, *args), name=x.name)
+        return func(x, *args)
+    
     def std_dev(self, x, n):
-        return pd.rolling_std(x, n)
+        return self._apply_rolling(rolling.rolling_std, x, n)
     
     def sum(self, x, n):
-        return pd.rolling_sum(x, n)
+        return self._apply_rolling(rolling.rolling_sum, x, n)
     
     def count_nans(self, x, n):
-        return n - pd.rolling_count(x, n)
+        return n - self._apply_rolling(rolling.rolling_count, x, n)
     
     def delay(self, x, n):
         return x.shift(n)
@@ -535,22 +551,22 @@ class Parser(object):
         return res
     
     def ts_mean(self, x, n):
-        return pd.rolling_mean(x, n)
+        return self._apply_rolling(rolling.rolling_mean, x, n)
     
     def ts_min(self, x, n):
-        return pd.rolling_min(x, n)
+        return self._apply_rolling(rolling.rolling_min, x, n)
     
     def ts_max(self, x, n):
-        return pd.rolling_max(x, n)
+        return self._apply_rolling(rolling.rolling_max, x, n)
     
     def ts_kurt(self, x, n):
-        return pd.rolling_kurt(x, n)
+        return self._apply_rolling(rolling.rolling_kurt, x, n)
     
     def ts_skew(self, x, n):
-        return pd.rolling_skew(x, n)
+        return self._apply_rolling(rolling.rolling_skew, x, n)
     
     def product(self, x, n):
-        return pd.rolling_apply(x, n, np.product)
+        return self._apply_rolling(rolling.rolling_product, x, n)
 
     def rank(self, x):
         x = self._align_univariate(x)
@@ -564,23 +580,11 @@ class Parser(object):
             st.loc[:, col] = range(begin, n, 1)
         return st
     
-    def decay_exp_array(self, x, f):
-        n = len(x)
-        step = range(0, n)
-        step = step[::-1]
-        fs = np.power(f, step)
-        return np.dot(x, fs) / np.sum(fs)
-    
-    def decay_linear_array(self, x):
-        n = len(x) + 1
-        step = range(1, n)
-        return np.dot(x, step) / np.sum(step)
-    
     def decay_linear(self, x, n):
-        return pd.rolling_apply(x, n, self.decay_linear_array)
+        return self._apply_rolling(rolling.rolling_decay_linear, x, n)
     
     def decay_exp(self, x, f, n):
-        return pd.rolling_apply(x, n, self.decay_exp_array, args=[f])
+        return self._apply_rolling(rolling.rolling_decay_exp, x, f, n)
     
     def signed_power(self, x, e):
         signs = np.sign(x)
@@ -598,15 +602,9 @@ class Parser(object):
     # TODO: all cross-section operations support in-group modification: neutral, extreme values, standardize.
     def group_rank(self, x, group):
         x = self._align_univariate(x)
-        vals = pd.Series(group.values.ravel()).unique()
-        df = None
-        for val in vals:
-            rank = x[group == val].rank(axis=1)
-            if df is None:
-                df = rank
-            else:
-                df.fillna(rank, inplace=True)
-        return df
+        group = group.reindex(index=x.index, columns=x.columns)
+        res = grouping.group_rank(x.values, group.values)
+        return pd.DataFrame(index=x.index, columns=x.columns, data=res)
 
     def group_apply(self, func, df_arg, *args, **kwargs):
         """
@@ -628,6 +626,10 @@ class Parser(object):
         """
         df_group = self.df_group
         
+        # functions which have vectorized version
+        vectorized = {self.rank: grouping.group_rank,
+                      self.standardize: grouping.group_standardize}
+        
         def gp_apply(df_value, df_group_):
             """df has date index and symbol columns."""
             gp = df_value.groupby(by=df_group_, axis=1)
@@ -637,6 +639,19 @@ class Parser(object):
         # align for quarterly data
         df_arg = self._align_univariate(df_arg)
         
+        vec_func = vectorized.get(func)
+        if vec_func is not None and not args and not kwargs:
+            if isinstance(df_group, pd.DataFrame) and (df_group.shape[0] == 1 or df_group.shape[1] == 1):
+                df_group = df_group.squeeze()
+            if isinstance(df_group, pd.Series):
+                groups = df_group.reindex(df_arg.columns).values
+            elif isinstance(df_group, pd.DataFrame):
+                groups = df_group.reindex(index=df_arg.index, columns=df_arg.columns).values
+            else:
+                raise NotImplementedError("type of df_group{}".format(type(df_group)))
+            res = vec_func(df_arg.values, groups)
+            return pd.DataFrame(index=df_arg.index, columns=df_arg.columns, data=res)
+        
         # validity check
         if isinstance(df_group, pd.DataFrame):
             if df_group.shape[0] == 1 or df_group.shape[1] == 1:
@@ -682,7 +697,7 @@ class Parser(object):
 
         """
         axis = 1
-        x = df.values
+        x = df.values.copy()
         
         median = np.median(x, axis=axis)
         diff = x - median
@@ -699,18 +714,29 @@ class Parser(object):
     
     # -----------------------------------------------------
     # align functions
+    def _align(self, df):
+        """Expand quarterly df to daily. Each DataFrame is aligned only once during evaluation."""
+        if self.cache is None:
+            return align(df, self.ann_dts, self.trade_dts)
+        
+        key = ('align', id(df))
+        if key not in self.cache:
+            # keep df in cache so that its id will not be reused
+            self.cache[key] = (df, align(df, self.ann_dts, self.trade_dts))
+        return self.cache[key][1]
+    
     def _align_bivariate(self, df1, df2, force_align=False):
         if isinstance(df1, pd.DataFrame) and isinstance(df2, pd.DataFrame):
             len1 = len(df1.index)
             len2 = len(df2.index)
             if (self.ann_dts is not None) and (self.trade_dts is not None):
                 if len1 > len2:
-                    df2 = align(df2, self.ann_dts, self.trade_dts)
+                    df2 = self._align(df2)
                 elif len1 < len2:
-                    df1 = align(df1, self.ann_dts, self.trade_dts)
+                    df1 = self._align(df1)
                 elif force_align:
-                    df1 = align(df1, self.ann_dts, self.trade_dts)
-                    df2 = align(df2, self.ann_dts, self.trade_dts)
+                    df1 = self._align(df1)
+                    df2 = self._align(df2)
         return (df1, df2)
 
     def _align_univariate(self, df1):
@@ -719,7 +745,7 @@ class Parser(object):
                 len1 = len(df1.index)
                 len2 = len(self.trade_dts)
                 if len1 != len2:
-                    return align(df1, self.ann_dts, self.trade_dts)
+                    return self._align(df1)
         return df1
 
     # -----------------------------------------------------
@@ -905,9 +931,94 @@ class Parser(object):
         if (noperators + 1) != len(tokenstack):
             self.error_parsing(self.pos, 'parity')
         self.tokens = tokenstack
+        self.root = None
         return Expression(tokenstack, self.ops1, self.ops2, self.functions)
     
-    def evaluate(self, values, ann_dts=None, trade_dts=None, df_group=None):
+    def compile(self):
+        """
+        Convert RPN tokens of the last parsed expression into a DAG.
+        
+        Each node is a hashable tuple of its type, name and child nodes, so identical
+        sub-expressions (within one formula or across formulas) are the same node:
+            ('num', value), ('var', name), ('op1', name, x), ('op2', name, x, y),
+            ('call', func_node, (arg_nodes)), ('list', (item_nodes))
+        
+        Returns
+        -------
+        root : tuple
+
+        """
+        nstack = []
+        for item in self.tokens:
+            type_ = item.type_
+            if type_ == TNUMBER:
+                if isinstance(item.number_, list):  # arguments of nullary call
+                    nstack.append(('list', tuple()))
+                else:
+                    nstack.append(('num', type(item.number_).__name__, repr(item.number_), item.number_))
+            elif type_ == TVAR:
+                nstack.append(('var', item.index_))
+            elif type_ == TOP1:
+                n1 = nstack.pop()
+                nstack.append(('op1', item.index_, n1))
+            elif type_ == TOP2:
+                n2 = nstack.pop()
+                n1 = nstack.pop()
+                if item.index_ == ',':
+                    items = n1[1] if n1[0] == 'list' else (n1,)
+                    nstack.append(('list', items + (n2,)))
+                else:
+                    nstack.append(('op2', item.index_, n1, n2))
+            elif type_ == TFUNCALL:
+                n1 = nstack.pop()
+                f = nstack.pop()
+                args = n1[1] if n1[0] == 'list' else (n1,)
+                nstack.append(('call', f, args))
+            else:
+                raise Exception('invalid Expression')
+        if len(nstack) > 1:
+            raise Exception('invalid Expression (parity)')
+        
+        self.root = nstack[0]
+        return self.root
+    
+    def _eval_node(self, node, values):
+        """Evaluate a node of the DAG. Values of all nodes are stored in self.cache."""
+        if node in self.cache:
+            return self.cache[node]
+        
+        type_ = node[0]
+        if type_ == 'num':
+            return node[3]
+        elif type_ == 'var':
+            name = node[1]
+            if name in values:
+                return values[name]
+            elif name in self.functions:
+                return self.functions[name]
+            else:
+                raise Exception('undefined variable: ' + name)
+        elif type_ == 'op1':
+            res = self.ops1[node[1]](self._eval_node(node[2], values))
+        elif type_ == 'op2':
+            n1 = self._eval_node(node[2], values)
+            n2 = self._eval_node(node[3], values)
+            res = self.ops2[node[1]](n1, n2)
+        elif type_ == 'call':
+            f = self._eval_node(node[1], values)
+            args = [self._eval_node(arg, values) for arg in node[2]]
+            if not callable(f):
+                raise Exception('{} is not a function'.format(f))
+            res = f(*args)
+        elif type_ == 'list':
+            return [self._eval_node(item, values) for item in node[1]]
+        else:
+            raise Exception('invalid Expression')
+        
+        self.cache[node] = res
+        return res
+    
+    def evaluate(self, values, ann_dts=None, trade_dts=None, df_group=None, cache=None):
         """
         Evaluate the value of expression using. Data of different frequency will be automatically expanded.
         
@@ -922,6 +1033,11 @@ class Parser(object):
         df_group : pd.DataFrame
             Group codes used by group_apply function.
             Index is date, column is symbol.
+        cache : dict, optional
+            Values of evaluated sub-expressions. Pass the same dict to several evaluate calls
+            to share results of common sub-expressions across formulas. It is only valid
+            while values, ann_dts, trade_dts and df_group do not change.
+            Results in cache must not be modified in place.
 
         Returns
         -------
@@ -931,46 +1047,39 @@ class Parser(object):
         self.ann_dts = ann_dts
         self.trade_dts = trade_dts
         self.df_group = df_group
+        self.cache = dict() if cache is None else cache
         
         values = values or {}
-        nstack = []
-        L = len(self.tokens)
-        for i in range(0, L):
-            item = self.tokens[i]
-            type_ = item.type_
-            if type_ == TNUMBER:
-                nstack.append(item.number_)
-            elif type_ == TOP2:
-                n2 = nstack.pop()
-                n1 = nstack.pop()
-                f = self.ops2[item.index_]
-                nstack.append(f(n1, n2))
-            elif type_ == TVAR:
-                if item.index_ in values:
-                    nstack.append(values[item.index_])
-                elif item.index_ in self.functions:
-                    nstack.append(self.functions[item.index_])
-                else:
-                    raise Exception('undefined variable: ' + item.index_)
-            elif type_ == TOP1:
-                n1 = nstack.pop()
-                f = self.ops1[item.index_]
-                nstack.append(f(n1))
-            elif type_ == TFUNCALL:
-                n1 = nstack.pop()
-                f = nstack.pop()
-                if callable(f):
-                    if type(n1) is list:
-                        nstack.append(f(*n1))
-                    else:
-                        nstack.append(f(n1))  # call(f, n1)
-                else:
-                    raise Exception(f + ' is not a function')
-            else:
-                raise Exception('invalid Expression')
-        if len(nstack) > 1:
-            raise Exception('invalid Expression (parity)')
-        return nstack[0]
+        if self.root is None:
+            self.compile()
+        try:
+            res = self._eval_node(self.root, values)
+        finally:
+            if cache is None:
+                self.cache = None
+        return res
+
+    def evaluate_streaming(self, values, df_group=None, callback=None):
+        """
+        Evaluate the expression over history once, then keep state of its time series functions,
+        so that values of new dates can be evaluated incrementally. See StreamingFormula.
+        
+        Parameters
+        ----------
+        values : dict
+            Key is variable name, value is pd.DataFrame (index is date, column is symbol). Daily data only.
+        df_group : pd.DataFrame, optional
+            Group codes used by group_apply function.
+        callback : callable, optional
+            Called with (date, pd.Series) after each update from quote events.
+
+        Returns
+        -------
+        StreamingFormula
+            Call its update method with values of a new date. It can also subscribe to a Publisher.
+
+        """
+        return StreamingFormula(self, values, df_group=df_group, callback=callback)
 
     # -----------------------------------------------------
     # Other
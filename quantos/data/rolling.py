@@ -0,0 +1,257 @@
+# encoding: utf-8
+"""
+Rolling window kernels on 2-D arrays (rows are dates, columns are symbols).
+
+Each kernel costs O(1) per cell regardless of window size:
+running sums (moments, linear decay) are sums of block prefix / suffix cumulative sums,
+running min / max / product use van Herk/Gil-Werman block prefix / suffix accumulations,
+exponential decay uses a recursive update, solved for a block of rows at once.
+
+The same as pandas rolling functions, result is NaN if number of valid values in the window
+is less than min_periods (default window size).
+"""
+import numpy as np
+
+
+def _as_2d(x):
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        return x.reshape(-1, 1)
+    return x
+
+
+def _restore_shape(res, x):
+    return res.reshape(np.shape(x))
+
+
+def window_sum(a, n):
+    """
+    Sum of the last n rows. The first n - 1 rows are sums of partial windows.
+    Rows are split into blocks of size n, so that each window sum is the sum of
+    a block suffix and a block prefix. Rounding error is bounded by values in two blocks
+    instead of all previous rows.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        2-D, must not contain NaN.
+    n : int
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    n_rows, n_cols = a.shape
+    n_blocks = -(-n_rows // n)
+    padded = np.vstack([a, np.zeros((n_blocks * n - n_rows, n_cols))])
+    blocks = padded.reshape(n_blocks, n, n_cols)
+    prefix = np.cumsum(blocks, axis=1).reshape(-1, n_cols)[:n_rows]
+    suffix = np.cumsum(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_cols)[:n_rows]
+
+    res = prefix.copy()
+    if n_rows > n:
+        start = np.arange(1, n_rows - n + 1)  # first row of window ending at row n, n + 1, ...
+        is_block = (start % n == 0).reshape(-1, 1)
+        res[n:] = np.where(is_block, prefix[n:], suffix[start] + prefix[n:])
+    return res
+
+
+def _prepare(x, n, min_periods):
+    x = _as_2d(x)
+    n = int(n)
+    if min_periods is None:
+        min_periods = n
+    valid = ~np.isnan(x)
+    count = window_sum(valid.astype(float), n)
+    return x, n, valid, count, count < max(min_periods, 1)
+
+
+def _moments(x, n, min_periods, k):
+    """Count and sums of powers (1 to k) of centered values in each window."""
+    x, n, valid, count, mask = _prepare(x, n, min_periods)
+    # centering by mean of each column reduces cancellation error
+    center = np.zeros(x.shape[1])
+    n_valid = valid.sum(axis=0)
+    has_valid = n_valid > 0
+    center[has_valid] = np.where(valid, x, 0.0).sum(axis=0)[has_valid] / n_valid[has_valid]
+    a = np.where(valid, x - center, 0.0)
+    sums = []
+    p = np.ones_like(a)
+    for _ in range(k):
+        p = p * a
+        sums.append(window_sum(p, n))
+    return count, mask, center, sums
+
+
+def rolling_count(x, n):
+    """Number of valid values in each window, including partial windows at the beginning."""
+    x2 = _as_2d(x)
+    return _restore_shape(window_sum((~np.isnan(x2)).astype(float), int(n)), x)
+
+
+def rolling_sum(x, n, min_periods=None):
+    x2, n, valid, count, mask = _prepare(x, n, min_periods)
+    res = window_sum(np.where(valid, x2, 0.0), n)
+    res[mask] = np.nan
+    return _restore_shape(res, x)
+
+
+def rolling_mean(x, n, min_periods=None):
+    count, mask, center, (s1,) = _moments(x, n, min_periods, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        res = s1 / count + center
+    res[mask] = np.nan
+    return _restore_shape(res, x)
+
+
+def rolling_std(x, n, min_periods=None, ddof=1):
+    count, mask, center, (s1, s2) = _moments(x, n, min_periods, 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (s2 - s1 * s1 / count) / (count - ddof)
+    var = np.maximum(var, 0.0)
+    var[mask | (count - ddof <= 0)] = np.nan
+    return _restore_shape(np.sqrt(var), x)
+
+
+def _is_constant(var, mean_square):
+    """Variance is zero within rounding error."""
+    return var <= mean_square * 1e-12
+
+
+def rolling_skew(x, n, min_periods=None):
+    """Bias corrected sample skewness, same as pd.rolling_skew."""
+    nobs, mask, _, (s1, s2, s3) = _moments(x, n, min_periods, 3)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = s1 / nobs
+        b = s2 / nobs - a * a
+        c = s3 / nobs - a * a * a - 3 * a * b
+        r = np.sqrt(b)
+        res = np.sqrt(nobs * (nobs - 1.)) * c / ((nobs - 2) * r * r * r)
+        res[mask | _is_constant(b, s2 / nobs) | (nobs < 3)] = np.nan
+    return _restore_shape(res, x)
+
+
+def rolling_kurt(x, n, min_periods=None):
+    """Bias corrected sample excess kurtosis, same as pd.rolling_kurt."""
+    nobs, mask, _, (s1, s2, s3, s4) = _moments(x, n, min_periods, 4)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = s1 / nobs
+        b = s2 / nobs - a * a
+        c = s3 / nobs - a * a * a - 3 * a * b
+        d = s4 / nobs - a * a * a * a - 6 * b * a * a - 4 * c * a
+        k = (nobs * nobs - 1.) * d / (b * b) - 3 * ((nobs - 1.) ** 2)
+        res = k / ((nobs - 2.) * (nobs - 3.))
+        res[mask | _is_constant(b, s2 / nobs) | (nobs < 4)] = np.nan
+    return _restore_shape(res, x)
+
+
+def _block_accumulate(a, n, func, fill):
+    """
+    Apply an associative ufunc (np.minimum, np.multiply, ...) to the last n rows.
+    The first n - 1 rows are results of partial windows.
+
+    """
+    n_rows, n_cols = a.shape
+    # result of window [t - n + 1, t] = func(suffix from t - n + 1, prefix to t) of blocks of size n
+    n_blocks = -(-n_rows // n)
+    a = np.vstack([a, np.full((n_blocks * n - n_rows, n_cols), fill)])
+    blocks = a.reshape(n_blocks, n, n_cols)
+    prefix = func.accumulate(blocks, axis=1).reshape(-1, n_cols)
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_cols)
+
+    res = np.empty((n_rows, n_cols))
+    if n_rows >= n:
+        # a window starting at a block is the block itself, the suffix must not be applied again
+        is_block = (np.arange(n_rows - n + 1) % n == 0).reshape(-1, 1)
+        full = prefix[n - 1: n_rows]
+        res[n - 1:] = np.where(is_block, full, func(suffix[: n_rows - n + 1], full))
+    # partial windows at the beginning
+    m = min(n - 1, n_rows)
+    res[:m] = prefix[:m]
+    return res
+
+
+def _rolling_extreme(x, n, min_periods, func, fill):
+    x2, n, valid, count, mask = _prepare(x, n, min_periods)
+    res = _block_accumulate(np.where(valid, x2, fill), n, func, fill)
+    res[mask] = np.nan
+    return _restore_shape(res, x)
+
+
+def rolling_min(x, n, min_periods=None):
+    return _rolling_extreme(x, n, min_periods, np.minimum, np.inf)
+
+
+def rolling_max(x, n, min_periods=None):
+    return _rolling_extreme(x, n, min_periods, np.maximum, -np.inf)
+
+
+def rolling_product(x, n):
+    """
+    Product of values in each window. NaN if any value in the window is NaN.
+    Each result is the product of a block suffix product and a block prefix product,
+    so zeros and negative values are exact.
+
+    """
+    x2, n, valid, count, mask = _prepare(x, n, None)
+    with np.errstate(over='ignore', invalid='ignore'):
+        res = _block_accumulate(np.where(valid, x2, 1.0), n, np.multiply, 1.0)
+    res[mask] = np.nan
+    return _restore_shape(res, x)
+
+
+def rolling_decay_linear(x, n):
+    """Weighted mean with weights 1, 2, ..., n (the latest value has weight n). NaN if any value is NaN."""
+    x2, n, valid, count, mask = _prepare(x, n, None)
+    a = np.where(valid, x2, 0.0)
+    t = np.arange(x2.shape[0], dtype=float).reshape(-1, 1)
+    # weight of row j in window ending at t is j - (t - n)
+    res = (window_sum(a * t, n) - (t - n) * window_sum(a, n)) / (n * (n + 1) / 2.0)
+    res[mask] = np.nan
+    return _restore_shape(res, x)
+
+
+def _linear_recursion(c, f):
+    """
+    Solve s_t = f * s_{t-1} + c_t (s_{-1} = 0) for all rows.
+    Within a block of rows starting at row b, s_{b + k} = f^(k + 1) * s_{b - 1} + f^k * sum(c_{b + i} * f^(-i), i <= k),
+    so only blocks are iterated. Blocks are small enough that f^(-i) does not overflow.
+
+    """
+    n_rows = c.shape[0]
+    if f == 0 or n_rows == 0:
+        return c.copy()
+    if abs(f) == 1:
+        size = n_rows
+    else:
+        size = int(min(max(200. / abs(np.log10(abs(f))), 1), n_rows))
+    k = np.arange(size, dtype=float).reshape(-1, 1)
+    f_pos = np.power(f, k)
+    f_neg = np.power(f, -k)
+
+    s = np.empty_like(c)
+    prev = np.zeros(c.shape[1])
+    for start in range(0, n_rows, size):
+        s_block = s[start: start + size]  # a view, computed in place
+        m = s_block.shape[0]
+        np.multiply(c[start: start + m], f_neg[:m], out=s_block)
+        np.cumsum(s_block, axis=0, out=s_block)
+        s_block += f * prev
+        s_block *= f_pos[:m]
+        prev = s_block[-1]
+    return s
+
+
+def rolling_decay_exp(x, f, n):
+    """Weighted mean with weights f^(n-1), ..., f, 1 (the latest value has weight 1). NaN if any value is NaN."""
+    x2, n, valid, count, mask = _prepare(x, n, None)
+    a = np.where(valid, x2, 0.0)
+    f = float(f)
+
+    # recursive update: s_t = f * s_{t-1} + a_t - f^n * a_{t-n}
+    c = a.copy()
+    c[n:] -= f ** n * a[:-n]
+    res = _linear_recursion(c, f) / np.sum(np.power(f, np.arange(n)))
+    res[mask] = np.nan
+    return _restore_shape(res, x)
@@ -0,0 +1,312 @@
+# encoding: utf-8
+"""
+Incremental evaluation of formulas: evaluate once over history, then update one date at a time.
+
+Usage:
+    parser = Parser()
+    parser.parse('Rank(Delta(close, 5))')
+    stream = parser.evaluate_streaming({'close': df_close})
+    row = stream.update({'close': ser_close_today}, 20171020)
+"""
+import numpy as np
+import pandas as pd
+
+from quantos.backtest.pubsub import Subscriber
+
+
+class StreamingFormula(Subscriber):
+    """
+    Keep state of each time series operator of a compiled formula, so that a new date can be
+    evaluated with cost independent of length of history:
+        rolling window functions (Ts_Mean, Delay, Corr, ...) keep the last rows of their arguments,
+        Ewma and Sma keep weighted sum accumulators.
+    Other operators work on each row (date) independently, so they are applied on the new row only.
+
+    Values of the latest date may be updated many times (e.g. tick by tick).
+    They are committed to the state when values of a new date arrive.
+
+    Quarterly data is not supported: all values must be daily.
+
+    Attributes
+    ----------
+    parser : Parser
+    history : pd.DataFrame
+        Result of evaluation over history.
+    symbols : pd.Index
+    variables : list of str
+    last_date : int
+        Last committed date.
+    callback : callable or None
+        Called with (date, pd.Series) after each update from on_event.
+
+    """
+    def __init__(self, parser, values, df_group=None, callback=None):
+        Subscriber.__init__(self)
+
+        self.parser = parser
+        self.callback = callback
+        self.root = parser.compile()
+        self.variables = self._get_variables(self.root, parser.functions)
+
+        cache = dict()
+        self.history = parser.evaluate(values, df_group=df_group, cache=cache)
+        self.symbols = self.history.columns
+        self.last_date = self.history.index[-1]
+
+        self._states = dict()
+        self._init_states(self.root, values, cache, set())
+
+        # rows of the latest date, not committed yet: (date, {node: row})
+        self._pending = None
+        # latest values of each variable, used to fill symbols without quote
+        self._last_row = {var: values[var].iloc[-1].reindex(self.symbols) for var in self.variables
+                          if isinstance(values.get(var), pd.DataFrame)}
+        self._quote_date = None
+        self._quote_row = {var: ser.copy() for var, ser in self._last_row.viewitems()}
+
+    # -----------------------------------------------------
+    # state
+    @staticmethod
+    def _get_variables(root, functions):
+        res = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node[0] == 'var':
+                if node[1] not in functions:
+                    res.add(node[1])
+            elif node[0] in ('op1', 'op2'):
+                stack.extend(node[2:])
+            elif node[0] == 'list':
+                stack.extend(node[1])
+            elif node[0] == 'call':
+                stack.append(node[1])
+                stack.extend(node[2])
+        return sorted(res)
+    
+    def _get_window_size(self, func, args):
+        """Number of rows needed by a rolling window function, None for functions that work on each row."""
+        p = self.parser
+        if func in (p.delay, p.delta):
+            return int(args[1]) + 1
+        elif func is p.calc_return:
+            return int(args[1] if len(args) > 1 else 1) + 1
+        elif func in (p.corr, p.cov, p.decay_exp):
+            return int(args[2])
+        elif func in (p.std_dev, p.sum, p.count_nans, p.ts_mean, p.ts_min, p.ts_max, p.ts_kurt, p.ts_skew,
+                      p.product, p.decay_linear):
+            return int(args[1])
+        return None
+
+    @staticmethod
+    def _get_ewm_alpha(func, args, p):
+        if func is p.ewma:
+            return 1 - np.exp(np.log(0.5) / args[1])
+        elif func is p.sma:
+            return 1.0 / (args[1] * 1.0 / args[2])
+        return None
+
+    def _init_states(self, node, values, cache, visited):
+        if node in visited:
+            return
+        visited.add(node)
+
+        type_ = node[0]
+        if type_ in ('op1', 'op2'):
+            for child in node[2:]:
+                self._init_states(child, values, cache, visited)
+        elif type_ == 'list':
+            for child in node[1]:
+                self._init_states(child, values, cache, visited)
+        elif type_ == 'call':
+            for child in node[2]:
+                self._init_states(child, values, cache, visited)
+
+            func = self._history_value(node[1], values, cache)
+            args = [self._history_value(child, values, cache) for child in node[2]]
+
+            n = self._get_window_size(func, args)
+            alpha = self._get_ewm_alpha(func, args, self.parser)
+            if n is not None:
+                # last n - 1 rows of each DataFrame argument
+                buffers = [arg.iloc[len(arg) - n + 1:] if isinstance(arg, pd.DataFrame) else None
+                           for arg in args]
+                self._states[node] = {'kind': 'window', 'size': n, 'buffers': buffers}
+            elif alpha is not None:
+                x = args[0].values
+                valid = ~np.isnan(x)
+                weights = np.power(1 - alpha, np.arange(len(x))[::-1]).reshape(-1, 1)
+                self._states[node] = {'kind': 'ewm', 'alpha': alpha,
+                                      'num': np.sum(np.where(valid, x, 0.0) * weights, axis=0),
+                                      'den': np.sum(valid * weights, axis=0)}
+            elif func == self.parser.step:
+                self._states[node] = {'kind': 'step'}
+
+    def _history_value(self, node, values, cache):
+        if node in cache:
+            return cache[node]
+        elif node[0] == 'num':
+            return node[3]
+        elif node[0] == 'var':
+            name = node[1]
+            return values[name] if name in values else self.parser.functions[name]
+        elif node[0] == 'list':
+            return [self._history_value(child, values, cache) for child in node[1]]
+        raise ValueError("value of node {} is not evaluated.".format(node))
+
+    def _commit(self):
+        """Add rows of pending date to state."""
+        date, rows = self._pending
+        for node, state in self._states.viewitems():
+            if state['kind'] == 'window':
+                n = state['size']
+                for i, child in enumerate(node[2]):
+                    buf = state['buffers'][i]
+                    if buf is not None:
+                        state['buffers'][i] = pd.concat([buf, rows[child]], axis=0).iloc[max(len(buf) + 2 - n, 0):]
+            elif state['kind'] == 'ewm':
+                x = rows[node[2][0]].values[0]
+                valid = ~np.isnan(x)
+                state['num'] = (1 - state['alpha']) * state['num'] + np.where(valid, x, 0.0)
+                state['den'] = (1 - state['alpha']) * state['den'] + valid
+
+        self.last_date = date
+        self._pending = None
+
+    # -----------------------------------------------------
+    # evaluation
+    def _to_row(self, value, date):
+        """Convert value of a variable on one date to DataFrame with one row."""
+        if isinstance(value, pd.DataFrame):
+            value = value.iloc[-1]
+        elif isinstance(value, dict):
+            value = pd.Series(value)
+        return pd.DataFrame([value.reindex(self.symbols).values], index=[date], columns=self.symbols)
+
+    def _eval_row(self, node, row_values, date, rows):
+        if node in rows:
+            return rows[node]
+
+        p = self.parser
+        type_ = node[0]
+        if type_ == 'num':
+            return node[3]
+        elif type_ == 'var':
+            name = node[1]
+            if name in row_values:
+                res = self._to_row(row_values[name], date)
+            elif name in p.functions:
+                return p.functions[name]
+            else:
+                raise Exception('undefined variable: ' + name)
+        elif type_ == 'op1':
+            res = p.ops1[node[1]](self._eval_row(node[2], row_values, date, rows))
+        elif type_ == 'op2':
+            n1 = self._eval_row(node[2], row_values, date, rows)
+            n2 = self._eval_row(node[3], row_values, date, rows)
+            res = p.ops2[node[1]](n1, n2)
+        elif type_ == 'list':
+            return [self._eval_row(child, row_values, date, rows) for child in node[1]]
+        elif type_ == 'call':
+            f = self._eval_row(node[1], row_values, date, rows)
+            args = [self._eval_row(child, row_values, date, rows) for child in node[2]]
+            state = self._states.get(node)
+            if state is None:
+                # functions on each row
+                res = f(*args)
+            elif state['kind'] == 'window':
+                args_window = [arg if buf is None else pd.concat([buf, arg], axis=0)
+                               for buf, arg in zip(state['buffers'], args)]
+                res = f(*args_window).iloc[[-1]]
+            elif state['kind'] == 'ewm':
+                x = args[0].values[0]
+                valid = ~np.isnan(x)
+                num = (1 - state['alpha']) * state['num'] + np.where(valid, x, 0.0)
+                den = (1 - state['alpha']) * state['den'] + valid
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    data = np.where(den > 0, num / den, np.nan)
+                res = pd.DataFrame([data], index=[date], columns=self.symbols)
+            else:
+                # Step: the last row is always n
+                res = pd.DataFrame(float(args[1]), index=[date], columns=self.symbols)
+        else:
+            raise Exception('invalid Expression')
+
+        rows[node] = res
+        return res
+
+    def update(self, row_values, date, df_group=None):
+        """
+        Evaluate formula on a new date, or re-evaluate the latest date with new values.
+
+        Parameters
+        ----------
+        row_values : dict
+            {var: pd.Series or dict}. Values of each variable on this date, index is symbol.
+        date : int
+            Must not be earlier than the latest date.
+        df_group : pd.Series, optional
+            Group of each symbol on this date, used by GroupApply.
+
+        Returns
+        -------
+        pd.Series
+            Value of formula of each symbol on this date.
+
+        """
+        if self._pending is not None and date != self._pending[0]:
+            self._commit()
+        if date <= self.last_date:
+            raise ValueError("Date {} is not later than last date {}.".format(date, self.last_date))
+
+        self.parser.ann_dts = None
+        self.parser.trade_dts = None
+        self.parser.df_group = df_group
+        self.parser.cache = None
+
+        rows = dict()
+        res = self._eval_row(self.root, row_values, date, rows)
+        self._pending = (date, rows)
+
+        for var in self.variables:
+            if var in row_values:
+                self._last_row[var] = rows[('var', var)].iloc[0]
+        return res.iloc[0]
+
+    # -----------------------------------------------------
+    # Subscriber
+    def subscribe(self, publisher, topic):
+        publisher.add_subscriber(self, topic)
+
+    def on_event(self, event):
+        """
+        Update the latest value of a symbol and re-evaluate formula.
+
+        Parameters
+        ----------
+        event : Event object
+            event.data is a quote (or bar) object or dict with symbol, date (or trade_date)
+            and values of variables of the formula.
+
+        """
+        quote = event.data
+        if isinstance(quote, dict):
+            get = quote.get
+        else:
+            # quote may store its fields in __slots__, e.g. rows from Bar.iter_array
+            get = lambda name, default=None: getattr(quote, name, default)
+        date = get('date', get('trade_date'))
+        symbol = get('symbol')
+
+        # symbols without quote on a new date use their latest values
+        if date != self._quote_date:
+            self._quote_date = date
+            self._quote_row = {var: ser.copy() for var, ser in self._last_row.viewitems()}
+        for var in self.variables:
+            value = get(var)
+            if value is not None:
+                self._quote_row[var][symbol] = value
+
+        res = self.update(self._quote_row, date)
+        if self.callback is not None:
+            self.callback(date, res)
@@ -2,16 +2,69 @@
 import datetime
 import numpy as np
 import pandas as pd
-import pandas.tseries as pdts
+
+
+def _to_int_array(dt):
+    """Convert int date (%Y%m%d) or array of them to np.ndarray of dtype int64."""
+    return np.asarray(dt, dtype=np.int64)
+
+
+def convert_int_to_datetime64(dt):
+    """
+    Convert int date (%Y%m%d) to np.datetime64[D] using integer arithmetic only.
+
+    Parameters
+    ----------
+    dt : int or array-like
+
+    Returns
+    -------
+    res : np.datetime64 or np.ndarray
+        dtype = datetime64[D]
+
+    """
+    dt = _to_int_array(dt)
+    year = dt // 10000
+    month = dt // 100 % 100
+    day = dt % 100
+    months = ((year - 1970) * 12 + month - 1).astype('M8[M]')
+    return months.astype('M8[D]') + (day - 1).astype('m8[D]')
+
+
+def convert_datetime64_to_int(dt):
+    """
+    Convert np.datetime64 (any unit) to int date (%Y%m%d) using integer arithmetic only.
+
+    Parameters
+    ----------
+    dt : np.datetime64 or array-like
+
+    Returns
+    -------
+    res : int or np.ndarray
+        dtype = int64
+
+    """
+    days = np.asarray(dt).astype('M8[D]')
+    months = days.astype('M8[M]')
+    years = months.astype('M8[Y]')
+    year = years.astype(np.int64) + 1970
+    month = months.astype(np.int64) - (year - 1970) * 12 + 1
+    day = (days - months.astype('M8[D]')).astype(np.int64) + 1
+    res = year * 10000 + month * 100 + day
+    if res.ndim == 0:
+        return int(res)
+    return res
 
 
 def get_next_period_day(current, period, n):
     """
     Get the n'th day in next period from current day.
+    Vectorized: current can be an array of dates.
 
     Parameters
     ----------
-    current : int
+    current : int or array-like
         Current date in format "%Y%m%d".
     period : str
         Interval between current and next. {'day', 'week', 'month'}
@@ -20,47 +73,69 @@ def get_next_period_day(current, period, n):
 
     Returns
     -------
-    nxt : int
+    nxt : int or np.ndarray
 
     """
-    current_dt = convert_int_to_datetime(current)
+    current_dt = convert_int_to_datetime64(current)
     if period == 'day':
-        offset = pdts.offsets.BDay()  # move to next business day
+        # move to next business day
+        next_dt = np.busday_offset(current_dt, 1, roll='backward')
     elif period == 'week':
-        offset = pdts.offsets.Week(weekday=0)  # move to next Monday
+        # move to next Monday. 1970-01-01 is Thursday
+        weekday = (current_dt.astype(np.int64) + 3) % 7
+        next_dt = current_dt + (7 - weekday).astype('m8[D]')
     elif period == 'month':
-        offset = pdts.offsets.BMonthBegin()  # move to first business day of next month
+        # move to first business day of next month
+        month_begin = current_dt.astype('M8[M]')
+        first_bday = np.busday_offset(month_begin.astype('M8[D]'), 0, roll='forward')
+        first_bday_next = np.busday_offset((month_begin + 1).astype('M8[D]'), 0, roll='forward')
+        next_dt = np.where(current_dt < first_bday, first_bday, first_bday_next)
     else:
         raise NotImplementedError("Frequency as {} not support".format(period))
     
-    next_dt = current_dt + offset
     if n:
-        next_dt = next_dt + n * pdts.offsets.BDay()
-    nxt = convert_datetime_to_int(next_dt)
+        next_dt = np.busday_offset(next_dt, n, roll='forward')
+    nxt = convert_datetime64_to_int(next_dt)
     return nxt
 
 
 def convert_int_to_datetime(dt):
-    """Convert int date (%Y%m%d) to datetime.datetime object."""
+    """
+    Convert int date (%Y%m%d) to datetime.
+    
+    Returns
+    -------
+    res : pd.Timestamp or pd.Series or pd.DatetimeIndex
+        pd.Timestamp for scalar input, pd.Series for pd.Series input, else pd.DatetimeIndex.
+
+    """
+    if isinstance(dt, basestring):
+        dt = int(dt)
+    res = convert_int_to_datetime64(dt)
     if isinstance(dt, pd.Series):
-        dt = dt.astype(str)
-    elif isinstance(dt, int):
-        dt = str(dt)
-    return pd.to_datetime(dt, format="%Y%m%d")
+        return pd.Series(res, index=dt.index, name=dt.name)
+    elif res.ndim == 0:
+        return pd.Timestamp(res)
+    return pd.DatetimeIndex(res)
 
 
 def convert_datetime_to_int(dt):
-    f = lambda x: x.year * 10000 + x.month * 100 + x.day
-    if isinstance(dt, datetime.datetime):
-        dt = pd.Timestamp(dt)
-        res = f(dt)
+    """
+    Convert datetime to int date (%Y%m%d).
+    
+    Returns
+    -------
+    res : int or pd.Series
+        int for scalar input, else pd.Series (keeping index and name of pd.Series input).
+
+    """
+    if isinstance(dt, (datetime.datetime, datetime.date)):
+        return dt.year * 10000 + dt.month * 100 + dt.day
     elif isinstance(dt, np.datetime64):
-        dt = pd.Timestamp(dt)
-        res = f(dt)
-    else:
-        dt = pd.Series(dt)
-        res = dt.apply(f)
-    return res
+        return int(convert_datetime64_to_int(np.asarray(dt, dtype='M8[ns]')))
+    elif isinstance(dt, pd.Series):
+        return pd.Series(convert_datetime64_to_int(dt.values), index=dt.index, name=dt.name)
+    return pd.Series(convert_datetime64_to_int(np.asarray(dt, dtype='M8[ns]')))
 
 
 def shift(date, n_weeks=0):
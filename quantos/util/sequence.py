@@ -10,3 +10,9 @@ class SequenceGenerator(object):
     def get_next(self, key):
         self.__d[key] += 1
         return self.__d[key]
+    
+    def get_next_n(self, key, n):
+        """Return the next n numbers of key as a list."""
+        start = self.__d[key] + 1
+        self.__d[key] += n
+        return range(start, start + n)
@@ -1,6 +1,8 @@
 # encoding: utf-8
+import numpy as np
 import pandas as pd
 from quantos.data.dataservice import RemoteDataService
+from quantos.data.align import align, align_batch, get_neareast
 
 from quantos.data.py_expression_eval import Parser
 
@@ -56,6 +58,41 @@ def test_align():
     assert abs(df_res.loc[20170427, sec] - 42360000000) < 1
 
 
+def test_align_vectorized():
+    # compare with the column-by-column reference get_neareast on synthetic data,
+    # including un-announced reports (nan) and restatements announced out of report order
+    np.random.seed(0)
+    n_quarters, n_securities = 12, 30
+    report_dates = [20150331, 20150630, 20150930, 20151231] * 3
+    ann = np.array([[d + 10000 * (i // 4) + np.random.randint(1, 60) for _ in range(n_securities)]
+                    for i, d in enumerate(report_dates)], dtype=float)
+    ann[np.random.rand(*ann.shape) < 0.1] = np.nan
+    ann[3, 0], ann[4, 0] = 20160420, 20160410  # later report announced earlier
+    ann[5, 1] = ann[6, 1] = 20160801  # same announcement date
+    columns = ['{:06d}.SH'.format(i) for i in range(n_securities)]
+    df_ann = pd.DataFrame(index=report_dates, columns=columns, data=ann)
+    df_value = pd.DataFrame(index=report_dates, columns=columns, data=np.random.randn(*ann.shape))
+    date_arr = np.arange(20150101, 20180101)
+    date_arr = date_arr[(date_arr % 100 <= 31) & (date_arr % 100 > 0)]
+    
+    df_res = align(df_value, df_ann, date_arr)
+    
+    ann_filled = df_ann.fillna(99999999).astype(int).values
+    expected = np.vstack([get_neareast(ann_filled, df_value.values, np.array([date])) for date in date_arr])
+    assert df_res.shape == expected.shape
+    assert np.allclose(df_res.values, expected, equal_nan=True)
+    
+    dic_res = align_batch({'a': df_value, 'b': df_value * 2}, df_ann, date_arr)
+    assert np.allclose(dic_res['a'].values, expected, equal_nan=True)
+    assert np.allclose(dic_res['b'].values, expected * 2, equal_nan=True)
+    
+    # string values such as industry code keep object dtype
+    df_str = df_value.applymap(lambda x: '{:.3f}'.format(x))
+    df_res_str = align(df_str, df_ann, date_arr)
+    assert df_res_str.values.dtype == object
+    assert df_res_str.iloc[-1, 2] == df_str.iloc[-1, 2]
+
+
 if __name__ == "__main__":
     import time
     t_start = time.time()
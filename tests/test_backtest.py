@@ -17,8 +17,14 @@ suspensions and limit reachers:
 2. do not care about them when construct portfolio
 3. subtract market value and re-normalize weights (positions) after (daily) market open, before sending orders
 """
+import os
+import shutil
+import tempfile
 import time
 
+import numpy as np
+import pandas as pd
+
 from quantos.data.dataservice import RemoteDataService
 from quantos.example.demoalphastrategy import DemoAlphaStrategy
 
@@ -26,6 +32,8 @@ from quantos.util import fileio
 import quantos.backtest.analyze.analyze as ana
 from quantos.backtest.backtest import AlphaBacktestInstance_dv
 from quantos.backtest.gateway import DailyStockSimGateway
+from quantos.backtest.sweep import AlphaSweep
+from quantos.backtest.vectorized import WeightBacktest
 from quantos.backtest import model
 from quantos.data.dataview import DataView
 
@@ -129,13 +137,197 @@ def test_alpha_strategy_dataview():
     bt.save_results(fileio.join_relative_path('../output/'))
 
 
+def make_demo_strategy(context, props):
+    risk_model = model.FactorRiskModel()
+    signal_model = model.FactorRevenueModel_dv()
+    cost_model = model.SimpleCostModel()
+    
+    risk_model.register_context(context)
+    signal_model.register_context(context)
+    cost_model.register_context(context)
+    
+    signal_model.register_func('my_factor', my_factor)
+    signal_model.activate_func({'my_factor': {}})
+    cost_model.register_func('my_commission', my_commission)
+    cost_model.activate_func({'my_commission': {'myrate': 1e-2}})
+    
+    strategy = DemoAlphaStrategy(risk_model, signal_model, cost_model)
+    strategy.active_pc_method = props['pc_method']
+    return strategy
+
+
+def test_alpha_sweep():
+    fullpath = fileio.join_relative_path('../output/prepared', 'test_dataview')
+    dv = DataView()
+    dv.load_dataview(folder=fullpath)
+    
+    props = {
+        "benchmark": "000300.SH",
+        "universe": ','.join(dv.symbol),
+        "start_date": dv.start_date,
+        "end_date": dv.end_date,
+        "period": "month",
+        "days_delay": 0,
+        "init_balance": 1e9,
+        "position_ratio": 0.7,
+        "pc_method": 'factor_value_weight',
+        }
+    grid = [{'period': 'week'}, {'days_delay': 2}, {'pc_method': 'mc'}, {'pc_method': 'unknown'}]
+    
+    sweep = AlphaSweep(dv, make_demo_strategy, props, n_processes=2)
+    results = sweep.run(grid)
+    
+    assert [r.params for r in results] == grid
+    assert all(r.ok for r in results[:3]) and not results[3].ok
+    assert results[0].metrics['n_trades'] > 0
+    # daily returns of all trade dates of the backtest
+    dates = dv.dates[(dv.dates >= dv.start_date) & (dv.dates <= dv.end_date)]
+    assert list(results[0].returns.index) == list(dates)
+
+
+def test_weight_backtest():
+    fullpath = fileio.join_relative_path('../output/prepared', 'test_dataview')
+    dv = DataView()
+    dv.load_dataview(folder=fullpath)
+    
+    props = {
+        "benchmark": "000300.SH",
+        "universe": ','.join(dv.symbol),
+        "start_date": dv.start_date,
+        "end_date": dv.end_date,
+        "period": "month",
+        "days_delay": 0,
+        "init_balance": 1e9,
+        "position_ratio": 0.7,
+        "pc_method": 'factor_value_weight',
+        }
+    
+    gateway = DailyStockSimGateway()
+    gateway.init_from_config(props)
+    context = model.Context()
+    context.register_gateway(gateway)
+    context.register_trade_api(gateway)
+    context.register_dataview(dv)
+    strategy = make_demo_strategy(context, props)
+    bt = AlphaBacktestInstance_dv()
+    bt.init_from_config(props, strategy, context=context)
+    bt.run_alpha()
+    
+    # weights of factor_value_weight are values of my_factor
+    wbt = WeightBacktest()
+    wbt.init_from_config(props, dv, dv.get_ts('close'), context.calendar)
+    wbt.run()
+    
+    keys = ['fill_date', 'symbol', 'fill_price']
+    df_loop = strategy.pm.trades.to_dataframe().sort_values(keys).reset_index(drop=True)
+    df_vec = wbt.trades.sort_values(keys).reset_index(drop=True)
+    assert len(df_loop) == len(df_vec)
+    for col in ['fill_date', 'symbol', 'entrust_action']:
+        assert (df_loop[col].astype(str) == df_vec[col].astype(str)).all()
+    assert np.allclose(df_loop['fill_price'], df_vec['fill_price'])
+    assert np.allclose(df_loop['fill_size'], df_vec['fill_size'])
+    assert np.allclose(pd.Series(dict(strategy.total_value_list)).values, wbt.total_value.values)
+
+
+def test_avg_pos_price():
+    pos = np.array([100, 300, 200, 0, -100, -300, 100])
+    price = np.array([10., 13., 12., 11., 9., 8., 7.])
+    expected = np.array([10., 12., 12., 0., 9., 25. / 3, 25. / 3])
+    
+    avg_price = ana.AlphaAnalyzer._get_avg_pos_price(pos, price)
+    assert np.allclose(avg_price, expected)
+    
+    # trades of two symbols concatenated
+    is_first = np.zeros(2 * len(pos), dtype=bool)
+    is_first[[0, len(pos)]] = True
+    avg_price = ana.AlphaAnalyzer._get_avg_pos_price(np.tile(pos, 2), np.tile(price, 2), is_first)
+    assert np.allclose(avg_price, np.tile(expected, 2))
+
+
+def _write_backtest_results(folder, dates, symbols, init_balance):
+    """Write trades and configs of a small backtest to folder, as save_results does."""
+    trades = pd.DataFrame({'task_id': '1', 'entrust_no': '1', 'fill_no': '1', 'fill_time': 0,
+                           'entrust_action': ['buy', 'buy', 'buy', 'sell', 'sell'],
+                           'symbol': [symbols[0], symbols[1], symbols[0], symbols[0], symbols[1]],
+                           'fill_price': [10., 20., 12., 13., 18.],
+                           'fill_size': [3, 2, 1, 4, 2],
+                           'fill_date': [dates[1], dates[1], dates[3], dates[6], dates[7]]})
+    trades.index.name = 'index'
+    trades.to_csv(os.path.join(folder, 'trades.csv'))
+    fileio.save_json({'start_date': int(dates[0]), 'end_date': int(dates[-1]), 'benchmark': '000300.SH',
+                      'init_balance': init_balance}, os.path.join(folder, 'configs.json'))
+    return trades
+
+
+def test_analyze_offline():
+    from quantos.backtest.ledger import DailyLedger
+    
+    dates = np.array([20170103, 20170104, 20170105, 20170106, 20170109, 20170110, 20170111, 20170112, 20170113])
+    symbols = ['000001.SZ', '600000.SH', '600030.SH']
+    close = pd.DataFrame(index=dates, columns=symbols, data=np.arange(27).reshape(9, 3) % 5 + 10.)
+    close.iloc[0, 1] = np.nan  # listed on the second date
+    
+    data_d = pd.DataFrame(close.values, index=pd.Index(dates, name='trade_date'),
+                          columns=pd.MultiIndex.from_product([symbols, ['close']], names=['symbol', 'field']))
+    dv = DataView()
+    dv.data_d = data_d
+    dv.symbol = symbols
+    dv.fields = ['close']
+    dv.start_date, dv.end_date = dates[0], dates[-1]
+    dv.universe = '000300.SH'
+    dv._data_benchmark = pd.DataFrame({'close': np.linspace(3000., 3400., len(dates))}, index=dates)
+    
+    init_balance = 1e5
+    folder = tempfile.mkdtemp()
+    try:
+        trades = _write_backtest_results(folder, dates, symbols, init_balance)
+        
+        ta = ana.AlphaAnalyzer()
+        ta.initialize(file_folder=folder, dataview=dv)
+        assert ta.ledger is None
+        ta.process_trades()
+        ta.get_daily()
+        ta.get_returns()
+        
+        # dates without close price are kept
+        daily = ta.daily['600000.SH']
+        assert list(daily.index) == list(dates)
+        assert list(daily.loc[:, 'position']) == [0, 2, 2, 2, 2, 2, 2, 0, 0]
+        assert list(daily.loc[:, 'close'].values[:2]) == [0., close.iloc[1, 1]]
+        daily = ta.daily['000001.SZ']
+        assert list(daily.loc[:, 'position']) == [0, 3, 3, 4, 4, 4, 0, 0, 0]
+        assert np.allclose(daily.loc[:, 'AvgPosPrice'].values[1:6], [10., 10., 10.5, 10.5, 10.5])
+        
+        # same results when positions and PnL are read from the ledger of the backtest
+        ledger = DailyLedger(dates, symbols, init_balance)
+        for _, row in trades.iterrows():
+            sign = 1 if row['entrust_action'] == 'buy' else -1
+            ledger.on_trade(row['symbol'], sign * row['fill_size'], row['fill_price'], row['fill_date'])
+        ledger.finish()
+        os.makedirs(os.path.join(folder, 'ledger'))
+        ledger.save(os.path.join(folder, 'ledger'))
+        
+        ta_ledger = ana.AlphaAnalyzer()
+        ta_ledger.initialize(file_folder=folder, dataview=dv)
+        assert ta_ledger.ledger is not None
+        ta_ledger.process_trades()
+        ta_ledger.get_daily()
+        ta_ledger.get_returns()
+        for sec, df in ta.daily.items():
+            assert np.allclose(ta_ledger.daily[sec].values, df.values)
+        assert np.allclose(ta_ledger.returns.values, ta.returns.values)
+    finally:
+        shutil.rmtree(folder)
+
+
 def test_backtest_analyze():
     ta = ana.AlphaAnalyzer()
-    data_service = RemoteDataService()
     
     out_folder = fileio.join_relative_path("../output")
+    # prices and benchmark are read from the DataView of the backtest, no data server is needed
+    dv_folder = fileio.join_relative_path('../output/prepared', 'test_dataview')
     
-    ta.initialize(data_service, out_folder)
+    ta.initialize(file_folder=out_folder, dataview=dv_folder)
     
     print "process trades..."
     ta.process_trades()
@@ -167,6 +359,10 @@ if __name__ == "__main__":
     t_start = time.time()
 
     test_alpha_strategy_dataview()
+    test_alpha_sweep()
+    test_weight_backtest()
+    test_avg_pos_price()
+    test_analyze_offline()
     test_backtest_analyze()
     
     t3 = time.time() - t_start
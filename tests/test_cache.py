@@ -0,0 +1,143 @@
+# encoding: utf-8
+import os
+import time
+import shutil
+import tempfile
+
+import pandas as pd
+
+from quantos.data.cache import QueryCache
+from quantos.data.dataservice import DataService, RemoteDataService
+
+
+class _StubApi(object):
+    """Replaces DataApi of RemoteDataService, counts calls."""
+    def __init__(self):
+        self.n_calls = 0
+    
+    def daily(self, symbol, start_date, end_date, fields="", adjust_mode=None, data_format=""):
+        self.n_calls += 1
+        df = pd.DataFrame({'symbol': symbol, 'trade_date': [start_date, end_date], 'close': [1.0, 2.0]})
+        return df, '0,'
+    
+    def query(self, view, fields="", filter="", data_format="", **kwargs):
+        self.n_calls += 1
+        return pd.DataFrame({'symbol': ['000001.SZ'], 'industry1': ['bank']}), '0,'
+
+
+def _make_data_service(folder):
+    # RemoteDataService.__init__ logs in to the server, use a stub api instead
+    ds = object.__new__(RemoteDataService)
+    DataService.__init__(ds)
+    ds.api = _StubApi()
+    ds.enable_cache(folder=folder)
+    return ds
+
+
+def test_query_cache():
+    folder = tempfile.mkdtemp()
+    try:
+        cache = QueryCache(folder, ttl={'lb.secIndustry': 0.5})
+        df = pd.DataFrame({'trade_date': [20170103, 20170104], 'close': [1.0, 2.0]})
+        
+        key = cache.make_key('jsd.query', symbol='000001.SZ', start_date=20170101, end_date=20170105, fields='close')
+        assert cache.make_key('jsd.query', end_date=20170105, start_date=20170101, fields='close',
+                              symbol='000001.SZ') == key
+        assert cache.get(key) is None
+        cache.put('jsd.query', key, (df, '0,'), end_date=20170105)
+        df_cached, msg = cache.get(key)
+        assert msg == '0,' and df_cached.equals(df)
+        
+        # entries are stored on disk
+        cache2 = QueryCache(folder)
+        assert cache2.get(key)[0].equals(df)
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+        
+        # expire
+        key2 = cache.make_key('lb.secIndustry', filter='symbol=000001.SZ')
+        cache.put('lb.secIndustry', key2, (df, '0,'))
+        assert cache.get(key2) is not None
+        time.sleep(0.6)
+        assert cache.get(key2) is None
+        
+        # data until today may be incomplete
+        key3 = cache.make_key('jsd.query', end_date=99991231)
+        cache.recent_ttl = 0
+        cache.put('jsd.query', key3, (df, '0,'), end_date=99991231)
+        time.sleep(0.01)
+        assert cache.get(key3) is None
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_query_cache_lru():
+    folder = tempfile.mkdtemp()
+    try:
+        cache = QueryCache(folder)
+        df = pd.DataFrame({'close': range(1000)})
+        cache.put('jsd.query', 'a', (df, '0,'))
+        cache.max_size = os.path.getsize(os.path.join(folder, 'a.pkl')) * 2 + 1
+        
+        cache.put('jsd.query', 'b', (df, '0,'))
+        # make 'a' the most recently used one
+        os.utime(os.path.join(folder, 'b.pkl'), (time.time() - 10, time.time() - 10))
+        assert cache.get('a') is not None
+        cache.put('jsd.query', 'c', (df, '0,'))
+        
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.get('c') is not None
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_query_cache_overwrite():
+    folder = tempfile.mkdtemp()
+    try:
+        cache = QueryCache(folder)
+        df = pd.DataFrame({'close': range(1000)})
+        cache.put('jsd.query', 'a', (df, '0,'))
+        cache.put('jsd.query', 'a', (df, '0,'))
+        assert cache.stats()['size'] == os.path.getsize(os.path.join(folder, 'a.pkl'))
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_remote_data_service_cache():
+    folder = tempfile.mkdtemp()
+    try:
+        ds = _make_data_service(folder)
+        
+        df, msg = ds.daily('000001.SZ', 20170103, 20170110, fields='close')
+        df2, msg2 = ds.daily('000001.SZ', 20170103, 20170110, fields='close')
+        assert msg2 == '0,' and df2.equals(df)
+        assert ds.api.n_calls == 1
+        
+        # different arguments are different entries
+        ds.daily('000001.SZ', 20170103, 20170110, fields='close,open')
+        assert ds.api.n_calls == 2
+        
+        # pre-adjusted prices are never cached
+        ds.daily('000001.SZ', 20170103, 20170110, fields='close', adjust_mode='pre')
+        ds.daily('000001.SZ', 20170103, 20170110, fields='close', adjust_mode='pre')
+        assert ds.api.n_calls == 4
+        
+        df, msg = ds.query('lb.secIndustry', filter='symbol=000001.SZ&end_date=20170110', fields='industry1')
+        df2, msg2 = ds.query('lb.secIndustry', filter='symbol=000001.SZ&end_date=20170110', fields='industry1')
+        assert df2.equals(df) and ds.api.n_calls == 5
+        
+        ds.disable_cache()
+        ds.daily('000001.SZ', 20170103, 20170110, fields='close')
+        assert ds.api.n_calls == 6
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+    
+    for test_name, test_func in g.viewitems():
+        print "\nTesting {:s}...".format(test_name)
+        test_func()
+    print "Test Complete."
@@ -25,6 +25,36 @@ def test_calendar():
     assert not calendar.is_trade_date(20130501)
 
 
+def test_calendar_in_memory():
+    import numpy as np
+    
+    trade_dates = [20161230, 20170103, 20170104, 20170105, 20170106, 20170109]
+    calendar = Calendar(trade_dates=trade_dates)
+    
+    assert calendar.is_trade_date(20170103)
+    assert not calendar.is_trade_date(20170101)
+    assert calendar.get_next_trade_date(20170101) == 20170103
+    assert calendar.get_next_trade_date(20170103) == 20170104
+    assert calendar.get_last_trade_date(20170103) == 20161230
+    assert calendar.get_last_trade_date(20170108) == 20170106
+    assert list(calendar.get_trade_date_range(20170101, 20170105)) == [20170103, 20170104, 20170105]
+    assert len(calendar.get_trade_date_range(20170107, 20170108)) == 0
+    
+    dates = np.array([20170101, 20170104, 20170107])
+    assert list(calendar.get_next_trade_dates(dates)) == [20170103, 20170105, 20170109]
+    assert list(calendar.get_last_trade_dates(dates)) == [20161230, 20170103, 20170106]
+    assert list(calendar.shift_trade_date(dates[:2], 2)) == [20170104, 20170106]
+    assert list(calendar.shift_trade_date(dates[1:], -2)) == [20161230, 20170105]
+    assert list(calendar.shift_trade_date(dates, 0)) == [20170103, 20170104, 20170109]
+    assert calendar.count_trade_dates(20170101, 20170108) == 4
+    
+    try:
+        calendar.get_next_trade_date(20170109)
+        assert False
+    except IndexError:
+        pass
+
+
 def test_dtutil():
     date = 20170808
     assert dtutil.get_next_period_day(20170831, 'day', 1) == 20170904
@@ -37,6 +67,43 @@ def test_dtutil():
         assert datetime.datetime.strptime(str(monthly), "%Y%m%d").weekday() < 5
 
 
+def test_dtutil_vectorized():
+    import numpy as np
+    
+    dates = np.array([20161231, 20170228, 20170831, 20171001])
+    dt = dtutil.convert_int_to_datetime(dates)
+    assert list(dtutil.convert_datetime_to_int(dt)) == list(dates)
+    assert dtutil.convert_int_to_datetime(20170228) == datetime.datetime(2017, 2, 28)
+    assert dtutil.convert_datetime_to_int(datetime.datetime(2017, 2, 28)) == 20170228
+    
+    assert list(dtutil.get_next_period_day(dates, 'day', 0)) == [20170102, 20170301, 20170901, 20171002]
+    assert list(dtutil.get_next_period_day(dates, 'week', 1)) == [20170103, 20170307, 20170905, 20171003]
+    assert list(dtutil.get_next_period_day(dates, 'month', 0)) == [20170102, 20170301, 20170901, 20171002]
+    assert list(dtutil.get_next_period_day(dates, 'month', 2)) == [20170104, 20170303, 20170905, 20171004]
+
+
+def test_rebalance_dates():
+    import pandas as pd
+    
+    holidays = [20170403, 20170404, 20170501, 20171002, 20171003, 20171004, 20171005, 20171006]
+    trade_dates = [d for d in dtutil.convert_datetime_to_int(pd.bdate_range('2017-01-01', '2018-01-31'))
+                   if d not in holidays]
+    calendar = Calendar(trade_dates=trade_dates)
+    
+    res = calendar.get_rebalance_dates(20170301, 20171231, 'month', 0)
+    assert list(res) == [20170405, 20170502, 20170602, 20170704, 20170802, 20170904,
+                         20171009, 20171102, 20171204]
+    
+    res = calendar.get_rebalance_dates(20170925, 20171020, 'week', 1)
+    assert list(res) == [20171009, 20171018]
+    
+    assert calendar.get_next_rebalance_dates(20170927, 'week', 0) == 20171009
+    assert list(calendar.get_next_rebalance_dates(res, 'day', 0)) == [20171011, 20171020]
+
+
 if __name__ == "__main__":
     test_calendar()
+    test_calendar_in_memory()
     test_dtutil()
+    test_dtutil_vectorized()
+    test_rebalance_dates()
@@ -1,5 +1,12 @@
 # encoding: utf-8
+import numpy as np
+import pandas as pd
+import pytest
+
 from quantos.data.basic.instrument import InstManager
+from quantos.data.basic.marketdata import Bar
+from quantos.data.basic.order import Order, FixedPriceTypeOrder
+from quantos.data.basic.trade import Trade, TradeBatch, TradeLog
 
 
 def test_inst_manager():
@@ -13,5 +20,88 @@ def test_inst_manager():
     assert inst_obj.inst_type == '1'
 
 
+def test_bar_array():
+    symbols = ['rb1710', 'cu1709', 'ag1712']
+    times = [90100, 90200, 90300, 90400]
+    df = pd.DataFrame({'symbol': np.repeat([symbols], len(times), axis=0).ravel(),
+                       'time': np.repeat(times, len(symbols)),
+                       'date': 20170605,
+                       'close': np.arange(12) * 1.0,
+                       'high': np.arange(12) + 1.0,
+                       'volume': np.arange(12) * 10})
+    
+    bars = Bar.create_array_from_df(df)
+    rows = list(Bar.iter_array(bars))
+    for bar_obj, row in zip(Bar.create_from_df(df), rows):
+        for name in bar_obj.__dict__:
+            assert getattr(bar_obj, name) == getattr(row, name)
+    assert rows[4].symbol == 'cu1709' and rows[4].time == 90200 and rows[4].oi == 0
+    
+    # rows behave like Bar objects
+    assert isinstance(rows[4], Bar)
+    rows[4].close = 100.0
+    rows[4].signal = 1
+    assert rows[4].close == 100.0 and rows[4].signal == 1
+    assert rows[5].close == 5.0
+    
+    df_invalid = df.rename(columns={'close': 'close price'})
+    with pytest.raises(TypeError):
+        list(Bar.iter_array(Bar.create_array_from_df(df_invalid)))
+    
+    # field names may be Python keywords
+    df_keyword = df.rename(columns={'date': 'from', 'time': 'print'})
+    rows_keyword = list(Bar.iter_array(Bar.create_array_from_df(df_keyword)))
+    assert getattr(rows_keyword[4], 'from') == 20170605 and getattr(rows_keyword[4], 'print') == 90200
+    
+    # row types of subclasses are not shared with Bar
+    class SubBar(Bar):
+        pass
+    
+    rows_sub = list(SubBar.iter_array(bars))
+    assert isinstance(rows_sub[4], SubBar) and not isinstance(rows[4], SubBar)
+    assert rows_sub[4].close == 4.0
+    
+    res = list(Bar.split_by_time(bars))
+    assert [t for t, _ in res] == times
+    assert all(list(b['symbol']) == symbols for _, b in res)
+    assert list(Bar.split_by_time(bars[:0])) == []
+
+
+def test_order_copy():
+    order = FixedPriceTypeOrder.new_order('000001.SZ', 'buy', 10.0, 100, 20170605, 0)
+    order.price_target = 'vwap'
+    assert not hasattr(order, '__dict__')
+    
+    new_order = Order()
+    new_order.copy(order)
+    for name in Order.__slots__:
+        assert getattr(new_order, name) == getattr(order, name)
+
+
+def test_trade_log():
+    log = TradeLog()
+    trade = Trade()
+    trade.init_from_order(Order.new_order('000001.SZ', 'buy', 10.0, 100, 20170605, 0))
+    trade.send_fill_info(10.0, 100, 20170605, 0, '201706050001')
+    log.append(trade)
+    log.extend(TradeBatch(symbol=np.array(['600000.SH', '000002.SZ'], dtype=object),
+                          entrust_action=np.array(['sell', 'buy'], dtype=object),
+                          fill_price=np.array([5.0, 6.0]),
+                          fill_size=np.array([200, 300]),
+                          fill_date=np.array([20170606, 20170606]),
+                          fill_time=np.array([0, 0]),
+                          fill_no=np.array(['201706060001', '201706060002'], dtype=object)))
+    assert len(log) == 3
+    assert log[1].symbol == '600000.SH' and log[-1].fill_size == 300
+    assert [t.fill_price for t in log] == log.get_column('fill_price') == [10.0, 5.0, 6.0]
+    
+    df = log.to_dataframe()
+    assert list(df['symbol']) == ['000001.SZ', '600000.SH', '000002.SZ']
+    assert df['fill_size'].dtype == np.int64
+
+
 if __name__ == "__main__":
-    test_inst_manager()
\ No newline at end of file
+    test_inst_manager()
+    test_bar_array()
+    test_order_copy()
+    test_trade_log()
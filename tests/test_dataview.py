@@ -1,6 +1,10 @@
 # encoding: utf-8
+import numpy as np
+import pandas as pd
+import pytest
 
 from quantos.data.dataview import DataView
+from quantos.data.fetcher import ChunkedFetcher
 
 
 def test_add_formula_directly():
@@ -158,6 +162,36 @@ def test_add_formula():
     assert dv.data_d.shape == (nrows, ncols + 2 * n_securities)
 
 
+def test_update_to():
+    from quantos.data.dataservice import RemoteDataService
+    
+    ds = RemoteDataService()
+    props = {'start_date': 20160601, 'end_date': 20170601, 'symbol': '600030.SH,000063.SZ,000001.SZ',
+             'fields': 'open,close,pb,total_oper_rev',
+             'freq': 1}
+    dv_full = DataView()
+    dv_full.init_from_config(props, data_api=ds)
+    dv_full.prepare_data()
+    dv_full.add_formula('myvar1', 'close / Delay(close, 5)', is_quarterly=False)
+    
+    props['end_date'] = 20170301
+    dv = DataView()
+    dv.init_from_config(props, data_api=ds)
+    dv.prepare_data()
+    dv.add_formula('myvar1', 'close / Delay(close, 5)', is_quarterly=False)
+    dv.update_to(20170601)
+    
+    assert dv.end_date == 20170601
+    assert np.array_equal(dv.dates, dv_full.dates)
+    assert dv.data_d.shape == dv_full.data_d.shape
+    close = dv.get_ts('close')
+    close_full = dv_full.get_ts('close')
+    assert np.allclose(close.values, close_full.values, equal_nan=True)
+    myvar1 = dv.get_ts('myvar1')
+    myvar1_full = dv_full.get_ts('myvar1')
+    assert np.allclose(myvar1.values, myvar1_full.values, equal_nan=True)
+
+
 def test_dataview_universe():
     from quantos.data.dataservice import RemoteDataService
 
@@ -176,6 +210,309 @@ def test_dataview_universe():
     dv.prepare_data()
     
 
+def _shift_days(date, n_days):
+    dt = pd.to_datetime(str(date)) + pd.Timedelta(days=n_days)
+    return int(dt.strftime('%Y%m%d'))
+
+
+def _make_synthetic_dataview(n_symbols=50, seed=0):
+    """Build a DataView from random data without querying the server."""
+    np.random.seed(seed)
+    dates = pd.bdate_range('20150101', '20161231')
+    dates = np.array([int(d.strftime('%Y%m%d')) for d in dates])
+    report_dates = [20141231, 20150331, 20150630, 20150930, 20151231, 20160331, 20160630, 20160930]
+    symbols = ['{:06d}.SZ'.format(i) for i in range(n_symbols)]
+    
+    fields_d = ['close', 'open']
+    col_d = pd.MultiIndex.from_product([symbols, fields_d], names=['symbol', 'field'])
+    data_d = pd.DataFrame(index=dates, columns=col_d, data=np.random.rand(len(dates), len(col_d)))
+    data_d.index.name = 'trade_date'
+    
+    fields_q = ['ann_date', 'oper_rev', 'roe']
+    col_q = pd.MultiIndex.from_product([symbols, fields_q], names=['symbol', 'field'])
+    data_q = pd.DataFrame(index=report_dates, columns=col_q, data=np.random.rand(len(report_dates), len(col_q)))
+    data_q.index.name = 'report_date'
+    for i, sec in enumerate(symbols):
+        ann = np.array([_shift_days(d, np.random.randint(20, 100)) for d in report_dates], dtype=float)
+        if i % 7 == 0:
+            ann[-1] = np.nan
+        data_q.loc[:, (sec, 'ann_date')] = ann
+    
+    dv = DataView()
+    dv.data_d = data_d
+    dv.data_q = data_q
+    dv.symbol = symbols
+    dv.fields = fields_d + fields_q
+    dv.start_date, dv.end_date = 20150301, 20161231
+    dv.extended_start_date_d, dv.extended_start_date_q = 20150101, 20141231
+    return dv
+
+
+def _append_trade_status(dv, suspended=None):
+    """Append trade_status of all symbols trading. suspended is (rows, column) of suspended symbol."""
+    trade_status = pd.DataFrame(index=dv.dates, columns=dv.symbol, data=u'交易'.encode('utf-8'))
+    if suspended is not None:
+        rows, col = suspended
+        trade_status.iloc[rows, col] = u'停牌'.encode('utf-8')
+    dv.append_df(trade_status, 'trade_status', is_quarterly=False)
+
+
+def test_get_quarterly_asof_index():
+    from quantos.data.align import align
+    
+    dv = _make_synthetic_dataview()
+    res = dv.get(symbol='000003.SZ,000007.SZ,000010.SZ', start_date=20160101, end_date=20161231,
+                 fields='oper_rev,roe,close')
+    assert set(res.columns.get_level_values('field')) == {'oper_rev', 'roe', 'close'}
+    assert dv._asof_index is not None
+    
+    # compare with align, which does not use cache
+    df_ann = dv.get_ann_df()
+    df_value = dv.data_q.xs('roe', axis=1, level='field')
+    expected = align(df_value, df_ann, dv.dates).loc[20160101: 20161231, ['000003.SZ', '000007.SZ', '000010.SZ']]
+    assert np.allclose(res.xs('roe', axis=1, level='field').values, expected.values, equal_nan=True)
+    
+    # cache must be rebuilt after data_q changes
+    dv.append_df(dv.data_q.xs('roe', axis=1, level='field') * 2, 'roe2', is_quarterly=True)
+    assert dv._asof_index is None
+    res2 = dv.get_ts('roe2', symbol='000007.SZ', start_date=20160101, end_date=20161231)
+    assert np.allclose(res2.values[:, 0], expected.values[:, 1] * 2, equal_nan=True)
+
+
+def test_get_snapshot_array():
+    dv = _make_synthetic_dataview(n_symbols=10)
+    _append_trade_status(dv, suspended=(slice(-20, -10), 5))
+    
+    # rows and columns follow the requested order, quarterly fields are taken as of the date
+    date = dv.dates[-15]
+    arr = dv.get_snapshot_array(date, symbol='000007.SZ,000002.SZ', fields='open,roe,close')
+    expected = dv.get(symbol='000002.SZ,000007.SZ', start_date=date, end_date=date, fields='close,open,roe')
+    for i, sec in enumerate(['000007.SZ', '000002.SZ']):
+        for j, field in enumerate(['open', 'roe', 'close']):
+            assert arr[i, j] == expected.loc[date, (sec, field)]
+    
+    # all symbols, string field
+    arr_status = dv.get_snapshot_array(date, fields='trade_status')
+    assert arr_status.shape == (10, 1)
+    assert arr_status[5, 0] == u'停牌'.encode('utf-8')
+    assert arr_status[4, 0] == u'交易'.encode('utf-8')
+    
+    # DataFrame version has the same values and keeps float dtype of numeric fields
+    snap = dv.get_snapshot(date, symbol='000005.SZ,000007.SZ', fields='close,roe,trade_status')
+    assert snap.shape == (2, 3)
+    assert snap.loc['000007.SZ', 'roe'] == expected.loc[date, ('000007.SZ', 'roe')]
+    assert snap.loc['000005.SZ', 'trade_status'] == u'停牌'.encode('utf-8')
+    assert snap.loc[:, 'close'].dtype == float
+
+
+def benchmark_get_snapshot_array(n=100):
+    """Print time of one cross-section by get() + stack, get_snapshot and get_snapshot_array."""
+    import time
+    
+    dv = _make_synthetic_dataview(n_symbols=300)
+    date = dv.dates[-15]
+    funcs = [('get + stack', lambda: dv.get(start_date=date, end_date=date, fields='close,open')
+                                        .stack(level='symbol', dropna=False)),
+             ('get_snapshot', lambda: dv.get_snapshot(date, fields='close,open')),
+             ('get_snapshot_array', lambda: dv.get_snapshot_array(date, fields='close,open'))]
+    for name, func in funcs:
+        t0 = time.time()
+        for _ in range(n):
+            func()
+        print "{:20s}{:10.3f} ms".format(name, (time.time() - t0) / n * 1e3)
+
+
+def test_save_load_columnar():
+    import shutil
+    import tempfile
+    
+    dv = _make_synthetic_dataview(n_symbols=20)
+    _append_trade_status(dv)
+    dv.data_group = pd.DataFrame(index=dv.dates, columns=dv.symbol, data='480000')
+    
+    folder = tempfile.mkdtemp()
+    try:
+        dv.save_dataview(folder_path=folder, sub_folder='columnar')
+        dv.save_dataview(folder_path=folder, sub_folder='hdf5', file_format='hdf5')
+        
+        dv1 = DataView()
+        dv1.load_dataview(folder=folder + '/columnar')
+        assert isinstance(dv1.panel_d.get_values('close'), np.memmap)
+        assert dv1._data_d is None
+        
+        # access without building data_d
+        date = dv.dates[-1]
+        arr = dv1.get_snapshot_array(date, symbol='000001.SZ,000002.SZ', fields='close,roe,trade_status')
+        expected = dv.get_snapshot_array(date, symbol='000001.SZ,000002.SZ', fields='close,roe,trade_status')
+        assert (arr == expected).all()
+        assert dv1._data_d is None and np.array_equal(dv1.dates, dv.dates)
+        
+        dv2 = DataView()
+        dv2.load_dataview(folder=folder + '/hdf5')
+        for dv_loaded in [dv1, dv2]:
+            assert dv_loaded.data_d.equals(dv.data_d)
+            assert dv_loaded.data_q.equals(dv.data_q)
+            assert dv_loaded.data_group.equals(dv.data_group)
+            assert dv_loaded.fields == dv.fields
+        
+        # save back into the folder its arrays are memory-mapped from
+        dv1.save_dataview(folder_path=folder, sub_folder='columnar')
+        assert dv1.data_d.equals(dv.data_d)
+        dv3 = DataView()
+        dv3.load_dataview(folder=folder + '/columnar')
+        assert dv3.data_d.equals(dv.data_d)
+        assert dv3.data_q.equals(dv.data_q)
+        assert dv3.data_group.equals(dv.data_group)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_categorical_fields():
+    from quantos.data.py_expression_eval import Parser
+    
+    dv = _make_synthetic_dataview(n_symbols=30)
+    _append_trade_status(dv, suspended=(slice(-20, -10), 5))
+    
+    # string fields are stored as small integer codes
+    codes, categories = dv.panel_d.get_codes('trade_status')
+    assert codes.dtype == np.int8
+    assert dv.panel_d.nbytes < dv.data_d.values.nbytes
+    
+    date = dv.dates[-15]
+    codes = dv.get_snapshot_codes(date, 'trade_status', symbol='000005.SZ,000006.SZ')
+    code_trading = dv.get_category_code('trade_status', dv.TRADE_STATUS_TRADING)
+    assert list(codes != code_trading) == [True, False]
+    assert dv.get_category_code('trade_status', 'unknown') == -2
+    
+    # formulas group by codes of industry, with the same result as labels
+    df_group = pd.DataFrame(index=dv.dates, columns=dv.symbol,
+                            data=np.random.choice(['480000', '210000', '110000'], size=(len(dv.dates), 30)))
+    dv.data_group = df_group
+    assert dv.data_group.equals(df_group)
+    dv.add_formula('close_rank', 'GroupApply(Rank, close)', is_quarterly=False)
+    parser = Parser()
+    parser.parse('GroupApply(Rank, close)')
+    expected = parser.evaluate({'close': dv.get_ts('close', start_date=dv.extended_start_date_d)}, df_group=df_group)
+    res = dv.get_ts('close_rank', start_date=dv.extended_start_date_d)
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+
+
+def test_add_formula_shared_cache():
+    from quantos.data.py_expression_eval import Parser
+    
+    dv = _make_synthetic_dataview(n_symbols=20)
+    formula = 'Rank(close / oper_rev)'
+    dv.add_formula('myvar1', formula, is_quarterly=False)
+    dv.add_formula('myvar2', formula + ' + Delta(open, 3)', is_quarterly=False)
+    
+    # variables and the common sub-expression are evaluated only once
+    cache = dv._formula_cache
+    assert ('var', 'close') in cache and ('var', 'oper_rev') in cache
+    assert len([k for k in cache if k[0] == 'align']) == 1
+    
+    parser = Parser()
+    parser.parse(formula)
+    expected = parser.evaluate({'close': dv.get_ts('close', start_date=dv.extended_start_date_d),
+                                'oper_rev': dv.get_ts_quarter('oper_rev', start_date=dv.extended_start_date_q)},
+                               ann_dts=dv.get_ann_df(), trade_dts=dv.dates)
+    myvar1 = dv.get_ts('myvar1', start_date=dv.extended_start_date_d)
+    assert np.allclose(myvar1.values, expected.values, equal_nan=True)
+    myvar2 = dv.get_ts('myvar2', start_date=dv.extended_start_date_d)
+    delta = dv.get_ts('open', start_date=dv.extended_start_date_d).diff(3)
+    assert np.allclose(myvar2.values, (expected + delta).values, equal_nan=True)
+    
+    # changing existing data invalidates cache
+    dv.data_d = dv.data_d
+    assert not dv._formula_cache
+
+
+def test_formula_cache_invalidated():
+    dv = _make_synthetic_dataview(n_symbols=10)
+    
+    # replacing a field must not reuse its cached frame
+    dv.add_formula('myvar1', 'close * 2', is_quarterly=False)
+    assert ('var', 'close') in dv._formula_cache
+    close_new = dv.get_ts('close', start_date=dv.extended_start_date_d) + 1.0
+    dv._remove_field('close')
+    assert not dv._formula_cache
+    dv.add_formula('myvar2', 'open', is_quarterly=False)
+    dv.append_df(close_new, 'close', is_quarterly=False)
+    assert not dv._formula_cache
+    dv.add_formula('myvar3', 'close * 2', is_quarterly=False)
+    assert np.allclose(dv.get_ts('myvar3').values, dv.get_ts('myvar1').values + 2.0)
+    
+    # group codes are used by common sub-expressions
+    dv.data_group = pd.DataFrame(index=dv.dates, columns=dv.symbol, data='480000')
+    dv.add_formula('myvar4', 'GroupApply(Rank, close)', is_quarterly=False)
+    assert dv._formula_cache
+    dv.data_group = pd.DataFrame(index=dv.dates, columns=dv.symbol,
+                                 data=np.tile(['480000', '210000'], (len(dv.dates), 5)))
+    assert not dv._formula_cache
+
+
+def test_add_formulas():
+    formula_dic = {'myvar1': 'Rank(close / oper_rev)',
+                   'myvar2': 'myvar1 + Delta(open, 3)',
+                   'myvar3': 'close - open'}
+    
+    dv = _make_synthetic_dataview(n_symbols=20)
+    dv.add_formulas(formula_dic)
+    
+    dv_single = _make_synthetic_dataview(n_symbols=20)
+    for name in ['myvar1', 'myvar2', 'myvar3']:
+        dv_single.add_formula(name, formula_dic[name], is_quarterly=False)
+    
+    assert dv.data_d.equals(dv_single.data_d)
+    assert sorted(dv.fields) == sorted(dv_single.fields)
+    assert sorted(dv.custom_daily_fields) == ['myvar1', 'myvar2', 'myvar3']
+    # dependency comes first
+    names = [dic['field_name'] for dic in dv.custom_formulas]
+    assert names.index('myvar1') < names.index('myvar2')
+    
+    dv.add_formulas({'myvar4': 'myvar3 * 2'})
+    assert np.allclose(dv.get_ts('myvar4').values, dv.get_ts('myvar3').values * 2, equal_nan=True)
+
+
+class _StubDailyApi(object):
+    """Daily bars without a server. Adjusted prices are 10 times of raw ones and returned in reversed order."""
+    def __init__(self, failed_symbol=None):
+        self.failed_symbol = failed_symbol
+    
+    def daily(self, symbol, start_date, end_date, fields="", adjust_mode=None):
+        symbols = symbol.split(',')
+        if adjust_mode is not None and self.failed_symbol in symbols:
+            return None, '-1,timeout'
+        dates = [int(d.strftime('%Y%m%d')) for d in pd.bdate_range(str(start_date), str(end_date))]
+        df = pd.DataFrame([{'symbol': sec, 'trade_date': date} for sec in symbols for date in dates])
+        price = df['trade_date'] % 100 + np.array([int(sec[:6]) for sec in df['symbol']])
+        for field in fields.split(','):
+            df[field] = price * (1.0 if adjust_mode is None else 10.0)
+        if adjust_mode is not None:
+            df = df.iloc[::-1].reset_index(drop=True)
+        return df, '0,'
+
+
+def test_query_data_chunks():
+    symbols = ['{:06d}.SZ'.format(i) for i in range(5)]
+    dv = DataView()
+    dv.freq = 1
+    dv.data_api = _StubDailyApi()
+    dv.fetcher = ChunkedFetcher(symbol_chunk_size=2, n_days_chunk=20, n_retry=0, retry_wait=0.0)
+    
+    res = dv._query_data(symbols, ['close'], start_date_d=20170101, start_date_q=20170101, end_date=20170331)
+    dic_market_daily = res[0]
+    assert sorted(dic_market_daily.keys()) == symbols
+    for sec, df in dic_market_daily.items():
+        # adjusted prices belong to the same (symbol, trade_date)
+        assert np.allclose(df['close_adj'].values, df['close'].values * 10)
+        assert np.allclose(df['open_adj'].values, df['open'].values * 10)
+    
+    # one failed chunk fails the query
+    dv.data_api = _StubDailyApi(failed_symbol=symbols[2])
+    with pytest.raises(ValueError):
+        dv._query_data(symbols, ['close'], start_date_d=20170101, start_date_q=20170101, end_date=20170331)
+
+
 if __name__ == "__main__":
     g = globals()
     g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
@@ -183,4 +520,7 @@ if __name__ == "__main__":
     for test_name, test_func in g.viewitems():
         print "\nTesting {:s}...".format(test_name)
         test_func()
+    
+    print "\nBenchmark of get_snapshot_array..."
+    benchmark_get_snapshot_array()
     print "Test Complete."
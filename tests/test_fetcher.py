@@ -0,0 +1,66 @@
+# encoding: utf-8
+import pandas as pd
+
+from quantos.data.fetcher import ChunkedFetcher
+
+
+def _query(symbol, start_date, end_date, fields=""):
+    dates = pd.bdate_range(str(start_date), str(end_date))
+    rows = [{'symbol': sec, 'trade_date': int(d.strftime('%Y%m%d')), fields: 1.0}
+            for sec in symbol.split(',') for d in dates]
+    return pd.DataFrame(rows), '0,'
+
+
+def test_plan():
+    fetcher = ChunkedFetcher(symbol_chunk_size=2, n_days_chunk=31)
+    chunks = fetcher.plan('000001.SZ,000002.SZ,600000.SH', 20170101, 20170315)
+    assert len(chunks) == 2 * 3
+    assert chunks[0] == ('000001.SZ,000002.SZ', 20170101, 20170131)
+    assert chunks[2] == ('000001.SZ,000002.SZ', 20170304, 20170315)
+    assert chunks[-1][0] == '600000.SH'
+    
+    chunks = fetcher.plan('000001.SZ,000002.SZ,600000.SH', 20170101, 20170315, split_dates=False)
+    assert len(chunks) == 2
+
+
+def test_fetch_many():
+    symbol = ','.join(['{:06d}.SZ'.format(i) for i in range(25)])
+    n_calls = {'flaky': 0}
+    
+    def flaky_query(symbol, start_date, end_date, fields=""):
+        n_calls['flaky'] += 1
+        if n_calls['flaky'] == 1:
+            raise IOError("timeout")
+        return _query(symbol, start_date, end_date, fields)
+    
+    fetcher = ChunkedFetcher(symbol_chunk_size=10, n_days_chunk=60, max_workers=3, retry_wait=0.0)
+    res = fetcher.fetch_many({'a': (_query, symbol, 20170101, 20170601, {'fields': 'close'}),
+                              'b': (flaky_query, symbol, 20170101, 20170601, {'fields': 'open'}, False)})
+    df_expected, _ = _query(symbol, 20170101, 20170601, 'close')
+    
+    df_a, msg_a = res['a']
+    assert msg_a == '0,'
+    assert len(df_a) == len(df_expected)
+    df_a = df_a.sort_values(['symbol', 'trade_date']).reset_index(drop=True)
+    df_expected = df_expected.sort_values(['symbol', 'trade_date']).reset_index(drop=True)
+    assert df_a.equals(df_expected.loc[:, df_a.columns])
+    
+    df_b, msg_b = res['b']
+    assert msg_b == '0,'
+    assert len(df_b) == len(df_expected)
+    assert n_calls['flaky'] == 3 + 1
+    
+    fetcher.n_retry = 0
+    df_c, msg_c = fetcher.fetch(lambda symbol, start_date, end_date: (None, '-1,error'), symbol, 20170101, 20170601)
+    assert msg_c == '-1,error'
+    assert df_c is None
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+    
+    for test_name, test_func in g.viewitems():
+        print "\nTesting {:s}...".format(test_name)
+        test_func()
+    print "Test Complete."
@@ -0,0 +1,167 @@
+# encoding: utf-8
+
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from quantos.backtest import common
+from quantos.backtest.ledger import DailyLedger
+from quantos.backtest.gateway import StockSimulatorDaily, VectorizedStockSimulatorDaily, OrderBook
+from quantos.data.basic.marketdata import Bar
+from quantos.data.basic.order import Order, FixedPriceTypeOrder, VwapOrder
+from quantos.data.basic.trade import TradeBatch
+
+
+def _make_orders(symbols, date):
+    np.random.seed(0)
+    orders = []
+    for i in range(20):
+        cls = [Order, FixedPriceTypeOrder, VwapOrder][i % 3]
+        action = common.ORDER_ACTION.BUY if i % 2 else common.ORDER_ACTION.SELL
+        order = cls.new_order(symbols[i % len(symbols)], action, 0.0, 100 * (i + 1), date, 0)
+        if cls is FixedPriceTypeOrder:
+            order.price_target = ['open', 'high', 'low', 'vwap'][i % 4]
+        order.task_id = str(i)
+        order.entrust_no = str(1000 + i)
+        orders.append(order)
+    return orders
+
+
+def test_vectorized_match():
+    date = 20170605
+    symbols = ['000001.SZ', '000002.SZ', '600000.SH', '600030.SH']
+    fields = ['close', 'vwap', 'open', 'high', 'low']
+    prices = np.random.rand(len(symbols), len(fields)) + 10
+    price_dic = {sec: pd.DataFrame([prices[i]], columns=fields) for i, sec in enumerate(symbols)}
+    
+    sim = StockSimulatorDaily()
+    sim_vec = VectorizedStockSimulatorDaily(symbols, price_fields=fields)
+    for sim_ in (sim, sim_vec):
+        sim_.on_new_day(date)
+        for order in _make_orders(symbols, date):
+            assert sim_.add_order(order) == ""
+        ind, err_msg = sim_.cancel_order('1003')
+        assert ind.order_status == common.ORDER_STATUS.CANCELLED and not err_msg
+    assert sim_vec.cancel_order('1003')[1]
+    assert sim_vec.add_order(Order.new_order('300001.SZ', 'buy', 0.0, 100, date, 0))
+    
+    trades = sorted(sim.match(price_dic, date), key=lambda t: t.entrust_no)
+    batch = sim_vec.match_arrays(prices, date)
+    assert isinstance(batch, TradeBatch) and len(batch) == len(trades) == 19
+    assert sim_vec.match_finished and len(sim_vec.match_arrays(prices, date)) == 0
+    
+    for t, t_vec in zip(trades, batch):
+        for attr in TradeBatch.COLUMNS:
+            if attr != 'fill_no':
+                assert getattr(t, attr) == getattr(t_vec, attr)
+    assert len(set(batch.fill_no)) == len(batch)
+    
+    # dict interface returns Trade objects
+    order = _make_orders(symbols, date)[0]
+    sim_vec.add_order(order)
+    res = sim_vec.match(price_dic, date)
+    assert len(res) == 1 and res[0].fill_price == price_dic[order.symbol].loc[:, 'close'].values[0]
+
+
+def _is_triggered(order, bar):
+    # market orders are not kept in the book sides and never filled by bars
+    if order.order_type == common.ORDER_TYPE.MARKET:
+        return False
+    if order.order_type == common.ORDER_TYPE.LIMIT:
+        if order.entrust_action == common.ORDER_ACTION.BUY:
+            return order.entrust_price >= bar.low
+        return order.entrust_price <= bar.high
+    else:
+        if order.entrust_action == common.ORDER_ACTION.BUY:
+            return order.entrust_price <= bar.high
+        return order.entrust_price >= bar.low
+
+
+def test_order_book():
+    np.random.seed(1)
+    symbols = ['rb1710', 'cu1709', 'ag1712']
+    book = OrderBook()
+    for i in range(200):
+        order = Order.new_order(symbols[(i // 3) % 3], [common.ORDER_ACTION.BUY, common.ORDER_ACTION.SELL][i % 2],
+                                np.round(100 + np.random.randn() * 5, 1), 1, 20170605, 90000)
+        order.order_type = [common.ORDER_TYPE.LIMIT, common.ORDER_TYPE.STOP, common.ORDER_TYPE.MARKET][i % 3]
+        book.add_order(order)
+    assert len(book.active) == 200
+    
+    ind = book.cancel_order(5)
+    assert ind.order_status == common.ORDER_STATUS.CANCELLED and book.cancel_order(5) is None
+    
+    for t in range(50):
+        bar = Bar()
+        bar.symbol = symbols[t % 3]
+        bar.low = 100 + np.random.randn() * 3
+        bar.high = bar.low + np.random.rand() * 3
+        bar.time = 90000 + t * 100
+        
+        expected = [o.entrust_no for o in book.orders
+                    if o.symbol == bar.symbol and not o.is_finished and _is_triggered(o, bar)]
+        result = book.make_trade_bar(bar)
+        assert [trade.entrust_no for trade, _ in result] == expected
+        for trade, ind in result:
+            assert trade.fill_time == bar.time and ind.order_status == common.ORDER_STATUS.FILLED
+            assert trade.entrust_no not in book.active
+    
+    n_active = len(book.active)
+    assert len(book.archive) == 200 - n_active
+    market_orders = [o for o in book.orders if o.order_type == common.ORDER_TYPE.MARKET]
+    assert market_orders and all(o.order_status != common.ORDER_STATUS.FILLED for o in market_orders)
+    assert len(book.cancel_all()) == n_active and not book.active
+
+
+def test_daily_ledger():
+    ledger = DailyLedger([20170103, 20170104, 20170105, 20170106, 20170109], ['000001.SZ', '600000.SH'],
+                         init_balance=1e4)
+    ledger.on_trade('000001.SZ', 3, 10.0, 20170104)
+    ledger.on_trade('000001.SZ', 1, 14.0, 20170104)
+    # close the long position and open a short one
+    ledger.on_trade('000001.SZ', -6, 12.0, 20170106)
+    ledger.on_trade('600000.SH', -1, 5.0, 20170106)
+    ledger.finish()
+    
+    assert np.array_equal(ledger.position, [[0, 0], [4, 0], [4, 0], [-2, -1], [-2, -1]])
+    assert np.allclose(ledger.cost_price, [[0, 0], [11, 0], [11, 0], [12, 5], [12, 5]])
+    assert np.allclose(ledger.realized_pnl[:, 0], [0, 0, 0, 400, 400])
+    assert np.allclose(ledger.cash, [1e4, 5600, 5600, 13300, 13300])
+    
+    close = np.array([[10., 5.], [12., 5.], [9., 6.], [13., np.nan], [11., 4.]])
+    value = ledger.get_total_value(close)
+    assert np.allclose(value, [1e4, 10400, 9200, 10700, 10700])
+    pnl = ledger.realized_pnl.sum(axis=1) + ledger.get_unrealized_pnl(close).sum(axis=1)
+    assert np.allclose(value[[0, 1, 2, 4]], ledger.init_balance + pnl[[0, 1, 2, 4]])
+    
+    # a backdated trade goes to its own row and updates later rows
+    ledger.on_trade('600000.SH', 1, 0.0, 20170105)
+    assert np.array_equal(ledger.position[:, 1], [0, 0, 1, 0, 0])
+    assert np.allclose(ledger.cost_price[:, 1], [0, 0, 0, 0, 0])
+    assert np.allclose(ledger.realized_pnl[:, 1], [0, 0, 0, 500, 500])
+    assert np.allclose(ledger.cash, [1e4, 5600, 5600, 13300, 13300])
+    ledger.on_trade('000001.SZ', 2, 11.0, 20170105)
+    assert np.array_equal(ledger.position[:, 0], [0, 4, 6, 0, 0])
+    assert np.allclose(ledger.cost_price[:, 0], [0, 11, 11, 0, 0])
+    assert np.allclose(ledger.realized_pnl[:, 0], [0, 0, 0, 600, 600])
+    assert np.allclose(ledger.cash, [1e4, 5600, 3400, 11100, 11100])
+    
+    folder = tempfile.mkdtemp()
+    try:
+        ledger.save(folder)
+        loaded = DailyLedger.load(folder)
+        assert loaded.symbols == ledger.symbols and loaded.init_balance == ledger.init_balance
+        for field in DailyLedger.FIELDS:
+            assert loaded.get_frame(field).equals(ledger.get_frame(field))
+        assert loaded.get_frame('cash').equals(ledger.get_frame('cash'))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    test_vectorized_match()
+    test_order_book()
+    test_daily_ledger()
+    print "Test Complete."
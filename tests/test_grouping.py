@@ -0,0 +1,92 @@
+# encoding: utf-8
+
+import numpy as np
+import pandas as pd
+
+from quantos.data import grouping
+from quantos.data.py_expression_eval import Parser
+
+
+def _make_data(n_dates=60, n_symbols=30, n_groups=4, seed=0):
+    np.random.seed(seed)
+    index = np.arange(20170101, 20170101 + n_dates)
+    columns = ['{:06d}.SZ'.format(i) for i in range(n_symbols)]
+
+    values = np.round(np.random.rand(n_dates, n_symbols), 1)  # make ties
+    values[np.random.rand(n_dates, n_symbols) < 0.1] = np.nan
+    df_value = pd.DataFrame(index=index, columns=columns, data=values)
+
+    # industry of each symbol changes over time
+    groups = np.random.randint(0, n_groups, n_symbols)
+    groups = np.tile(groups, (n_dates, 1))
+    change = np.random.rand(n_dates, n_symbols) < 0.05
+    groups[change] = np.random.randint(0, n_groups, change.sum())
+    df_group = pd.DataFrame(index=index, columns=columns, data=groups.astype(str).astype(object))
+    df_group.iloc[3, 5] = np.nan
+    return df_value, df_group
+
+
+def _assert_frame_close(df1, df2):
+    df2 = df2.reindex(index=df1.index, columns=df1.columns)
+    assert np.allclose(df1.values, df2.values, equal_nan=True)
+
+
+def test_group_stats():
+    df_value, df_group = _make_data()
+    values, groups = df_value.values, df_group.values
+
+    for i in [0, 3, 17]:
+        row = df_value.iloc[i]
+        gp = row.groupby(df_group.iloc[i])
+        _assert_frame_close(pd.DataFrame(grouping.group_mean(values, groups)[[i]]),
+                            pd.DataFrame(gp.transform('mean').reindex(row.index).values).T)
+        _assert_frame_close(pd.DataFrame(grouping.group_std(values, groups)[[i]]),
+                            pd.DataFrame(gp.transform('std').reindex(row.index).values).T)
+        _assert_frame_close(pd.DataFrame(grouping.group_demean(values, groups)[[i]]),
+                            pd.DataFrame((row - gp.transform('mean')).reindex(row.index).values).T)
+
+    # static groups
+    res = grouping.group_rank(values, groups[0])
+    assert np.allclose(res, grouping.group_rank(values, np.tile(groups[0], (values.shape[0], 1))), equal_nan=True)
+
+
+def test_group_rank():
+    df_value, df_group = _make_data()
+
+    # reference: rank within each group value
+    expected = None
+    for val in pd.Series(df_group.values.ravel()).unique():
+        rank = df_value[df_group == val].rank(axis=1)
+        expected = rank if expected is None else expected.fillna(rank)
+
+    parser = Parser()
+    parser.parse('GroupRank(close, sw1)')
+    res = parser.evaluate({'close': df_value, 'sw1': df_group})
+    _assert_frame_close(res, expected)
+    assert np.isnan(res.iloc[3, 5])
+
+
+def test_group_apply_vectorized():
+    df_value, df_group = _make_data()
+    parser = Parser()
+    parser.df_group = df_group
+
+    # lambda functions are not vectorized, so they give results of the original loop
+    for func, func_loop in [(parser.standardize, lambda df: Parser.standardize(df)),
+                            (parser.rank, lambda df: df.rank(axis=1))]:
+        res = parser.group_apply(func, df_value)
+        expected = parser.group_apply(func_loop, df_value)
+        _assert_frame_close(res, expected)
+
+    # static groups
+    parser.df_group = df_group.iloc[0]
+    res = parser.group_apply(parser.standardize, df_value)
+    expected = parser.group_apply(lambda df: Parser.standardize(df), df_value)
+    _assert_frame_close(res, expected)
+
+
+if __name__ == "__main__":
+    test_group_stats()
+    test_group_rank()
+    test_group_apply_vectorized()
+    print "Test Complete."
@@ -0,0 +1,102 @@
+# encoding: utf-8
+
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from quantos.data import panel as panel_util
+from quantos.data.panel import Panel
+
+
+def _make_df(n_dates=30, symbols=None, seed=0):
+    np.random.seed(seed)
+    if symbols is None:
+        symbols = ['000001.SZ', '000002.SZ', '600000.SH']
+    dates = np.arange(20170101, 20170101 + n_dates)
+    col = pd.MultiIndex.from_product([symbols, ['close', 'open', 'status']], names=['symbol', 'field'])
+    df = pd.DataFrame(index=pd.Index(dates, name='trade_date'), columns=col, dtype=object)
+    for sec in symbols:
+        df[(sec, 'close')] = np.random.rand(n_dates)
+        df[(sec, 'open')] = np.random.rand(n_dates)
+        df[(sec, 'status')] = np.where(np.random.rand(n_dates) < 0.2, u'停牌'.encode('utf-8'),
+                                       u'交易'.encode('utf-8'))
+    df.iloc[3, 0] = np.nan
+    df.iloc[5, 2] = np.nan
+    return df.sort_index(axis=1)
+
+
+def test_panel_multi_index_df():
+    df = _make_df()
+    p = Panel.from_multi_index_df(df)
+    assert p.fields == ['close', 'open', 'status']
+    assert p.is_categorical('status') and not p.is_categorical('close')
+    codes, categories = p.get_codes('status')
+    assert codes.dtype == np.int8 and list(categories) == sorted(categories)
+    assert p.get_code('status', u'停牌'.encode('utf-8')) == list(categories).index(u'停牌'.encode('utf-8'))
+    assert p.get_code('status', 'unknown') == -2
+    assert (codes[5, 0] == -1) and pd.isnull(p.get_values('status')[5, 0])
+
+    res = p.to_multi_index_df()
+    assert res.columns.equals(df.columns)
+    assert res.equals(df.astype({c: float for c in df.columns if c[1] != 'status'}))
+
+    # date range and field of all symbols are views of the arrays
+    frame = p.get_frame('close', start_date=20170105, end_date=20170110)
+    assert frame.shape == (6, 3) and frame.index[0] == 20170105
+    assert np.shares_memory(frame.values, p.get_values('close'))
+    frame = p.get_frame('open', symbols=['600000.SH', '000001.SZ', 'unknown'])
+    assert list(frame.columns) == ['000001.SZ', '600000.SH']
+    assert np.array_equal(frame.values, df.xs('open', axis=1, level='field')[['000001.SZ', '600000.SH']].values)
+
+    # one row
+    row = p.get_values('status', rows=7, cols=[2, 0])
+    assert list(row) == [df.loc[20170108, ('600000.SH', 'status')], df.loc[20170108, ('000001.SZ', 'status')]]
+
+
+def test_panel_align():
+    p1 = Panel.from_multi_index_df(_make_df(n_dates=20))
+    p2 = Panel.from_multi_index_df(_make_df(n_dates=30, symbols=['000002.SZ', '300001.SZ'], seed=1))
+
+    p = p1.reindex(dates=p2.dates, symbols=['000002.SZ', '300001.SZ'])
+    assert p.shape == (30, 2)
+    assert np.isnan(p.get_values('close')[25:]).all() and np.isnan(p.get_values('close')[:, 1]).all()
+    assert pd.isnull(p.get_values('status')[25:]).all()
+    assert np.array_equal(p.get_values('open')[:20, 0], p1.get_values('open')[:, 1])
+
+    # the first panel wins
+    merged = panel_util.merge([p1, None, p2])
+    assert merged.shape == (30, 4)
+    assert np.array_equal(merged.get_values('close')[:20, 1], p1.get_values('close')[:, 1])
+
+    later = p2.date_slice(start_date=p1.dates[-1] + 1)
+    concat = panel_util.concat_dates(p1, later)
+    assert concat.shape == (30, 3) and np.array_equal(concat.dates, p2.dates)
+    assert np.array_equal(concat.get_values('status')[20:, 1], p2.get_values('status')[20:, 0])
+
+    combined = panel_util.combine_first(later, p1)
+    assert combined.shape == (30, 3)
+    assert np.array_equal(combined.get_values('open')[:20], p1.get_values('open'))
+
+    values = np.array([[1.0, np.nan], [np.nan, np.nan], [3.0, 2.0]])
+    assert np.allclose(panel_util.ffill(values), [[1.0, np.nan], [1.0, np.nan], [3.0, 2.0]], equal_nan=True)
+
+
+def test_panel_save_load():
+    p = Panel.from_multi_index_df(_make_df())
+    folder = tempfile.mkdtemp()
+    try:
+        p.save(folder)
+        p_loaded = Panel.load(folder)
+        assert isinstance(p_loaded.get_values('close'), np.memmap)
+        assert p_loaded.to_multi_index_df().equals(p.to_multi_index_df())
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    test_panel_multi_index_df()
+    test_panel_align()
+    test_panel_save_load()
+    print "Test Complete."
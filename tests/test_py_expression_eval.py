@@ -110,6 +110,39 @@ def test_calc_return():
     assert abs(res.loc[20170808, '000001.SH'] - 0.006067) < 1e-6
 
 
+def test_common_subexpression():
+    import numpy as np
+    np.random.seed(0)
+    
+    df = pd.DataFrame(np.random.rand(40, 5), columns=list('abcde'))
+    
+    parser = Parser()
+    n_calls = {'Delta': 0}
+    
+    def delta(x, n):
+        n_calls['Delta'] += 1
+        return x.diff(n)
+    parser.functions['Delta'] = delta
+    
+    parser.parse('Rank(Delta(close,5)) / Rank(Delta(close,5) + StdDev(close,20))')
+    res = parser.evaluate({'close': df})
+    assert n_calls['Delta'] == 1
+    
+    diff = df.diff(5)
+    expected = diff.rank(axis=1) / (diff + df.rolling(20).std()).rank(axis=1)
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+    
+    # share results across formulas
+    cache = dict()
+    parser.parse('Delta(close, 5) * 2')
+    res1 = parser.evaluate({'close': df}, cache=cache)
+    parser.parse('Rank(Delta(close, 5))')
+    res2 = parser.evaluate({'close': df}, cache=cache)
+    assert n_calls['Delta'] == 2
+    assert np.allclose(res1.values, diff.values * 2, equal_nan=True)
+    assert np.allclose(res2.values, diff.rank(axis=1).values, equal_nan=True)
+
+
 @pytest.fixture(autouse=True)
 def my_globals(request):
     ds = RemoteDataService()
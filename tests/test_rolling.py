@@ -0,0 +1,112 @@
+# encoding: utf-8
+
+import numpy as np
+import pandas as pd
+
+from quantos.data import rolling
+from quantos.data.py_expression_eval import Parser
+
+
+def _make_data(n_dates=200, n_symbols=8, seed=0):
+    np.random.seed(seed)
+    values = np.random.randn(n_dates, n_symbols) * 10 + 100
+    values[:, 1] -= 100  # negative values
+    values[np.random.rand(n_dates, n_symbols) < 0.03] = np.nan
+    values[50:60, 2] = 0.0
+    values[:, 3] = 7.0  # constant
+    values[:, 4] = np.nan
+    return pd.DataFrame(values, columns=list('abcdefgh'))
+
+
+def _assert_close(res, expected, rtol=1e-7):
+    res = np.asarray(res)
+    expected = np.asarray(expected)
+    assert np.array_equal(np.isnan(res), np.isnan(expected))
+    mask = ~np.isnan(expected)
+    assert np.allclose(res[mask], expected[mask], rtol=rtol, atol=1e-8)
+
+
+def test_rolling_moments():
+    df = _make_data()
+    for n in [1, 2, 5, 20, 300]:
+        r = df.rolling(n)
+        _assert_close(rolling.rolling_sum(df.values, n), r.sum())
+        _assert_close(rolling.rolling_mean(df.values, n), r.mean())
+        _assert_close(rolling.rolling_min(df.values, n), r.min())
+        _assert_close(rolling.rolling_max(df.values, n), r.max())
+        _assert_close(rolling.rolling_count(df.values, n), df.rolling(n, min_periods=0).count())
+        # pandas loses precision for nearly equal values, so compare with direct calculation
+        _assert_close(rolling.rolling_std(df.values, n), r.apply(lambda x: np.std(x, ddof=1)))
+        _assert_close(rolling.rolling_product(df.values, n), r.apply(np.product))
+
+    # skewness and kurtosis of constant window are not well defined
+    df = df.drop('d', axis=1)
+    
+    def skew(x):
+        n = len(x)
+        dev = x - x.mean()
+        return np.sqrt(n * (n - 1.)) * (dev ** 3).mean() / ((n - 2) * (dev ** 2).mean() ** 1.5)
+    
+    def kurt(x):
+        n = len(x)
+        dev = x - x.mean()
+        b = (dev ** 2).mean()
+        return ((n * n - 1.) * (dev ** 4).mean() / (b * b) - 3 * (n - 1.) ** 2) / ((n - 2.) * (n - 3.))
+    
+    for n in [3, 4, 5, 20]:
+        r = df.rolling(n)
+        _assert_close(rolling.rolling_skew(df.values, n), r.apply(skew))
+        if n >= 4:
+            _assert_close(rolling.rolling_kurt(df.values, n), r.apply(kurt))
+
+    # min_periods
+    _assert_close(rolling.rolling_mean(df.values, 10, min_periods=3), df.rolling(10, min_periods=3).mean())
+    _assert_close(rolling.rolling_max(df.values, 10, min_periods=3), df.rolling(10, min_periods=3).max())
+
+    # 1-D
+    _assert_close(rolling.rolling_mean(df['a'].values, 5), df['a'].rolling(5).mean())
+
+
+def test_rolling_decay():
+    df = _make_data()
+
+    def decay_linear_array(x):
+        step = np.arange(1, len(x) + 1)
+        return np.dot(x, step) / np.sum(step)
+
+    def decay_exp_array(x, f):
+        fs = np.power(f, np.arange(len(x))[::-1])
+        return np.dot(x, fs) / np.sum(fs)
+
+    for n in [1, 3, 10]:
+        _assert_close(rolling.rolling_decay_linear(df.values, n), df.rolling(n).apply(decay_linear_array))
+        _assert_close(rolling.rolling_decay_exp(df.values, 0.5, n), df.rolling(n).apply(decay_exp_array, args=(0.5,)))
+    # rows are solved in several blocks when f is far from 1
+    for f in [0.01, 0.9, 1.0]:
+        _assert_close(rolling.rolling_decay_exp(df.values, f, 10), df.rolling(10).apply(decay_exp_array, args=(f,)))
+
+
+def test_rolling_product():
+    # zeros and negative values are exact
+    x = np.array([2., -3., 0., 4., -1., -5., 2.])
+    assert list(rolling.rolling_product(x, 3)[2:]) == [0., 0., 0., 20., 10.]
+    assert list(rolling.rolling_product(x, 2)[1:]) == [-6., 0., 0., -4., 5., -10.]
+
+
+def test_parser_rolling():
+    df = _make_data()
+    parser = Parser()
+
+    parser.parse('Ts_Max(close, 5) - Ts_Min(close, 5) + CountNans(close, 10)')
+    res = parser.evaluate({'close': df})
+    expected = df.rolling(5).max() - df.rolling(5).min() + (10 - df.rolling(10, min_periods=0).count())
+    _assert_close(res, expected)
+    assert list(res.columns) == list(df.columns)
+
+
+if __name__ == "__main__":
+    test_rolling_moments()
+    test_rolling_decay()
+    test_rolling_product()
+    test_parser_rolling()
+    print "Test Complete."
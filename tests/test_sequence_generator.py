@@ -12,6 +12,9 @@ def test_seq_gen():
     sg.get_next(text)
     for i in range(3, 999):
         assert sg.get_next(text) == i
+    
+    assert list(sg.get_next_n(text, 3)) == [999, 1000, 1001]
+    assert sg.get_next(text) == 1002
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+# encoding: utf-8
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantos.backtest.pubsub import Publisher, EventTemp
+from quantos.data.basic.marketdata import Bar
+from quantos.data.py_expression_eval import Parser
+
+
+def _make_data(n_dates=80, n_symbols=6, seed=0):
+    np.random.seed(seed)
+    index = np.arange(20170101, 20170101 + n_dates)
+    columns = ['{:06d}.SZ'.format(i) for i in range(n_symbols)]
+    close = pd.DataFrame(np.random.rand(n_dates, n_symbols) + 1, index=index, columns=columns)
+    open_ = pd.DataFrame(np.random.rand(n_dates, n_symbols) + 1, index=index, columns=columns)
+    close.iloc[65, 2] = np.nan
+    return close, open_
+
+
+def _evaluate(formula, values):
+    parser = Parser()
+    parser.parse(formula)
+    return parser.evaluate(values)
+
+
+def test_streaming_update():
+    close, open_ = _make_data()
+    formula = ('Rank(Delta(close, 5)) + Ts_Mean(close, 10) / Ewma(close, 3) - Corr(close, open, 6)'
+               ' + Delay(open, 2) + Decay_exp(close, 0.5, 4) + Sma(open, 5, 2) + Ts_Skewness(close - open, 7)'
+               ' + Return(close, 2, 0) + If(close > open, 1, -1) + Step(close, 3)')
+    n_history = 60
+
+    parser = Parser()
+    parser.parse(formula)
+    stream = parser.evaluate_streaming({'close': close.iloc[:n_history], 'open': open_.iloc[:n_history]})
+
+    for i in range(n_history, len(close)):
+        date = close.index[i]
+        # revise value of the latest date before the final one
+        stream.update({'close': close.iloc[i] * 1.1, 'open': open_.iloc[i]}, date)
+        res = stream.update({'close': close.iloc[i], 'open': open_.iloc[i]}, date)
+
+        expected = _evaluate(formula, {'close': close.iloc[:i + 1], 'open': open_.iloc[:i + 1]}).iloc[-1]
+        assert np.allclose(res.values, expected.values, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        stream.update({'close': close.iloc[0], 'open': open_.iloc[0]}, close.index[0])
+
+
+def test_streaming_subscriber():
+    close, open_ = _make_data()
+    formula = 'Ts_Mean(close, 5) - open'
+    n_history = 70
+
+    parser = Parser()
+    parser.parse(formula)
+    results = []
+    stream = parser.evaluate_streaming({'close': close.iloc[:n_history], 'open': open_.iloc[:n_history]},
+                                       callback=lambda date, ser: results.append((date, ser)))
+    pub = Publisher()
+    stream.subscribe(pub, 'quote')
+
+    for i in range(n_history, len(close)):
+        for symbol in close.columns:
+            pub.publish(EventTemp(topic='quote', data={'symbol': symbol, 'date': close.index[i],
+                                                        'close': close.iloc[i][symbol],
+                                                        'open': open_.iloc[i][symbol]}))
+
+    assert len(results) == (len(close) - n_history) * len(close.columns)
+    date, res = results[-1]
+    assert date == close.index[-1]
+    expected = _evaluate(formula, {'close': close, 'open': open_}).iloc[-1]
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+
+
+def test_streaming_subscriber_bar():
+    close, open_ = _make_data()
+    formula = 'Ts_Mean(close, 5) - open'
+    n_history = 70
+
+    parser = Parser()
+    parser.parse(formula)
+    results = []
+    stream = parser.evaluate_streaming({'close': close.iloc[:n_history], 'open': open_.iloc[:n_history]},
+                                       callback=lambda date, ser: results.append((date, ser)))
+    pub = Publisher()
+    stream.subscribe(pub, 'quote')
+
+    # rows from Bar.iter_array store fields in __slots__
+    df_bar = pd.concat([close.iloc[n_history:].stack(dropna=False).rename('close'),
+                        open_.iloc[n_history:].stack(dropna=False).rename('open')], axis=1)
+    df_bar.index.names = ['trade_date', 'symbol']
+    df_bar = df_bar.reset_index()
+    for bar in Bar.iter_array(Bar.create_array_from_df(df_bar)):
+        pub.publish(EventTemp(topic='quote', data=bar))
+
+    assert len(results) == len(df_bar)
+    date, res = results[-1]
+    assert date == close.index[-1]
+    expected = _evaluate(formula, {'close': close, 'open': open_}).iloc[-1]
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+
+
+if __name__ == "__main__":
+    test_streaming_update()
+    test_streaming_subscriber()
+    test_streaming_subscriber_bar()
+    print "Test Complete."